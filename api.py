@@ -0,0 +1,171 @@
+"""
+API HTTP headless para integración con el LIS (sin sesión de navegador).
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+
+    POST /reports?pdf=true          sube un PDF (multipart, campo "file") -> 202 {job_id}
+         &pdf_mode=fast             PDF con ReportLab (ms) en vez de WeasyPrint
+    GET  /reports/{id}              estado del trabajo (+ métricas cuando termina)
+    GET  /reports/{id}/events       estado en streaming (Server-Sent Events)
+    GET  /reports/{id}/metrics      métricas JSON
+    GET  /reports/{id}/html         reporte HTML
+    GET  /reports/{id}/pdf          reporte PDF (si se pidió pdf=true)
+    GET  /bundles?since=&until=     reportes del historial (INTERLAB_DB) en un ZIP (PDFs +
+         &format=zip|pdf            metrics.jsonl) o un PDF unido, enviado por partes
+    GET  /health                    estado de la cola
+
+Límites por variables de entorno: INTERLAB_API_WORKERS, INTERLAB_API_MAX_QUEUED,
+INTERLAB_API_MAX_UPLOAD_MB, INTERLAB_API_KEEP_MB (resultados terminados en memoria; los
+más viejos expiran). Con la cola llena responde 429 (reintentar más tarde).
+"""
+import asyncio
+import json
+import os
+from datetime import date
+from typing import Optional
+
+from fastapi import FastAPI, File, HTTPException, Query, UploadFile
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+
+from engine.bundle import BUNDLE_FORMATS, items_from_store, iter_bundle
+from engine.jobs import Job, JobQueue, QueueFull
+from engine.pdf_export import PDF_MODE, PDF_MODES
+from engine.report_html import APP_NAME
+
+WORKERS = int(os.environ.get("INTERLAB_API_WORKERS", "0")) or None
+MAX_QUEUED = int(os.environ.get("INTERLAB_API_MAX_QUEUED", "32"))
+MAX_UPLOAD_MB = float(os.environ.get("INTERLAB_API_MAX_UPLOAD_MB", "20"))
+KEEP_MB = float(os.environ.get("INTERLAB_API_KEEP_MB", "256"))
+RESULT_DB = os.environ.get("INTERLAB_DB")  # historial SQLite para /bundles
+
+app = FastAPI(title=f"{APP_NAME} API")
+jobs: Optional[JobQueue] = None
+store = None
+
+
+@app.on_event("startup")
+def _startup() -> None:
+    global jobs, store
+    jobs = JobQueue(workers=WORKERS, max_queued=MAX_QUEUED, keep_bytes=int(KEEP_MB * 1024 * 1024))
+    if RESULT_DB:
+        from engine.store import ResultStore
+        store = ResultStore(RESULT_DB)
+
+
+@app.on_event("shutdown")
+def _shutdown() -> None:
+    if jobs is not None:
+        jobs.shutdown()
+
+
+def _job_or_404(job_id: str) -> Job:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "trabajo no encontrado (o ya expirado)")
+    return job
+
+
+def _result_or_409(job_id: str) -> dict:
+    job = _job_or_404(job_id)
+    if job.status == "error":
+        raise HTTPException(422, job.error)
+    if job.status != "done":
+        raise HTTPException(409, f"trabajo en estado '{job.status}'")
+    return job.result
+
+
+@app.get("/health")
+def health() -> dict:
+    return {"ok": True, **jobs.stats()}
+
+
+@app.post("/reports", status_code=202)
+async def submit_report(
+    file: UploadFile = File(...),
+    pdf: bool = Query(False, description="generar también el PDF"),
+    pdf_mode: str = Query(PDF_MODE, pattern=f"^({'|'.join(PDF_MODES)})$", description="html (WeasyPrint) o fast (ReportLab)"),
+    wait: float = Query(0, ge=0, le=120, description="segundos a esperar el resultado antes de responder"),
+):
+    max_bytes = int(MAX_UPLOAD_MB * 1024 * 1024)
+    data = await file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise HTTPException(413, f"PDF mayor a {MAX_UPLOAD_MB:g} MB")
+    if not data.startswith(b"%PDF"):
+        raise HTTPException(415, "el archivo no es un PDF")
+
+    try:
+        job = jobs.submit(data, want_pdf=pdf, pdf_mode=pdf_mode)
+    except QueueFull:
+        raise HTTPException(429, "cola llena, reintentar más tarde", headers={"Retry-After": "5"})
+
+    if wait:
+        await asyncio.to_thread(job.done.wait, wait)
+    return JSONResponse(status(job.id), status_code=200 if job.done.is_set() else 202)
+
+
+@app.get("/reports/{job_id}")
+def status(job_id: str) -> dict:
+    job = _job_or_404(job_id)
+    info = job.info()
+    if job.status == "done":
+        info["metrics"] = job.result["metrics"]
+        info["perf"] = job.result["perf"]
+    return info
+
+
+@app.get("/reports/{job_id}/events")
+async def events(job_id: str):
+    job = _job_or_404(job_id)
+
+    async def gen():
+        last = None
+        while True:
+            if job.status != last:
+                last = job.status
+                yield f"event: status\ndata: {json.dumps(job.info())}\n\n"
+            if job.done.is_set():
+                return
+            await asyncio.to_thread(job.done.wait, 1.0)
+
+    return StreamingResponse(gen(), media_type="text/event-stream")
+
+
+@app.get("/reports/{job_id}/metrics")
+def metrics(job_id: str) -> dict:
+    return _result_or_409(job_id)["metrics"]
+
+
+@app.get("/reports/{job_id}/html", response_class=HTMLResponse)
+def html(job_id: str) -> str:
+    return _result_or_409(job_id)["html"]
+
+
+@app.get("/reports/{job_id}/pdf")
+def pdf(job_id: str) -> Response:
+    result = _result_or_409(job_id)
+    if result["pdf"] is None:
+        raise HTTPException(404, "este trabajo no pidió PDF (usar pdf=true al subir)")
+    return Response(
+        result["pdf"],
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="reporte_{job_id}.pdf"'},
+    )
+
+
+@app.get("/bundles")
+def bundle(
+    since: Optional[date] = Query(None, description="fecha de toma desde (YYYY-MM-DD)"),
+    until: Optional[date] = Query(None, description="fecha de toma hasta, inclusive"),
+    format: str = Query("zip", pattern=f"^({'|'.join(BUNDLE_FORMATS)})$", description="zip (PDFs + metrics.jsonl) o pdf (unido)"),
+    pdf_mode: str = Query(PDF_MODE, pattern=f"^({'|'.join(PDF_MODES)})$"),
+) -> StreamingResponse:
+    if store is None:
+        raise HTTPException(404, "sin historial configurado (INTERLAB_DB)")
+    # se genera a medida que se envía: la memoria no depende de cuántos reportes entren
+    chunks = iter_bundle(items_from_store(store, since, until), format, pdf_mode)
+    name = f"reportes_{since or 'inicio'}_{until or 'hoy'}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type="application/zip" if format == "zip" else "application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
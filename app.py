@@ -1,21 +1,39 @@
+import os
+import uuid
+from functools import partial
+from typing import TYPE_CHECKING, List, Optional
+
 import streamlit as st
-import tempfile
-from datetime import datetime
 
 # --- IMPORTS DE TU ENGINE (carpeta /engine) ---
-from engine.parse_pdf import read_pdf_text, extract_analytes_from_text
-from engine.scores import build_metrics  # Ajusta si tu función se llama distinto
-
-# --- PDF export (sin IA) ---
-from weasyprint import HTML  # genera PDF desde HTML
+# Solo lo liviano va arriba: Streamlit vuelve a ejecutar este script en cada interacción.
+# pdfplumber se carga con el primer PDF, WeasyPrint en el hilo de render del PDF,
+# openai solo si USE_LLM y el lote solo al procesar un ZIP.
+from engine.cache import ParseCache, RenderCache
+from engine.incremental import IncrementalReport
+from engine.report_html import APP_NAME, REPORT_TITLE
+from engine.perf import Trace, latency_summary
+from engine.population import current_population
+from engine.rules import current_rules
+from engine.sessions import SessionReports, UploadError, UploadHandle, UploadManager
+from engine.store import ResultStore
+
+if TYPE_CHECKING:
+    from engine.report_llm import AsyncReportGenerator
 
 
 # =========================
 # CONFIG
 # =========================
-APP_NAME = "Interlab IA"
-REPORT_TITLE = "Reporte clínico"
 USE_LLM = False  # <- IMPORTANTE: deja en False hasta que tengas API estable
+PARSE_CACHE_ENTRIES = 64
+PARSE_CACHE_DIR = os.environ.get("INTERLAB_CACHE_DIR")  # opcional: cache en disco
+PDF_CACHE_ENTRIES = 32
+# "html": WeasyPrint, igual a la vista previa. "fast": ReportLab directo, milisegundos (engine.pdf_export)
+PDF_MODES = {"html": "Completo (HTML)", "fast": "Rápido"}
+PDF_MODE = os.environ.get("INTERLAB_PDF_MODE", "html")
+RESULT_DB = os.environ.get("INTERLAB_DB")  # opcional: historial SQLite de reportes
+BATCH_WORKERS = os.cpu_count() or 1
 
 st.set_page_config(page_title=f"{APP_NAME} – {REPORT_TITLE}", layout="wide")
 
@@ -23,288 +41,304 @@ st.title(f"🧠 {APP_NAME} – {REPORT_TITLE}")
 st.caption("Reporte automatizado basado en resultados de laboratorio. No reemplaza la valoración médica.")
 
 
-# =========================
-# HELPERS VISUALES
-# =========================
-def badge(color: str, text: str) -> str:
-    return f"""
-    <span style="
-        display:inline-block;
-        padding:2px 10px;
-        border-radius:999px;
-        font-size:12px;
-        font-weight:600;
-        color:white;
-        background:{color};
-        ">
-        {text}
-    </span>
-    """
+@st.cache_resource
+def get_parse_cache() -> ParseCache:
+    # compartido entre sesiones y reruns: el mismo PDF no se vuelve a parsear
+    return ParseCache(max_entries=PARSE_CACHE_ENTRIES, disk_dir=PARSE_CACHE_DIR)
 
-def semaforo(status: str) -> str:
-    """
-    status esperado: 'ok', 'borderline', 'high', 'low', 'unknown'
-    """
-    status = (status or "unknown").lower()
-    if status == "ok":
-        return badge("#16a34a", "Normal")
-    if status == "borderline":
-        return badge("#f59e0b", "Límite")
-    if status in ("high", "low"):
-        return badge("#dc2626", "Alterado")
-    return badge("#6b7280", "N/E")
 
+@st.cache_resource
+def get_uploads() -> UploadManager:
+    # subidas de todas las sesiones (límites, spool a disco, limpieza): ver engine.sessions
+    return UploadManager()
 
-def safe_get(d: dict, path: list, default=None):
-    cur = d
-    for k in path:
-        if not isinstance(cur, dict) or k not in cur:
-            return default
-        cur = cur[k]
-    return cur
 
+@st.cache_resource
+def get_session_reports() -> SessionReports:
+    # el reporte en edición de cada sesión, fuera de session_state y con tope
+    return SessionReports()
 
-# =========================
-# GENERADOR HTML DEL REPORTE
-# =========================
-def render_report_html(metrics: dict) -> str:
-    patient_age = safe_get(metrics, ["patient", "age"], "N/E")
-    patient_sex = safe_get(metrics, ["patient", "sex"], "N/E")
-    urgency = safe_get(metrics, ["urgency"], "N/E")
-
-    idx_global = safe_get(metrics, ["indices", "global_health"], "N/E")
-    idx_inflam = safe_get(metrics, ["indices", "inflammation"], "N/E")
-    metabolic_age = safe_get(metrics, ["indices", "metabolic_age"], "N/E")
-
-    # Analitos (si tu metrics los incluye)
-    # Esperado: metrics["analytes"] = [{"name": "...", "value":..., "unit":"...", "ref":"...", "flag":"ok/high/low/borderline/unknown"}]
-    analytes = safe_get(metrics, ["analytes"], []) or []
-
-    # Risk score por sistema (si lo tienes)
-    system_scores = safe_get(metrics, ["system_scores"], {}) or {}
-
-    def fmt(v):
-        return "N/E" if v is None else str(v)
-
-    # tabla analitos
-    analyte_rows = ""
-    for a in analytes:
-        name = a.get("name", "N/E")
-        value = a.get("value", None)
-        unit = a.get("unit", "")
-        ref = a.get("ref", "N/E")
-        flag = a.get("flag", "unknown")
-        analyte_rows += f"""
-        <tr>
-          <td style="padding:10px;border-bottom:1px solid #eee;">{name}</td>
-          <td style="padding:10px;border-bottom:1px solid #eee;">{fmt(value)} {unit}</td>
-          <td style="padding:10px;border-bottom:1px solid #eee;">{ref}</td>
-          <td style="padding:10px;border-bottom:1px solid #eee;">{semaforo(flag)}</td>
-        </tr>
-        """
-
-    # tabla systems
-    system_rows = ""
-    for k, v in system_scores.items():
-        system_rows += f"""
-        <tr>
-          <td style="padding:10px;border-bottom:1px solid #eee;">{k}</td>
-          <td style="padding:10px;border-bottom:1px solid #eee;">{v}</td>
-        </tr>
-        """
-
-    today = datetime.now().strftime("%Y-%m-%d %H:%M")
-
-    html = f"""
-    <html>
-    <head>
-      <meta charset="utf-8" />
-      <style>
-        body {{ font-family: Arial, sans-serif; color:#111827; }}
-        .header {{
-          background:#7a0f2b;
-          color:white;
-          padding:18px 22px;
-          border-radius:14px;
-          display:flex;
-          justify-content:space-between;
-          align-items:center;
-        }}
-        .card {{
-          background:#ffffff;
-          border:1px solid #eee;
-          border-radius:14px;
-          padding:16px 18px;
-          margin-top:14px;
-        }}
-        h2 {{ margin:0 0 10px 0; font-size:18px; }}
-        .grid {{
-          display:grid;
-          grid-template-columns: 1fr 1fr 1fr;
-          gap:12px;
-        }}
-        .kpi {{
-          border:1px solid #eee;
-          border-radius:14px;
-          padding:12px 14px;
-        }}
-        .kpi .label {{ font-size:12px; color:#6b7280; }}
-        .kpi .value {{ font-size:22px; font-weight:800; margin-top:6px; }}
-        table {{ width:100%; border-collapse:collapse; }}
-        .muted {{ color:#6b7280; font-size:12px; }}
-      </style>
-    </head>
-    <body>
-      <div class="header">
-        <div>
-          <div style="font-size:22px;font-weight:800;">🧠 {APP_NAME} – {REPORT_TITLE}</div>
-          <div style="opacity:0.9;font-size:12px;">Generado: {today}</div>
-        </div>
-        <div style="text-align:right;">
-          <div style="font-weight:700;">Reporte clínico</div>
-          <div style="font-size:12px;opacity:0.9;">Generado automáticamente</div>
-        </div>
-      </div>
-
-      <div class="card">
-        <h2>👤 Datos del paciente</h2>
-        <div class="grid">
-          <div class="kpi">
-            <div class="label">Edad</div>
-            <div class="value">{patient_age}</div>
-          </div>
-          <div class="kpi">
-            <div class="label">Sexo</div>
-            <div class="value">{patient_sex}</div>
-          </div>
-          <div class="kpi">
-            <div class="label">Urgencia</div>
-            <div class="value">{urgency}</div>
-          </div>
-        </div>
-        <div class="muted" style="margin-top:10px;">
-          Este informe no sustituye consulta médica. Correlacionar con síntomas e historia clínica.
-        </div>
-      </div>
-
-      <div class="card">
-        <h2>📌 Resumen ejecutivo</h2>
-        <div class="grid">
-          <div class="kpi">
-            <div class="label">Índice global</div>
-            <div class="value">{idx_global}</div>
-          </div>
-          <div class="kpi">
-            <div class="label">Inflamación</div>
-            <div class="value">{idx_inflam}</div>
-          </div>
-          <div class="kpi">
-            <div class="label">Edad metabólica</div>
-            <div class="value">{metabolic_age}</div>
-          </div>
-        </div>
-      </div>
-
-      <div class="card">
-        <h2>🧪 Resultados (con semáforo)</h2>
-        <table>
-          <thead>
-            <tr>
-              <th style="text-align:left;padding:10px;border-bottom:2px solid #111827;">Analito</th>
-              <th style="text-align:left;padding:10px;border-bottom:2px solid #111827;">Resultado</th>
-              <th style="text-align:left;padding:10px;border-bottom:2px solid #111827;">Referencia</th>
-              <th style="text-align:left;padding:10px;border-bottom:2px solid #111827;">Estado</th>
-            </tr>
-          </thead>
-          <tbody>
-            {analyte_rows if analyte_rows else "<tr><td colspan='4' style='padding:10px;'>No se detectaron analitos estructurados (revisar parser).</td></tr>"}
-          </tbody>
-        </table>
-      </div>
-
-      <div class="card">
-        <h2>🧩 Risk score por sistema</h2>
-        <table>
-          <thead>
-            <tr>
-              <th style="text-align:left;padding:10px;border-bottom:2px solid #111827;">Sistema</th>
-              <th style="text-align:left;padding:10px;border-bottom:2px solid #111827;">Score</th>
-            </tr>
-          </thead>
-          <tbody>
-            {system_rows if system_rows else "<tr><td colspan='2' style='padding:10px;'>N/E</td></tr>"}
-          </tbody>
-        </table>
-      </div>
-
-      <div class="card">
-        <h2>✅ Próximos pasos sugeridos</h2>
-        <ul>
-          <li>Correlacionar resultados con clínica y antecedentes.</li>
-          <li>Repetir/confirmar pruebas alteradas según criterio médico.</li>
-          <li>Control de factores de riesgo (dieta, actividad física, etc.) según hallazgos.</li>
-        </ul>
-      </div>
-
-      <div class="card">
-        <h2>❓ FAQ</h2>
-        <ul>
-          <li><b>¿Esto es un diagnóstico?</b> No. Es una interpretación automatizada orientativa.</li>
-          <li><b>¿Qué hago si hay valores alterados?</b> Consultar con tu médico para definir conducta.</li>
-          <li><b>¿Por qué aparece N/E?</b> Porque ese dato no estaba en el PDF o no se pudo extraer con seguridad.</li>
-          <li><b>¿Puedo usar esto para tratamiento?</b> No. Es apoyo informativo, no prescriptivo.</li>
-        </ul>
-        <div class="muted">© {APP_NAME}. Uso interno / informativo.</div>
-      </div>
-
-    </body>
-    </html>
-    """
-    return html
 
+def _openai_key() -> str:
+    try:
+        return st.secrets.get("OPENAI_API_KEY", "") or os.environ.get("OPENAI_API_KEY", "")
+    except Exception:  # sin secrets.toml
+        return os.environ.get("OPENAI_API_KEY", "")
 
-def html_to_pdf_bytes(html: str) -> bytes:
-    return HTML(string=html).write_pdf()
 
+@st.cache_resource
+def get_llm() -> "AsyncReportGenerator":
+    # cliente, límite de concurrencia y cache de respuestas compartidos entre sesiones
+    from engine.report_llm import AsyncReportGenerator
 
-# =========================
-# UI PRINCIPAL
-# =========================
-pdf = st.file_uploader("📄 Subir PDF de laboratorio", type=["pdf"])
+    return AsyncReportGenerator(_openai_key())
+
+
+def _load_pdf_stack(mode: str) -> None:
+    from engine.pdf_export import BOLD, FONT, wrap
+
+    # ReportLab (los dos modos pasan por metrics_to_pdf) y las métricas de sus fuentes
+    for font in (FONT, BOLD):
+        wrap(REPORT_TITLE, font, 8, 100)
+
+    if mode == "html":
+        from engine.report_html import report_template
+
+        report_template()  # plantilla Jinja compilada (también la usa la vista previa)
+        from engine.pdf_html import metrics_renderer
+
+        metrics_renderer()  # WeasyPrint + CSS parseado + fuentes
 
-raw_text = ""
-if pdf:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(pdf.read())
-        pdf_path = tmp.name
 
-    raw_text = read_pdf_text(pdf_path)
-    st.success("PDF leído correctamente")
+def _render_pdf(metrics: dict, mode: str) -> bytes:
+    from engine.pdf_export import metrics_to_pdf
 
-    if st.button("🚀 Generar reporte"):
-        # 1) Extraer analitos del texto
-        obs = extract_analytes_from_text(raw_text)
+    return metrics_to_pdf(metrics, mode)
 
-        # 2) Construir métricas con tu motor (SIN IA)
-        metrics = build_metrics(obs)  # <- aquí es donde pones tu lógica científica
 
-        # Auditoría
-        with st.expander("🔎 Datos analizados (auditoría)", expanded=False):
-            st.json(metrics)
+@st.cache_resource
+def get_pdf_cache(mode: str) -> RenderCache:
+    # PDF por hash de métricas (un cache por modo); se genera en segundo plano mientras se
+    # ve la vista previa. El stack de PDF se carga en el hilo de render: la vista previa no lo espera.
+    cache = RenderCache(partial(_render_pdf, mode=mode), max_entries=PDF_CACHE_ENTRIES)
+    cache.preload(partial(_load_pdf_stack, mode))
+    return cache
 
-        # 3) Render HTML (bonito)
-        html_report = render_report_html(metrics)
 
-        st.subheader("🧾 Vista previa del reporte")
-        st.components.v1.html(html_report, height=900, scrolling=True)
+@st.cache_resource
+def get_store() -> ResultStore:
+    return ResultStore(RESULT_DB)
 
-        # 4) Descargar PDF
-        pdf_bytes = html_to_pdf_bytes(html_report)
-        st.download_button(
-            "⬇️ Descargar reporte en PDF",
-            data=pdf_bytes,
-            file_name="reporte_interlab_ia.pdf",
-            mime="application/pdf",
+
+def show_history(store: ResultStore, metrics: dict) -> None:
+    patient = metrics["patient"]
+    st.caption("Índices por visita")
+    st.dataframe(store.index_history(patient["name"], patient["sex"]), use_container_width=True)
+    changed = [d for d in store.deltas(patient["name"], patient["sex"]) if d["previous"] is not None]
+    if changed:
+        st.caption("Cambios contra la visita anterior")
+        st.dataframe(changed, use_container_width=True)
+    analytes = sorted(metrics["analyte_map"])
+    if analytes:
+        pick = st.selectbox("Analito", analytes)
+        series = store.history(patient["name"], pick, patient["sex"])
+        if len(series) > 1:
+            st.line_chart({r["taken_at"]: r["value"] for r in series})
+        st.dataframe(series, use_container_width=True)
+
+
+def take_upload(label: str, kind: str, types: List[str], slot: str) -> Optional[UploadHandle]:
+    """
+    Subida de la sesión guardada en st.session_state[slot] (solo el handle). El archivo pasa
+    al UploadManager y el uploader se vacía (key nueva) para que Streamlit suelte su copia.
+    """
+    uploads = get_uploads()
+    gen = st.session_state.get(f"{slot}_gen", 0)
+    uploaded = st.file_uploader(label, type=types, key=f"{slot}_{gen}")
+    if uploaded is not None:
+        try:
+            handle = uploads.put(session_id, uploaded, uploaded.name, kind, size=uploaded.size)
+        except UploadError as e:
+            st.error(str(e))
+        else:
+            old = st.session_state.get(slot)
+            if old is not None and old != handle:
+                uploads.release(old)
+            st.session_state[slot] = handle
+            st.session_state[f"{slot}_gen"] = gen + 1
+            st.rerun()
+
+    handle = st.session_state.get(slot)
+    if handle is None:
+        return None
+    if not uploads.has(handle):
+        # la sesión venció o se pasó de su límite y se soltaron sus subidas más viejas
+        st.warning(f"{handle.name}: la subida ya no está disponible, volver a subirla")
+        del st.session_state[slot]
+        return None
+    name, remove = st.columns([6, 1])
+    name.caption(f"📎 {handle.name} ({handle.size / 1024:,.0f} KB)")
+    if remove.button("Quitar", key=f"{slot}_remove"):
+        uploads.release(handle)
+        del st.session_state[slot]
+        st.rerun()
+    return handle
+
+
+# =========================
+# UI PRINCIPAL
+# =========================
+# la sesión guarda solo ids y handles; archivos y reportes viven en objetos compartidos con tope
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+get_uploads().touch(session_id)
+
+pdf = take_upload("📄 Subir PDF de laboratorio", "pdf", ["pdf"], "pdf_upload")
+
+if pdf:
+    # mide cada etapa del request (logs JSON en "interlab.perf" + panel de performance)
+    with Trace("app.report") as trace:
+        # se parsea desde la subida (hash ya calculado); reruns con el mismo PDF salen del cache
+        with get_uploads().open(pdf) as f:
+            parsed = get_parse_cache().parse_file(f, pdf.digest)
+        st.success("PDF leído correctamente")
+        pdf_mode = st.radio(
+            "Formato del PDF",
+            list(PDF_MODES),
+            index=list(PDF_MODES).index(PDF_MODE),
+            format_func=PDF_MODES.get,
+            horizontal=True,
+        )
+        pdf_cache = get_pdf_cache(pdf_mode)  # la primera vez empieza a cargar el stack de PDF de fondo
+
+        if st.button("🚀 Generar reporte"):
+            # se recuerda por sesión para que el reporte siga visible en los reruns (p.ej. al descargar);
+            # las correcciones de reportes anteriores ya no se usan
+            for key in [k for k in st.session_state if k.startswith("audit_") and k != f"audit_{parsed.digest}"]:
+                del st.session_state[key]
+            st.session_state["report_digest"] = parsed.digest
+
+        if st.session_state.get("report_digest") == parsed.digest:
+            # 1-2) Métricas con tu motor (SIN IA). El reporte queda armado entre reruns: una
+            # corrección en la auditoría recalcula solo los índices y secciones del HTML afectados.
+            reports = get_session_reports()
+            rules, population = current_rules(), current_population()
+            report = reports.get(session_id, parsed.digest)
+            if report is None or report.rules is not rules or report.population is not population:
+                # primera vez, cambiaron las reglas o la referencia poblacional, o el reporte salió
+                # del cache compartido: se arma con la versión vigente (las correcciones de la
+                # auditoría se vuelven a aplicar abajo desde el estado del data_editor)
+                report = IncrementalReport(parsed.obs, parsed.patient, rules, population)
+                reports.put(session_id, parsed.digest, report)
+
+            # Auditoría (los valores se pueden corregir si el parser leyó mal)
+            with st.expander("🔎 Datos analizados (auditoría)", expanded=False):
+                edited = st.data_editor(
+                    [{"analito": k, "valor": o.value, "unidad": o.unit, "referencia": o.ref_text}
+                     for k, o in parsed.obs.items()],
+                    disabled=["analito", "unidad", "referencia"],
+                    use_container_width=True,
+                    key=f"audit_{parsed.digest}",
+                )
+                for row in edited:
+                    value = row["valor"]
+                    value = None if value is None or value != value else float(value)  # NaN = vacío
+                    if value != report.obs[row["analito"]].value:
+                        report.edit(row["analito"], value=value)
+                st.json(report.metrics)
+            metrics = report.metrics
+
+            # 3) PDF en segundo plano (no bloquea la vista previa; si ya existe, sale del cache)
+            pdf_key = pdf_cache.submit(metrics)
+
+            # Historial: un registro por PDF (volver a guardar después de una corrección lo actualiza).
+            # La fecha de toma no viene en el PDF: se guarda solo cuando el usuario la elige y lo pide.
+            if RESULT_DB:
+                store = get_store()
+                taken_at = st.date_input("Fecha de toma de la muestra", value=None, key=f"taken_at_{parsed.digest}")
+                if st.button("💾 Guardar en historial", disabled=taken_at is None):
+                    store.save_report(metrics, taken_at=taken_at, report_key=parsed.digest)
+                    st.success(f"Guardado en el historial con fecha de toma {taken_at.isoformat()}")
+                with st.expander("📈 Historial del paciente", expanded=False):
+                    show_history(store, metrics)
+
+            # 4) Render HTML (bonito)
+            html_report = report.html
+
+            st.subheader("🧾 Vista previa del reporte")
+            st.components.v1.html(html_report, height=900, scrolling=True)
+
+            if USE_LLM:
+                st.subheader("🤖 Reporte IA")
+                try:
+                    from engine.report_llm import iter_report_tokens
+
+                    st.write_stream(iter_report_tokens(get_llm(), metrics))
+                except Exception as e:
+                    st.error(f"No se pudo generar el reporte IA: {e}")
+
+            # 5) Descargar PDF
+            try:
+                with st.spinner("Generando PDF…"):
+                    pdf_bytes = pdf_cache.result(pdf_key)
+            except Exception as e:
+                st.error(f"No se pudo generar el PDF: {e}")
+            else:
+                st.download_button(
+                    "⬇️ Descargar reporte en PDF",
+                    data=pdf_bytes,
+                    file_name="reporte_interlab_ia.pdf",
+                    mime="application/pdf",
+                )
+
+    with st.expander("⏱️ Performance", expanded=False):
+        st.caption(f"Request {trace.request_id} – total {trace.as_dict()['total_ms']} ms")
+        st.dataframe(
+            [{"etapa": k, **v} for k, v in trace.as_dict()["stages"].items()],
+            use_container_width=True,
+        )
+        st.json(trace.counts)
+        st.caption("Subidas en el servidor (todas las sesiones)")
+        st.json(get_uploads().usage())
+        st.caption("Latencias recientes por etapa (proceso completo)")
+        st.dataframe(
+            [{"etapa": k, **v} for k, v in latency_summary().items()],
+            use_container_width=True,
         )
+        if trace.profile_path:
+            st.caption(f"Perfil guardado en {trace.profile_path}")
 else:
     st.info("Sube un PDF para comenzar.")
+
+
+# =========================
+# LOTES (ZIP)
+# =========================
+with st.expander("📦 Procesamiento por lotes (ZIP de PDFs)", expanded=False):
+    batch_zip = take_upload("Subir ZIP con PDFs", "zip", ["zip"], "batch_upload")
+    workers = st.number_input("Procesos", min_value=1, max_value=64, value=min(BATCH_WORKERS, 64))
+    bundle_fmt = st.radio(
+        "Descargar el lote completo como",
+        ["zip", "pdf", None],
+        format_func={"zip": "ZIP (reportes + metrics.jsonl)", "pdf": "Un PDF unido", None: "Solo el resumen"}.get,
+        horizontal=True,
+    )
+
+    if batch_zip and st.button("⚙️ Procesar lote"):
+        from engine.batch import count_inputs, run_batch
+
+        # la salida del lote anterior de la sesión se borra; esta, cuando la sesión se libere
+        out_dir = get_uploads().workdir(session_id, "batch")
+        bar = st.progress(0.0)
+        done = []
+
+        with get_uploads().open(batch_zip) as zf:
+            total = max(1, count_inputs(zf))
+
+            def _on_row(row):
+                done.append(row)
+                bar.progress(min(1.0, len(done) / total), text=f"{len(done)}/{total} – {row['file']}")
+
+            rows = run_batch(zf, out_dir, workers=int(workers), progress=_on_row)
+        bar.progress(1.0, text=f"{len(rows)} procesados")
+
+        errors = [r for r in rows if r["status"] != "ok"]
+        st.success(f"{len(rows) - len(errors)} reportes generados, {len(errors)} con error")
+        st.dataframe(rows, use_container_width=True)
+        with open(os.path.join(out_dir, "summary.csv"), "rb") as f:
+            st.download_button("⬇️ Descargar resumen CSV", data=f.read(), file_name="resumen_lote.csv", mime="text/csv")
+
+        if bundle_fmt:
+            from engine.bundle import items_from_dir, iter_bundle, write_bundle
+
+            # el paquete se arma por partes directo a disco (reutiliza los PDF del lote);
+            # la API (/bundles) lo sirve por partes sin pasar por memoria
+            bundle_path = os.path.join(out_dir, f"bundle.{bundle_fmt}")
+            with st.spinner("Armando paquete…"):
+                write_bundle(iter_bundle(items_from_dir(out_dir), bundle_fmt, PDF_MODE), bundle_path)
+            with open(bundle_path, "rb") as f:
+                st.download_button(
+                    "⬇️ Descargar lote completo",
+                    data=f,
+                    file_name=f"lote_interlab.{bundle_fmt}",
+                    mime="application/zip" if bundle_fmt == "zip" else "application/pdf",
+                )
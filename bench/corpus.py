@@ -0,0 +1,218 @@
+"""
+Corpus sintético de PDFs de laboratorio (offline, con reportlab).
+
+Las líneas siguen los formatos que espera engine.parse_pdf.extract_analytes:
+    'Colesterol Sérico 243 mg/dl 0 - 200'
+    'Eritrosedimentación 12 mm/h Hasta: 15'
+    'Colesterol L D L 174 mg/dl < 130'
+Se generan también páginas sin resultados (portada, notas legales, métodos).
+Los perfiles "table" y "table2" dibujan los resultados en columnas (una o dos tablas
+lado a lado, miles con espacio: '4 590 000'), como los lee engine.layout.
+
+Uso:
+    python -m bench.corpus salida/ --files 20
+"""
+import argparse
+import os
+import random
+from io import BytesIO
+from typing import List, Tuple, Dict, Any
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+# (nombre, unidad, rango bajo, rango alto, forma de la referencia)
+ANALYTES: List[Tuple[str, str, float, float, str]] = [
+    ("Colesterol Sérico", "mg/dl", 0, 200, "range"),
+    ("Colesterol L D L", "mg/dl", 0, 130, "lt"),
+    ("Colesterol H D L", "mg/dl", 40, 0, "ge"),
+    ("Triglicéridos", "mg/dl", 0, 150, "range"),
+    ("Glucosa", "mg/dl", 70, 100, "range"),
+    ("Hemoglobina Glicosilada", "%", 4, 5.6, "range"),
+    ("Creatinina", "mg/dl", 0.7, 1.3, "range"),
+    ("TFG estimada", "ml/min", 90, 0, "ge"),
+    ("Proteína C Reactiva", "mg/L", 0, 5, "range"),
+    ("Eritrosedimentación", "mm/h", 0, 15, "hasta"),
+    ("Leucocitos", "x10^3/uL", 4.5, 11, "range"),
+    ("Hematíes", "mm3", 4100000, 5100000, "range"),
+    ("Hemoglobina", "g/dl", 12, 16, "range"),
+    ("Hematocrito", "%", 36, 46, "range"),
+    ("Plaquetas", "x10^3/uL", 150, 450, "range"),
+    ("TSH", "µUI/mL", 0.35, 4.94, "range"),
+    ("T4 Libre", "ng/dl", 0.7, 1.48, "range"),
+    ("Ácido Úrico", "mg/dl", 2.6, 6, "range"),
+    ("Urea", "mg/dl", 15, 45, "range"),
+    ("TGO", "U/L", 0, 40, "hasta"),
+    ("TGP", "U/L", 0, 41, "hasta"),
+    ("Fosfatasa Alcalina", "U/L", 40, 129, "range"),
+    ("Sodio", "mmol/L", 135, 145, "range"),
+    ("Potasio", "mmol/L", 3.5, 5.1, "range"),
+    ("Vitamina D", "ng/ml", 30, 100, "range"),
+]
+
+SURNAMES = ["PEREZ", "GOMEZ", "RODRIGUEZ", "LOPEZ", "MARTINEZ", "SANCHEZ", "ROMERO", "TORRES"]
+NAMES = ["JUAN", "MARIA", "CARLOS", "ANA", "LUIS", "SOFIA", "JOSE", "LUCIA"]
+
+FILLER = [
+    "Método: enzimático colorimétrico automatizado.",
+    "Los valores de referencia pueden variar según edad y sexo.",
+    "Muestra tomada en ayunas de 12 horas.",
+    "Validado por: Laboratorio Clínico Interlab",
+    "Este documento es confidencial y para uso exclusivo del paciente.",
+]
+
+# (páginas de resultados, analitos por página, páginas sin resultados)
+PROFILES: Dict[str, Tuple[int, int, int]] = {
+    "small": (1, 20, 0),
+    "medium": (3, 40, 1),
+    "large": (10, 60, 2),
+    "bundle": (6, 30, 36),  # tipo epicrisis: 40+ páginas, pocas de resultados
+    "table": (3, 40, 1),
+    "table2": (2, 60, 0),
+}
+
+# Perfiles en columnas: x de (nombre, valor [alineado a la derecha], unidad, referencia)
+# por cada tabla de la fila. Los demás perfiles son líneas de texto corrido.
+TABLE_COLUMNS: Dict[str, Tuple[Tuple[float, float, float, float], ...]] = {
+    "table": ((36, 250, 270, 350),),
+    "table2": ((30, 175, 180, 225), (315, 460, 465, 510)),
+}
+TABLE_HEADER = ("NOMBRE DE ESTUDIO", "RESULTADO", "UNIDAD", "REFERENCIA")
+
+
+def _value(rng: random.Random, low: float, high: float, kind: str) -> float:
+    ref = high if kind in ("range", "lt", "hasta") else low
+    center = (low + high) / 2 if kind == "range" else ref
+    v = center * rng.uniform(0.6, 1.4) if center else rng.uniform(0, 10)
+    return round(v, 2 if v < 100 else 0)
+
+
+def _fmt(x: float) -> str:
+    return f"{x:g}" if abs(x) < 1e6 else f"{x:.0f}"
+
+
+def _fmt_thousands(x: float) -> str:
+    return f"{x:,.0f}".replace(",", " ") if abs(x) >= 1e6 else _fmt(x)
+
+
+def _ref_thousands(low: float, high: float, kind: str) -> str:
+    if kind == "range":
+        return f"{_fmt_thousands(low)} - {_fmt_thousands(high)}"
+    return _ref(low, high, kind)
+
+
+def _ref(low: float, high: float, kind: str) -> str:
+    if kind == "range":
+        return f"{_fmt(low)} - {_fmt(high)}"
+    if kind == "lt":
+        return f"< {_fmt(high)}"
+    if kind == "ge":
+        return f">= {_fmt(low)}"
+    return f"Hasta: {_fmt(high)}"
+
+
+def analyte_rows(rng: random.Random, n: int) -> List[Tuple[str, float, str, float, float, str]]:
+    rows = []
+    for i in range(n):
+        name, unit, low, high, kind = ANALYTES[i % len(ANALYTES)]
+        if i >= len(ANALYTES):
+            # sufijo con letra: un número se confundiría con el valor
+            name = f"{name} {chr(ord('A') + i // len(ANALYTES))}"
+        rows.append((name, _value(rng, low, high, kind), unit, low, high, kind))
+    return rows
+
+
+def analyte_lines(rng: random.Random, n: int) -> List[str]:
+    return [
+        f"{name} {_fmt(value)} {unit} {_ref(low, high, kind)}"
+        for name, value, unit, low, high, kind in analyte_rows(rng, n)
+    ]
+
+
+def make_pdf(profile: str, seed: int = 0) -> bytes:
+    """
+    PDF determinista (invariant=1: mismos bytes para el mismo perfil/semilla).
+    """
+    pages, per_page, filler_pages = PROFILES[profile]
+    rng = random.Random(f"{profile}-{seed}")
+    buf = BytesIO()
+    c = canvas.Canvas(buf, pagesize=letter, invariant=1)
+    _, height = letter
+
+    def page(lines: List[str], table: List[List[str]] = (), footer: List[str] = ()) -> None:
+        c.setFont("Helvetica", 8)
+        y = height - 40
+        for ln in lines:
+            c.drawString(36, y, ln)
+            y -= 11
+        for cells in table:
+            # una fila de la tabla: 4 celdas por cada tabla lado a lado
+            for (x_name, x_value, x_unit, x_ref), k in zip(TABLE_COLUMNS[profile], range(0, len(cells), 4)):
+                c.drawString(x_name, y, cells[k])
+                c.drawRightString(x_value, y, cells[k + 1])
+                c.drawString(x_unit, y, cells[k + 2])
+                c.drawString(x_ref, y, cells[k + 3])
+            y -= 11
+        for ln in footer:
+            c.drawString(36, y, ln)
+            y -= 11
+        c.showPage()
+
+    # portada / notas antes de los resultados
+    for _ in range(filler_pages // 2):
+        page([rng.choice(FILLER) for _ in range(40)])
+
+    age = rng.randint(18, 85)
+    sex = rng.choice(["Masculino", "Femenino"])
+    header = [
+        f"Paciente: {rng.choice(SURNAMES)}, {rng.choice(NAMES)} Identificación: {100000 + seed}",
+        f"Edad: {age} Años Sexo: {sex}",
+        "NOMBRE DE ESTUDIO RESULTADO UNIDAD REFERENCIA",
+    ]
+    if profile in TABLE_COLUMNS:
+        per_row = len(TABLE_COLUMNS[profile])
+        table_header = list(TABLE_HEADER) * per_row
+        cells = [
+            [name, _fmt_thousands(value), unit, _ref_thousands(low, high, kind)]
+            for name, value, unit, low, high, kind in analyte_rows(rng, per_page * pages)
+        ]
+        for p in range(pages):
+            body = cells[per_page * p: per_page * (p + 1)]
+            rows = [sum(body[i:i + per_row], []) for i in range(0, len(body), per_row)]
+            page(header[:2] if p == 0 else [], [table_header] + rows, FILLER[:2])
+    else:
+        for p in range(pages):
+            body = analyte_lines(rng, per_page * (p + 1))[per_page * p:]
+            page((header if p == 0 else []) + body + FILLER[:2])
+
+    for _ in range(filler_pages - filler_pages // 2):
+        page([rng.choice(FILLER) for _ in range(40)])
+
+    c.save()
+    return buf.getvalue()
+
+
+def write_corpus(out_dir: str, files: int = 8, profiles: Tuple[str, ...] = tuple(PROFILES)) -> List[str]:
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for profile in profiles:
+        for seed in range(files):
+            path = os.path.join(out_dir, f"{profile}_{seed:03d}.pdf")
+            with open(path, "wb") as f:
+                f.write(make_pdf(profile, seed))
+            paths.append(path)
+    return paths
+
+
+def main(argv: Any = None) -> None:
+    ap = argparse.ArgumentParser(description="Genera PDFs de laboratorio sintéticos")
+    ap.add_argument("out", help="carpeta de salida")
+    ap.add_argument("--files", type=int, default=8, help="archivos por perfil")
+    ap.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    args = ap.parse_args(argv)
+    paths = write_corpus(args.out, args.files, tuple(args.profiles))
+    print(f"{len(paths)} PDFs en {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Benchmark reproducible del pipeline (read, parse, score, HTML, PDF) sobre el corpus sintético.
+
+Uso:
+    python -m bench.run                      # compara contra bench/baseline.json
+    python -m bench.run --update-baseline    # regraba la línea base
+    python -m bench.run --files 4 --repeat 5 --workers 4 --tolerance 0.35
+    python -m bench.run --only startup       # solo arranque de la app (imports en frío)
+    python -m bench.run --only single batch_fast   # PDF WeasyPrint vs ReportLab ("fast")
+
+Sale con código 1 si alguna métrica empeora más que --tolerance respecto a la línea base.
+Los tiempos dependen de la máquina: regrabar la línea base al cambiar de hardware.
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from typing import Dict, List, Any, Optional, Callable
+
+from bench.corpus import PROFILES, make_pdf, write_corpus
+from engine.batch import run_batch
+from engine.parse_pdf import read_pdf_text, extract_patient, extract_analytes
+from engine.pdf_export import metrics_to_pdf_fast
+from engine.report_html import render_report_html
+from engine.scores import build_metrics
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+STAGES = ("read", "parse", "score", "html", "pdf", "pdf_fast")
+SECTIONS = ("single", "batch", "batch_fast", "startup")
+
+# lo que la app carga recién al usarlo (ver los imports de app.py)
+LAZY_STACKS = {
+    "pdf_parser": ("pdfplumber",),
+    "pdf_render": ("engine.pdf_html",),
+    "llm": ("engine.report_llm",),
+    "batch": ("engine.batch",),
+}
+
+
+def _pdf_renderer() -> Optional[Callable[[dict], bytes]]:
+    try:
+        from engine.pdf_html import metrics_to_pdf_bytes
+        return metrics_to_pdf_bytes
+    except Exception:  # weasyprint (o Pango/Cairo del sistema) no disponible
+        return None
+
+
+def _pct(vals: List[float], q: float) -> float:
+    vals = sorted(vals)
+    k = max(0, min(len(vals) - 1, int(round(q * len(vals) + 0.5)) - 1))
+    return vals[k]
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(_pct(samples, 0.50) * 1000, 3),
+        "p95_ms": round(_pct(samples, 0.95) * 1000, 3),
+    }
+
+
+def bench_single(profiles: List[str], files: int, repeat: int) -> Dict[str, Any]:
+    """
+    Pipeline completo archivo por archivo, midiendo cada etapa por separado.
+    pdf_fast (ReportLab) se mide aparte del total, para compararlo con pdf (WeasyPrint).
+    """
+    to_pdf = _pdf_renderer()
+    samples: Dict[str, List[float]] = {s: [] for s in STAGES}
+    total: List[float] = []
+    lines = 0
+    parse_s = 0.0
+
+    docs = [make_pdf(p, seed) for p in profiles for seed in range(files)]
+    for _ in range(repeat):
+        for data in docs:
+            t0 = time.perf_counter()
+            text = read_pdf_text(BytesIO(data))
+            t1 = time.perf_counter()
+            patient = extract_patient(text)
+            obs = extract_analytes(text)
+            t2 = time.perf_counter()
+            metrics = build_metrics(obs, patient)
+            t3 = time.perf_counter()
+            render_report_html(metrics)
+            t4 = time.perf_counter()
+            if to_pdf is not None:
+                to_pdf(metrics)
+            t5 = time.perf_counter()
+            metrics_to_pdf_fast(metrics)
+            t6 = time.perf_counter()
+
+            samples["read"].append(t1 - t0)
+            samples["parse"].append(t2 - t1)
+            samples["score"].append(t3 - t2)
+            samples["html"].append(t4 - t3)
+            if to_pdf is not None:
+                samples["pdf"].append(t5 - t4)
+            samples["pdf_fast"].append(t6 - t5)
+            total.append(t5 - t0)
+            lines += text.count("\n") + 1
+            parse_s += t2 - t1
+
+    out: Dict[str, Any] = {s: _summary(v) for s, v in samples.items() if v}
+    out["total"] = _summary(total)
+    out["files_per_s"] = round(len(total) / sum(total), 2)
+    out["parse_lines_per_s"] = round(lines / parse_s)
+    out["pdf_stage"] = to_pdf is not None
+    if to_pdf is not None:
+        out["pdf_fast_speedup"] = round(out["pdf"]["p50_ms"] / out["pdf_fast"]["p50_ms"], 1)
+    return out
+
+
+def bench_batch(profiles: List[str], files: int, workers: int, pdf_mode: str = "html") -> Dict[str, Any]:
+    """
+    Lote completo. pdf_mode "html" exporta con WeasyPrint si está disponible (si no, HTML);
+    "fast" siempre exporta PDF con ReportLab.
+    """
+    export_pdf = pdf_mode == "fast" or _pdf_renderer() is not None
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "in")
+        write_corpus(src, files, tuple(profiles))
+        n = len(os.listdir(src))
+        t0 = time.perf_counter()
+        rows = run_batch(src, os.path.join(tmp, "out"), workers=workers, export_pdf=export_pdf, pdf_mode=pdf_mode)
+        elapsed = time.perf_counter() - t0
+    per_file = [r["seconds"] for r in rows if r.get("status") == "ok"]
+    return {
+        "workers": workers,
+        "pdf": pdf_mode if export_pdf else "no",
+        "files": n,
+        "errors": sum(1 for r in rows if r["status"] != "ok"),
+        "files_per_s": round(n / elapsed, 2),
+        "file": _summary(per_file) if per_file else {},
+    }
+
+
+def app_imports(path: str = APP_PATH) -> List[str]:
+    """
+    Módulos que app.py importa a nivel de módulo (lo que paga cada arranque), sin streamlit.
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    mods: List[str] = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            mods += [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            mods.append(node.module)
+    return [m for m in mods if m.split(".")[0] != "streamlit"]
+
+
+def _fresh(code: str) -> Optional[Any]:
+    """
+    Corre `code` en un intérprete nuevo (imports en frío) y devuelve el JSON que imprime.
+    None si falla (p.ej. WeasyPrint sin Pango).
+    """
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _cold_import_ms(modules: List[str], repeat: int) -> Optional[float]:
+    code = (
+        "import importlib, json, time\n"
+        "t = time.perf_counter()\n"
+        f"for m in {modules!r}: importlib.import_module(m)\n"
+        "print(json.dumps((time.perf_counter() - t) * 1000))"
+    )
+    samples = [_fresh(code) for _ in range(repeat)]
+    if any(s is None for s in samples):
+        return None
+    return round(statistics.median(samples), 3)
+
+
+def bench_startup(repeat: int) -> Dict[str, Any]:
+    """
+    Arranque de la app: imports de app.py en un intérprete nuevo, y aparte el costo de
+    cada stack que se carga tarde. Con streamlit instalado, también la primera ejecución
+    del script y un rerun (AppTest, sin PDF subido).
+    """
+    out: Dict[str, Any] = {"app_imports_ms": _cold_import_ms(app_imports(), repeat)}
+    for name, modules in LAZY_STACKS.items():
+        ms = _cold_import_ms(list(modules), repeat)
+        if ms is not None:
+            out[f"lazy_{name}_ms"] = ms
+    script = (
+        "import json, time\n"
+        "from streamlit.testing.v1 import AppTest\n"
+        f"at = AppTest.from_file({APP_PATH!r}, default_timeout=120)\n"
+        "t0 = time.perf_counter(); at.run(); t1 = time.perf_counter(); at.run(); t2 = time.perf_counter()\n"
+        "print(json.dumps([(t1 - t0) * 1000, (t2 - t1) * 1000]))"
+    )
+    runs = [_fresh(script) for _ in range(repeat)]
+    if all(r is not None for r in runs):
+        out["first_run_ms"] = round(statistics.median(r[0] for r in runs), 3)
+        out["rerun_ms"] = round(statistics.median(r[1] for r in runs), 3)
+    return out
+
+
+def _flatten(d: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    out = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(_flatten(v, f"{key}."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = float(v)
+    return out
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Métricas *_ms: peor si suben; *_per_s: peor si bajan. Devuelve las regresiones.
+    """
+    cur, base = _flatten(current["results"]), _flatten(baseline["results"])
+    regressions = []
+    for key, b in sorted(base.items()):
+        c = cur.get(key)
+        if c is None or b <= 0:
+            continue
+        if key.endswith("_ms"):
+            change = c / b - 1
+        elif key.endswith("_per_s"):
+            change = b / c - 1 if c > 0 else float("inf")
+        else:
+            continue
+        mark = "REGRESIÓN" if change > tolerance else ""
+        print(f"  {key:38s} base {b:>12.3f}  actual {c:>12.3f}  {change:+7.1%} {mark}")
+        if mark:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv: Any = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark del pipeline Interlab IA")
+    ap.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    ap.add_argument("--files", type=int, default=4, help="PDFs por perfil")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--tolerance", type=float, default=0.35, help="empeoramiento máximo aceptado")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--only", nargs="+", choices=SECTIONS, default=list(SECTIONS), help="secciones a medir")
+    args = ap.parse_args(argv)
+
+    weasyprint = _pdf_renderer() is not None
+    if not weasyprint:
+        # sin la etapa "pdf" no hay comparación WeasyPrint vs ReportLab (pdf_fast_speedup)
+        print("Aviso: WeasyPrint no disponible: la etapa pdf y pdf_fast_speedup quedan sin medir", file=sys.stderr)
+
+    results: Dict[str, Any] = {}
+    if "single" in args.only:
+        results["single"] = {p: bench_single([p], args.files, args.repeat) for p in args.profiles}
+    if "batch" in args.only:
+        results["batch"] = bench_batch(args.profiles, args.files, args.workers)
+    if "batch_fast" in args.only:
+        results["batch_fast"] = bench_batch(args.profiles, args.files, args.workers, pdf_mode="fast")
+    if "startup" in args.only:
+        results["startup"] = bench_startup(args.repeat)
+    report = {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "weasyprint": weasyprint,
+        },
+        "params": {k: v for k, v in vars(args).items() if k not in ("baseline", "update_baseline", "only")},
+        "results": results,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.update_baseline:
+        if os.path.exists(args.baseline) and set(results) != set(SECTIONS):
+            # con --only se regraban solo esas secciones
+            with open(args.baseline, encoding="utf-8") as f:
+                previous = json.load(f)
+            report = {**previous, "results": {**previous.get("results", {}), **results}}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"Línea base actualizada: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("Sin línea base; correr con --update-baseline")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("params", {}).get("files") != args.files or baseline.get("params", {}).get("repeat") != args.repeat:
+        print("Aviso: parámetros distintos a los de la línea base; la comparación es orientativa")
+    if not baseline.get("machine", {}).get("weasyprint", True):
+        print("Aviso: la línea base se grabó sin WeasyPrint: pdf (WeasyPrint) y pdf_fast_speedup no se comparan")
+    print(f"Comparación contra {args.baseline} (tolerancia {args.tolerance:.0%}):")
+    regressions = compare(report, baseline, args.tolerance)
+    print(f"{len(regressions)} regresiones")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
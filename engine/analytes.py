@@ -0,0 +1,67 @@
+import re
+import unicodedata
+from typing import Dict, Optional, Any, List, Tuple
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+# Analito canónico -> fragmentos de nombre (ya normalizados), en orden de prioridad.
+# Un nombre crudo del PDF resuelve al canónico si contiene alguno de los fragmentos.
+SYNONYMS: Dict[str, Tuple[str, ...]] = {
+    "LDL": ("ldl",),
+    "HDL": ("hdl",),
+    "COLESTEROL_TOTAL": ("colesterolserico", "colesteroltotal"),
+    "TRIGLICERIDOS": ("triglic",),
+    "HBA1C": ("hemoglobinaglicosilada", "hba1c"),
+    "GLUCOSA": ("glucosa", "glicemia", "glucemia"),
+    "CREATININA": ("creatinina",),
+    "TFG": ("tfg", "filtradoglomerular"),
+    "PCR": ("proteinac", "pcr"),
+    "VSG": ("eritrosed", "vsg"),
+    "LEUCOCITOS": ("leucoc",),
+    "TSH": ("tsh",),
+}
+
+
+def normalize_name(name: str) -> str:
+    """
+    'Colesterol  L.D.L' -> 'colesterolldl', 'Proteína C' -> 'proteinac'
+    (sin acentos, sin espacios ni puntuación, minúsculas)
+    """
+    s = unicodedata.normalize("NFKD", name or "")
+    s = "".join(c for c in s if not unicodedata.combining(c))
+    return _NON_ALNUM.sub("", s.lower())
+
+
+class AnalyteIndex:
+    """
+    Índice por reporte: analito canónico -> observación.
+    Se arma una sola vez; después cada búsqueda es un acceso a dict.
+    """
+
+    def __init__(self, obs: Dict[str, Any], synonyms: Dict[str, Tuple[str, ...]] = SYNONYMS):
+        self.obs = obs
+        self.matches: Dict[str, str] = {}  # canónico -> nombre crudo del PDF
+        normalized: List[Tuple[str, str]] = [(k, normalize_name(k)) for k in obs]
+        for canonical, fragments in synonyms.items():
+            for frag in fragments:
+                raw = next((k for k, n in normalized if frag in n), None)
+                if raw is not None:
+                    self.matches[canonical] = raw
+                    break
+
+    def __contains__(self, canonical: str) -> bool:
+        return canonical in self.matches
+
+    def get(self, canonical: str) -> Optional[Any]:
+        raw = self.matches.get(canonical)
+        return None if raw is None else self.obs[raw]
+
+    def value(self, canonical: str) -> Optional[float]:
+        return getattr(self.get(canonical), "value", None)
+
+
+def analyte_index(obs: Any) -> AnalyteIndex:
+    """
+    Acepta un dict de Obs o un índice ya armado (no lo reconstruye).
+    """
+    return obs if isinstance(obs, AnalyteIndex) else AnalyteIndex(obs)
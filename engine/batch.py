@@ -0,0 +1,320 @@
+"""
+Procesamiento por lotes: carpeta o ZIP de PDFs -> un reporte por archivo + resumen.
+
+Uso:
+    python -m engine.batch entrada/ -o salida/ --workers 4
+    python -m engine.batch lote.zip -o salida/ --format parquet
+    python -m engine.batch entrada/ -o salida/ --pdf-mode fast   # PDF con ReportLab (ms por reporte)
+    python -m engine.batch lote.zip -o salida/ --bundle pdf      # + salida/bundle.pdf con todo el lote
+    python -m engine.batch lote.zip -o salida/ --population poblacion.json   # suma el lote a la referencia
+    python -m engine.batch lote.zip -o salida/ --db interlab.db --taken-at 2024-05-02
+"""
+import argparse
+import csv
+import json
+import os
+import time
+import zipfile
+from datetime import date
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, List, Iterator, Tuple, Union, Optional, BinaryIO, Callable
+
+from engine.parse_pdf import PARSE_MODES, extract_streaming
+from engine.pdf_export import PDF_MODES, metrics_to_pdf
+from engine.perf import Trace, stage
+from engine.scores import build_metrics
+from engine.report_html import iter_report_html
+
+SUMMARY_FIELDS = [
+    "file", "status", "error", "name", "age", "sex", "urgency",
+    "global_health", "inflammation", "metabolic_age", "red_flags",
+    "n_analytes", "report", "llm", "seconds",
+]
+
+
+def iter_inputs(src: Union[str, BinaryIO]) -> Iterator[Tuple[str, Union[str, bytes]]]:
+    """
+    Recorre una carpeta (recursivo) o un ZIP y devuelve (nombre, ruta|bytes) por cada PDF.
+    Los bytes del ZIP se leen de a uno para no cargar todo el lote en memoria.
+    """
+    if isinstance(src, str) and os.path.isdir(src):
+        for root, _, files in sorted(os.walk(src)):
+            for fn in sorted(files):
+                if fn.lower().endswith(".pdf"):
+                    path = os.path.join(root, fn)
+                    yield os.path.relpath(path, src), path
+        return
+
+    with zipfile.ZipFile(src) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                continue
+            yield info.filename, zf.read(info)
+
+
+def count_inputs(src: Union[str, BinaryIO]) -> int:
+    if isinstance(src, str) and os.path.isdir(src):
+        return sum(1 for _ in iter_inputs(src))
+    with zipfile.ZipFile(src) as zf:
+        return sum(1 for n in zf.namelist() if n.lower().endswith(".pdf"))
+
+
+def _report_stem(name: str) -> str:
+    stem = os.path.splitext(name)[0]
+    return stem.replace("/", "__").replace("\\", "__")
+
+
+def _unique_stem(name: str, used: set) -> str:
+    """
+    Stem de salida de `name` que no pisa el de otro archivo del lote ("a/b.pdf" y "a__b.pdf",
+    o "x.pdf" y "x.PDF" en un disco que no distingue mayúsculas): se le agrega _2, _3...
+    """
+    base = stem = _report_stem(name)
+    k = 1
+    while stem.casefold() in used:
+        k += 1
+        stem = f"{base}_{k}"
+    used.add(stem.casefold())
+    return stem
+
+
+def process_one(
+    name: str,
+    source: Union[str, bytes],
+    out_dir: str,
+    export_pdf: bool = True,
+    mode: str = "text",
+    pdf_mode: Optional[str] = None,
+    stem: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Pipeline completo para un archivo. Nunca lanza: los errores quedan en la fila del resumen.
+    `stem` es el nombre de las salidas (default: el del archivo).
+    """
+    t0 = time.perf_counter()
+    row: Dict[str, Any] = {"file": name, "status": "ok", "error": ""}
+    with Trace("batch.file"):
+        try:
+            # página por página: el worker no arma el texto completo del PDF
+            patient, obs = extract_streaming(source if isinstance(source, str) else BytesIO(source), mode=mode)
+            metrics = build_metrics(obs, patient)
+
+            stem = os.path.join(out_dir, stem or _report_stem(name))
+            with open(f"{stem}.json", "w", encoding="utf-8") as f:
+                json.dump(metrics, f, ensure_ascii=False, indent=2)
+
+            if export_pdf:
+                # WeasyPrint se importa recién acá (modo "html"): el lote corre sin él con
+                # --no-pdf o --pdf-mode fast. El renderer queda cacheado en cada worker entre archivos.
+                report_path = f"{stem}.pdf"
+                with open(report_path, "wb") as f:
+                    f.write(metrics_to_pdf(metrics, pdf_mode))
+            else:
+                report_path = f"{stem}.html"
+                with open(report_path, "w", encoding="utf-8") as f, stage("render.html"):
+                    f.writelines(iter_report_html(metrics))  # se escribe a medida que se genera
+
+            indices = metrics["indices"]
+            row.update({
+                "name": patient.get("name"),
+                "age": patient.get("age"),
+                "sex": patient.get("sex"),
+                "urgency": metrics["urgency"],
+                "global_health": indices["global_health"],
+                "inflammation": indices["inflammation"],
+                "metabolic_age": indices["metabolic_age"],
+                "red_flags": metrics["red_flags"],
+                "n_analytes": len(obs),
+                "report": os.path.basename(report_path),
+            })
+        except Exception as e:
+            row["status"] = "error"
+            row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = round(time.perf_counter() - t0, 3)
+    return row
+
+
+def write_summary(rows: List[Dict[str, Any]], out_dir: str, fmt: str = "csv") -> str:
+    if fmt == "parquet":
+        import pandas as pd
+        path = os.path.join(out_dir, "summary.parquet")
+        pd.DataFrame(rows, columns=SUMMARY_FIELDS).to_parquet(path, index=False)
+        return path
+
+    path = os.path.join(out_dir, "summary.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction="ignore")
+        w.writeheader()
+        w.writerows(rows)
+    return path
+
+
+def run_batch(
+    src: Union[str, BinaryIO],
+    out_dir: str,
+    workers: Optional[int] = None,
+    export_pdf: bool = True,
+    summary_format: str = "csv",
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    llm: Optional[Any] = None,
+    mode: str = "text",
+    store: Optional[Any] = None,
+    pdf_mode: Optional[str] = None,
+    population: Optional[Any] = None,
+    taken_at: Optional[Any] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Procesa el lote en un ProcessPoolExecutor y escribe el resumen en out_dir.
+    Mantiene como máximo 2 × workers archivos en vuelo (backpressure sobre el ZIP).
+    Con `llm` (un engine.report_llm.AsyncReportGenerator) además genera <archivo>.llm.md;
+    cada reporte LLM se lanza apenas termina su archivo, en paralelo con el resto del lote.
+    `mode` es el de engine.parse_pdf.iter_report ("table" para reportes en columnas).
+    Con `store` (un engine.store.ResultStore) cada reporte ok se guarda en el historial
+    con fecha de toma `taken_at` (obligatoria: los PDFs no la traen).
+    `pdf_mode` es el de engine.pdf_export.metrics_to_pdf ("fast" para lotes grandes).
+    Con `population` (un engine.population.Population) se suman los resultados de cada
+    reporte ok; quien llama lo fusiona con la referencia guardada (update_population).
+    """
+    if store is not None and not taken_at:
+        raise ValueError("guardar en el historial requiere taken_at (fecha de toma de las muestras)")
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    rows: List[Dict[str, Any]] = []
+    pending: Dict[Any, Tuple[str, str]] = {}  # future -> (archivo, stem de sus salidas)
+    llm_pending: List[Tuple[Dict[str, Any], str, Any]] = []
+    used: set = set()
+
+    def _metrics(stem):
+        with open(os.path.join(out_dir, f"{stem}.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _submit_llm(row, stem, metrics):
+        from engine.report_llm import submit_report
+        llm_pending.append((row, stem, submit_report(llm, metrics)))
+
+    def _collect(done):
+        for fut in done:
+            name, stem = pending.pop(fut)
+            try:
+                row = fut.result()
+            except Exception as e:  # p.ej. el worker murió (BrokenProcessPool)
+                row = {"file": name, "status": "error", "error": f"{type(e).__name__}: {e}"}
+            rows.append(row)
+            if row["status"] == "ok" and (llm is not None or store is not None or population is not None):
+                # un error acá (sqlite, referencia, LLM) marca solo esta fila, no corta el lote
+                try:
+                    metrics = _metrics(stem)
+                    if population is not None:
+                        population.add_metrics(metrics)
+                    if store is not None:
+                        store.save_report(metrics, taken_at)
+                    if llm is not None:
+                        _submit_llm(row, stem, metrics)
+                except Exception as e:
+                    row["status"] = "error"
+                    row["error"] = f"{type(e).__name__}: {e}"
+            if progress:
+                progress(row)
+
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for name, source in iter_inputs(src):
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done)
+            stem = _unique_stem(name, used)
+            pending[ex.submit(process_one, name, source, out_dir, export_pdf, mode, pdf_mode, stem)] = (name, stem)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            _collect(done)
+
+    for row, stem, fut in llm_pending:
+        try:
+            text = fut.result()
+        except Exception as e:
+            row["llm"] = f"error: {type(e).__name__}: {e}"
+            continue
+        name = f"{stem}.llm.md"
+        with open(os.path.join(out_dir, name), "w", encoding="utf-8") as f:
+            f.write(text)
+        row["llm"] = name
+
+    rows.sort(key=lambda r: r["file"])
+    write_summary(rows, out_dir, summary_format)
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Interlab IA – procesamiento por lotes de PDFs de laboratorio")
+    ap.add_argument("input", help="carpeta con PDFs o archivo .zip")
+    ap.add_argument("-o", "--out", required=True, help="carpeta de salida")
+    ap.add_argument("-w", "--workers", type=int, default=None, help="procesos (default: núcleos)")
+    ap.add_argument("--format", choices=["csv", "parquet"], default="csv", help="formato del resumen")
+    ap.add_argument("--no-pdf", action="store_true", help="escribe HTML en vez de PDF")
+    ap.add_argument("--pdf-mode", choices=PDF_MODES, default=None,
+                    help="html: WeasyPrint (default, INTERLAB_PDF_MODE); fast: ReportLab directo")
+    ap.add_argument("--mode", choices=PARSE_MODES, default="text", help="lectura por líneas o por columnas")
+    ap.add_argument("--db", help="guarda los resultados en este historial SQLite (con --taken-at)")
+    ap.add_argument("--taken-at", type=date.fromisoformat, metavar="YYYY-MM-DD", help="fecha de toma de las muestras del lote (para --db)")
+    ap.add_argument("--bundle", choices=("zip", "pdf"), default=None,
+                    help="además, todo el lote en salida/bundle.zip (reportes + metrics.jsonl) o bundle.pdf")
+    ap.add_argument("--population", metavar="RUTA",
+                    help="suma los resultados del lote a esta referencia poblacional (se crea si no existe;"
+                         " volver a sumar el mismo lote lo cuenta dos veces)")
+    ap.add_argument("--llm", action="store_true", help="genera también el reporte IA (OPENAI_API_KEY)")
+    ap.add_argument("--llm-concurrency", type=int, default=4, help="requests LLM simultáneos")
+    args = ap.parse_args(argv)
+    if args.db and not args.taken_at:
+        ap.error("--db requiere --taken-at (fecha de toma de las muestras, no la de hoy)")
+
+    llm = None
+    if args.llm:
+        from engine.report_llm import AsyncReportGenerator
+        llm = AsyncReportGenerator(
+            os.environ.get("OPENAI_API_KEY", ""),
+            base_url=os.environ.get("OPENAI_BASE_URL"),
+            max_concurrency=args.llm_concurrency,
+        )
+
+    store = None
+    if args.db:
+        from engine.store import ResultStore
+        store = ResultStore(args.db)
+
+    population = None
+    if args.population:
+        from engine.population import Population
+        population = Population()
+
+    t0 = time.perf_counter()
+    rows = run_batch(
+        args.input,
+        args.out,
+        workers=args.workers,
+        export_pdf=not args.no_pdf,
+        summary_format=args.format,
+        progress=lambda r: print(f"[{r['status']}] {r['file']} {r.get('error', '')}".rstrip()),
+        llm=llm,
+        mode=args.mode,
+        store=store,
+        pdf_mode=args.pdf_mode,
+        population=population,
+        taken_at=args.taken_at,
+    )
+    if population is not None:
+        from engine.population import update_population
+        total = update_population(args.population, population)
+        print(f"Referencia poblacional: {args.population} ({len(total)} grupos)")
+    if args.bundle:
+        from engine.bundle import items_from_dir, iter_bundle, write_bundle
+        path = os.path.join(args.out, f"bundle.{args.bundle}")
+        write_bundle(iter_bundle(items_from_dir(args.out), args.bundle, args.pdf_mode), path)
+        print(f"Paquete: {path}")
+    errors = sum(1 for r in rows if r["status"] != "ok")
+    elapsed = time.perf_counter() - t0
+    print(f"{len(rows)} archivos, {errors} con error, {elapsed:.1f}s ({len(rows) / max(elapsed, 1e-9):.1f} PDF/s)")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,433 @@
+"""
+Exportación en bloque de reportes sin armar todo en memoria (p.ej. un mes para auditoría).
+
+- iter_zip_bundle(items): ZIP con un PDF por reporte (o el HTML/PDF ya generado por el lote)
+  + metrics.jsonl (una línea por reporte).
+- iter_merged_pdf(items): un único PDF con todos los reportes y un marcador por reporte
+  (un reporte que falla queda como una página que lo nombra, con su marcador).
+
+Los dos son generadores de bytes: se escriben a disco (write_bundle) o se sirven como
+descarga por partes (StreamingResponse en api.py) a medida que se generan. En memoria queda
+un reporte a la vez; lo único que crece con el lote son los offsets del xref del PDF unido y
+los títulos de los marcadores. metrics.jsonl se acumula en un SpooledTemporaryFile (pasa a
+disco al superar BUNDLE_SPOOL_MB) y entra al final del ZIP.
+
+Los items son (nombre, métricas, reporte) con `reporte` la ruta de un .pdf/.html ya generado
+o None para renderizarlo (engine.pdf_export.metrics_to_pdf, en el modo pedido).
+
+Uso:
+    python -m engine.bundle --db interlab.db --since 2024-05-01 --until 2024-05-31 -o mayo.zip
+    python -m engine.bundle --dir salida_lote/ -o lote.pdf --pdf-mode fast
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+import zlib
+from array import array
+from datetime import date
+from collections import deque
+from io import BytesIO
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from engine.analytes import normalize_name
+from engine.perf import count, timed
+
+logger = logging.getLogger("interlab.bundle")
+
+BUNDLE_FORMATS = ("zip", "pdf")
+BUNDLE_SPOOL_MB = float(os.environ.get("INTERLAB_BUNDLE_SPOOL_MB", "4"))
+COPY_CHUNK = 1 << 20
+
+BundleItem = Tuple[str, Dict[str, Any], Optional[str]]
+
+
+# =========================
+# ORÍGENES
+# =========================
+def items_from_store(store: Any, since: Any = None, until: Any = None) -> Iterator[BundleItem]:
+    """
+    Reportes del historial (engine.store.ResultStore) por fecha de toma, paginados.
+    """
+    for r in store.iter_reports(since=since, until=until):
+        name = normalize_name(r["name"] or "") or "sin_nombre"
+        yield f"{r['taken_at']}_{name}_{r['id']}", r["metrics"], None
+
+
+def items_from_dir(out_dir: str) -> Iterator[BundleItem]:
+    """
+    Salida de engine.batch: <archivo>.json + el .pdf/.html que generó (se reutiliza tal cual).
+    """
+    for fn in sorted(os.listdir(out_dir)):
+        if not fn.endswith(".json"):
+            continue
+        stem = os.path.join(out_dir, fn[:-5])
+        with open(f"{stem}.json", encoding="utf-8") as f:
+            metrics = json.load(f)
+        report = next((f"{stem}{ext}" for ext in (".pdf", ".html") if os.path.exists(f"{stem}{ext}")), None)
+        yield fn[:-5], metrics, report
+
+
+def _pdf_bytes(metrics: Dict[str, Any], report: Optional[str], pdf_mode: Optional[str]) -> bytes:
+    if report and report.endswith(".pdf"):
+        with open(report, "rb") as f:
+            return f.read()
+    from engine.pdf_export import metrics_to_pdf
+
+    return metrics_to_pdf(metrics, pdf_mode)
+
+
+# =========================
+# ZIP
+# =========================
+class _ChunkSink:
+    """
+    Destino de zipfile que no se puede rebobinar: zipfile escribe cada entrada con data
+    descriptor (sin volver atrás a corregir el header) y acá solo se juntan los bytes
+    hasta que el generador los entrega.
+    """
+
+    def __init__(self):
+        self.pos = 0
+        self.chunks: List[bytes] = []
+
+    def write(self, b: bytes) -> int:
+        self.chunks.append(bytes(b))
+        self.pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self.pos
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self.chunks = self.chunks, []
+        if chunks:
+            yield b"".join(chunks)
+
+
+def iter_zip_bundle(items: Iterable[BundleItem], pdf_mode: Optional[str] = None) -> Iterator[bytes]:
+    """
+    ZIP por partes: reports/<nombre>.pdf|.html por reporte y metrics.jsonl al final.
+    Un reporte que falla queda en metrics.jsonl con "error" y el resto sigue.
+    """
+    sink = _ChunkSink()
+    spool = tempfile.SpooledTemporaryFile(max_size=int(BUNDLE_SPOOL_MB * 1024 * 1024), mode="w+b")
+    with spool, zipfile.ZipFile(sink, "w", allowZip64=True) as zf:
+        for name, metrics, report in items:
+            line: Dict[str, Any] = {"name": name}
+            try:
+                if report and not report.endswith(".pdf"):
+                    arcname = f"reports/{name}{os.path.splitext(report)[1]}"
+                    info = zipfile.ZipInfo(arcname, _now())
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    with open(report, "rb") as src, zf.open(info, "w") as dst:
+                        shutil.copyfileobj(src, dst, COPY_CHUNK)
+                else:
+                    # los PDF ya vienen comprimidos: se guardan sin deflate
+                    arcname = f"reports/{name}.pdf"
+                    zf.writestr(zipfile.ZipInfo(arcname, _now()), _pdf_bytes(metrics, report, pdf_mode))
+                line["report"] = arcname
+            except Exception as e:
+                line["error"] = f"{type(e).__name__}: {e}"
+            line["metrics"] = metrics
+            spool.write(json.dumps(line, ensure_ascii=False).encode("utf-8") + b"\n")
+            yield from sink.drain()
+
+        spool.seek(0)
+        info = zipfile.ZipInfo("metrics.jsonl", _now())
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with zf.open(info, "w", force_zip64=True) as dst:
+            while True:
+                block = spool.read(COPY_CHUNK)
+                if not block:
+                    break
+                dst.write(block)
+                yield from sink.drain()
+    yield from sink.drain()  # directorio central
+
+
+def _now() -> Tuple[int, int, int, int, int, int]:
+    return time.localtime()[:6]
+
+
+# =========================
+# PDF UNIDO
+# =========================
+def _name(n: Any) -> bytes:
+    raw = n.encode("utf-8") if isinstance(n, str) else bytes(n)
+    return b"/" + b"".join(
+        bytes([c]) if 0x21 <= c <= 0x7E and c not in b"()<>[]{}/%#" else b"#%02X" % c for c in raw
+    )
+
+
+def _text(s: str) -> bytes:
+    # string de texto PDF en UTF-16BE con BOM, en hexa (sin escapes)
+    return b"<FEFF" + s.encode("utf-16-be").hex().upper().encode("ascii") + b">"
+
+
+def _pdf_str(s: str) -> bytes:
+    # string literal para un content stream con Helvetica/WinAnsi
+    raw = s.encode("cp1252", errors="replace")
+    return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").replace(b"\r", b" ").replace(b"\n", b" ")
+
+
+def _num(v: float) -> bytes:
+    if v == int(v):
+        return b"%d" % v
+    return (b"%.6f" % v).rstrip(b"0").rstrip(b".")
+
+
+class _PdfMerger:
+    """
+    Escritor de PDF por partes: copia las páginas de cada documento (y todo lo que cuelga de
+    ellas) renumerando los objetos, y al final escribe el árbol de páginas, los marcadores y
+    el xref. Lee los PDF con pdfminer (dependencia de pdfplumber); acepta object streams.
+    """
+
+    CATALOG, PAGES, OUTLINES = 1, 2, 3
+
+    def __init__(self):
+        from pdfminer.psparser import PSKeyword, PSLiteral
+        from pdfminer.pdftypes import PDFObjRef, PDFStream
+
+        self._types = PSLiteral, PSKeyword, PDFObjRef, PDFStream
+        self.pos = 0
+        self.offsets = array("Q", [0] * (self.OUTLINES + 1))  # índice = número de objeto
+        self.kids = array("L")
+        self.marks: List[Tuple[str, int]] = []  # (título, objeto de su primera página)
+
+    def _alloc(self) -> int:
+        self.offsets.append(0)
+        return len(self.offsets) - 1
+
+    def _emit(self, chunk: bytes) -> bytes:
+        self.pos += len(chunk)
+        return chunk
+
+    def _obj(self, num: int, body: bytes) -> bytes:
+        self.offsets[num] = self.pos
+        return self._emit(b"%d 0 obj\n%s\nendobj\n" % (num, body))
+
+    def _ser(self, o: Any, ref: Any) -> bytes:
+        literal, keyword, objref, stream = self._types
+        if isinstance(o, objref):
+            return b"%d 0 R" % ref(o.objid)
+        if isinstance(o, dict):
+            return b"<<" + b" ".join(_name(k) + b" " + self._ser(v, ref) for k, v in o.items()) + b">>"
+        if isinstance(o, (list, tuple)):
+            return b"[" + b" ".join(self._ser(v, ref) for v in o) + b"]"
+        if isinstance(o, literal):
+            return _name(o.name)
+        if isinstance(o, keyword):
+            return o.name if isinstance(o.name, bytes) else o.name.encode("latin-1")
+        if isinstance(o, bool):
+            return b"true" if o else b"false"
+        if isinstance(o, (int, float)):
+            return _num(o)
+        if isinstance(o, (bytes, bytearray)):
+            return b"<" + bytes(o).hex().encode("ascii") + b">"
+        if isinstance(o, str):
+            return _text(o)
+        if o is None:
+            return b"null"
+        if isinstance(o, stream):
+            data, attrs = (o.rawdata, dict(o.attrs)) if o.rawdata is not None else self._reencode(o)
+            attrs["Length"] = len(data)
+            return self._ser(attrs, ref) + b"\nstream\n" + data + b"\nendstream"
+        raise TypeError(f"objeto PDF no soportado: {type(o).__name__}")
+
+    @staticmethod
+    def _reencode(o: Any) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Un stream que pdfminer ya decodificó (rawdata None): sus filtros ya están aplicados,
+        salvo los de imagen que pdfminer deja pasar tal cual (DCT, JPX, JBIG2). Se conservan
+        esos y el resto se vuelve a comprimir con Flate.
+        """
+        from pdfminer.pdftypes import LITERALS_DCT_DECODE, LITERALS_JBIG2_DECODE, LITERALS_JPX_DECODE
+        from pdfminer.psparser import LIT
+
+        passthrough = LITERALS_DCT_DECODE + LITERALS_JBIG2_DECODE + LITERALS_JPX_DECODE
+        attrs = {k: v for k, v in o.attrs.items() if k not in ("Filter", "F", "DecodeParms", "DP", "DL")}
+        kept = [(f, params) for f, params in o.get_filters() if f in passthrough]
+        if kept:
+            attrs["Filter"] = [f for f, _ in kept]
+            if any(params for _, params in kept):
+                attrs["DecodeParms"] = [params or None for _, params in kept]
+            return o.data, attrs
+        attrs["Filter"] = LIT("FlateDecode")
+        return zlib.compress(o.data), attrs
+
+    def header(self) -> bytes:
+        return self._emit(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def add(self, data: bytes, title: str) -> bytes:
+        """
+        Los objetos de un documento, listos para escribir. Si el documento no se puede leer
+        no queda nada a medias: se deshace la numeración y se re-lanza el error.
+        """
+        mark = (len(self.offsets), self.pos, len(self.kids))
+        try:
+            return b"".join(self._copy(data, title))
+        except Exception:
+            n, self.pos, k = mark
+            del self.offsets[n:]
+            del self.kids[k:]
+            raise
+
+    def _copy(self, data: bytes, title: str) -> Iterator[bytes]:
+        from pdfminer.pdfdocument import PDFDocument
+        from pdfminer.pdfpage import PDFPage
+        from pdfminer.pdfparser import PDFParser
+
+        doc = PDFDocument(PDFParser(BytesIO(data)))
+        pages = list(PDFPage.create_pages(doc))
+        ids: Dict[int, int] = {}
+        pending: deque = deque()
+
+        def ref(objid: int) -> int:
+            num = ids.get(objid)
+            if num is None:
+                num = ids[objid] = self._alloc()
+                pending.append(objid)
+            return num
+
+        # las páginas se numeran antes: un link a otra página del mismo reporte la encuentra
+        for page in pages:
+            ids[page.pageid] = self._alloc()
+        page_ids = set(ids)
+        for page in pages:
+            # page.attrs ya trae lo heredado del árbol original (Resources, MediaBox...)
+            attrs = {k: v for k, v in page.attrs.items() if k != "Parent"}
+            body = self._ser(attrs, ref)[:-2] + b" /Parent %d 0 R>>" % self.PAGES
+            yield self._obj(ids[page.pageid], body)
+            self.kids.append(ids[page.pageid])
+        while pending:
+            objid = pending.popleft()
+            if objid in page_ids:
+                continue
+            yield self._obj(ids[objid], self._ser(doc.getobj(objid), ref))
+        if pages:
+            self.marks.append((title, ids[pages[0].pageid]))
+
+    def placeholder(self, title: str, error: str) -> bytes:
+        """
+        Una página A4 en lugar del reporte que no se pudo incluir, con su marcador: el
+        paquete no pierde el reporte en silencio.
+        """
+        page, content, font = self._alloc(), self._alloc(), self._alloc()
+        lines = [(14, "No se pudo incluir el reporte"), (11, title), (9, error[:160])]
+        text = b" ".join(b"/F1 %d Tf (%s) Tj 0 -22 Td" % (size, _pdf_str(line)) for size, line in lines)
+        data = b"BT 56 780 Td " + text + b" ET"
+        chunk = b"".join((
+            self._obj(page, b"<</Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+                            b"/Resources <</Font <</F1 %d 0 R>>>> /Contents %d 0 R>>" % (self.PAGES, font, content)),
+            self._obj(content, b"<</Length %d>>\nstream\n%s\nendstream" % (len(data), data)),
+            self._obj(font, b"<</Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding>>"),
+        ))
+        self.kids.append(page)
+        self.marks.append((f"{title} (error)", page))
+        return chunk
+
+    def trailer(self) -> Iterator[bytes]:
+        kids = self.kids
+        yield self._obj(self.PAGES, b"<</Type /Pages /Count %d /Kids [%s]>>" % (
+            len(kids), b" ".join(b"%d 0 R" % k for k in kids)))
+        # marcadores: uno por reporte, en orden, apuntando a su primera página
+        first = len(self.offsets)
+        nums = [self._alloc() for _ in self.marks]
+        for i, ((title, page), num) in enumerate(zip(self.marks, nums)):
+            links = b"".join((
+                b" /Prev %d 0 R" % nums[i - 1] if i else b"",
+                b" /Next %d 0 R" % nums[i + 1] if i + 1 < len(nums) else b"",
+            ))
+            yield self._obj(num, b"<</Title %s /Parent %d 0 R /Dest [%d 0 R /Fit]%s>>" % (
+                _text(title), self.OUTLINES, page, links))
+        outline = b"<</Type /Outlines /Count %d" % len(nums)
+        if nums:
+            outline += b" /First %d 0 R /Last %d 0 R" % (first, nums[-1])
+        yield self._obj(self.OUTLINES, outline + b">>")
+        yield self._obj(self.CATALOG, b"<</Type /Catalog /Pages %d 0 R /Outlines %d 0 R /PageMode /UseOutlines>>" % (
+            self.PAGES, self.OUTLINES))
+
+        start, size = self.pos, len(self.offsets)
+        yield self._emit(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for lo in range(1, size, 4096):
+            yield self._emit(b"".join(b"%010d 00000 n \n" % off for off in self.offsets[lo:lo + 4096]))
+        yield self._emit(b"trailer\n<</Size %d /Root %d 0 R>>\nstartxref\n%d\n%%%%EOF\n" % (size, self.CATALOG, start))
+
+
+def iter_merged_pdf(items: Iterable[BundleItem], pdf_mode: Optional[str] = None) -> Iterator[bytes]:
+    """
+    Un solo PDF por partes (un reporte por vez), con un marcador por reporte. Un reporte
+    que no se puede generar o leer se loguea, se cuenta (bundle_errors) y queda como una
+    página que lo nombra, con el marcador "<nombre> (error)".
+    """
+    merger = _PdfMerger()
+    yield merger.header()
+    for name, metrics, report in items:
+        try:
+            yield merger.add(_pdf_bytes(metrics, report, pdf_mode), name)
+        except Exception as e:
+            logger.warning("paquete PDF: no se pudo incluir %s: %s", name, e)
+            count("bundle_errors")
+            yield merger.placeholder(name, f"{type(e).__name__}: {e}")
+    yield from merger.trailer()
+
+
+def iter_bundle(items: Iterable[BundleItem], fmt: str = "zip", pdf_mode: Optional[str] = None) -> Iterator[bytes]:
+    if fmt == "zip":
+        return iter_zip_bundle(items, pdf_mode)
+    if fmt == "pdf":
+        return iter_merged_pdf(items, pdf_mode)
+    raise ValueError(f"formato de paquete desconocido: {fmt!r} (opciones: {', '.join(BUNDLE_FORMATS)})")
+
+
+@timed("bundle.write")
+def write_bundle(chunks: Iterable[bytes], path: str) -> int:
+    """
+    Escribe el paquete a disco a medida que se genera; devuelve los bytes escritos.
+    """
+    n = 0
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            n += len(chunk)
+    return n
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from engine.pdf_export import PDF_MODES
+
+    ap = argparse.ArgumentParser(description="Interlab IA – exportar muchos reportes en un ZIP o un PDF")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--db", help="historial SQLite (engine.store)")
+    src.add_argument("--dir", help="carpeta de salida de engine.batch")
+    ap.add_argument("--since", type=date.fromisoformat, help="desde (YYYY-MM-DD, fecha de toma; con --db)")
+    ap.add_argument("--until", type=date.fromisoformat, help="hasta (YYYY-MM-DD, inclusive; con --db)")
+    ap.add_argument("-o", "--out", required=True, help="archivo .zip o .pdf")
+    ap.add_argument("--format", choices=BUNDLE_FORMATS, default=None, help="default: por la extensión de --out")
+    ap.add_argument("--pdf-mode", choices=PDF_MODES, default=None, help="para los reportes que hay que renderizar")
+    args = ap.parse_args(argv)
+
+    fmt = args.format or ("pdf" if args.out.lower().endswith(".pdf") else "zip")
+    if args.db:
+        from engine.store import ResultStore
+        items = items_from_store(ResultStore(args.db), args.since, args.until)
+    else:
+        items = items_from_dir(args.dir)
+
+    t0 = time.perf_counter()
+    size = write_bundle(iter_bundle(items, fmt, args.pdf_mode), args.out)
+    print(f"{args.out}: {size / 1e6:.1f} MB en {time.perf_counter() - t0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
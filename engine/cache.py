@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import BinaryIO, Dict, Optional, Any, Callable
+
+from engine.parse_pdf import Obs, extract_streaming
+from engine.perf import count
+
+
+@dataclass
+class ParsedPDF:
+    # sin el texto completo: el cache (y cada sesión que lo usa) guarda solo lo que el reporte necesita
+    digest: str
+    patient: Dict[str, Any]
+    obs: Dict[str, Obs]
+
+
+def pdf_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def metrics_digest(metrics: Dict[str, Any]) -> str:
+    """
+    Hash estable del dict de métricas (JSON canónico: claves ordenadas, sin espacios).
+    """
+    payload = json.dumps(metrics, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def parse_pdf_file(f: BinaryIO, digest: str) -> ParsedPDF:
+    """
+    Pipeline completo de lectura (paciente + analitos) página por página desde un
+    archivo abierto (p.ej. una subida de engine.sessions), sin armar el texto completo.
+    """
+    patient, obs = extract_streaming(f)
+    return ParsedPDF(digest=digest, patient=patient, obs=obs)
+
+
+def parse_pdf_bytes(data: bytes, digest: Optional[str] = None) -> ParsedPDF:
+    """
+    Igual que parse_pdf_file, desde memoria.
+    """
+    return parse_pdf_file(BytesIO(data), digest or pdf_digest(data))
+
+
+class ParseCache:
+    """
+    Cache de PDFs ya parseados, por SHA-256 del contenido.
+    - Memoria: LRU con máximo de entradas.
+    - Disco (opcional): un pickle por digest en disk_dir.
+    Thread-safe (Streamlit atiende cada sesión en su propio hilo).
+    """
+
+    def __init__(self, max_entries: int = 64, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._mem: "OrderedDict[str, ParsedPDF]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._mem)
+
+    def _disk_path(self, digest: str) -> str:
+        return os.path.join(self.disk_dir, f"{digest}.pkl")
+
+    def _load_disk(self, digest: str) -> Optional[ParsedPDF]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(digest)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            # archivo corrupto / versión vieja: se ignora y se re-parsea
+            return None
+
+    def _save_disk(self, parsed: ParsedPDF) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(parsed.digest)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def _remember(self, parsed: ParsedPDF) -> None:
+        self._mem[parsed.digest] = parsed
+        self._mem.move_to_end(parsed.digest)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def get(self, digest: str) -> Optional[ParsedPDF]:
+        with self._lock:
+            parsed = self._mem.get(digest)
+            if parsed is not None:
+                self._mem.move_to_end(digest)
+                self.hits += 1
+                return parsed
+        parsed = self._load_disk(digest)
+        with self._lock:
+            if parsed is not None:
+                self._remember(parsed)
+                self.hits += 1
+            else:
+                self.misses += 1
+        return parsed
+
+    def put(self, parsed: ParsedPDF) -> None:
+        with self._lock:
+            self._remember(parsed)
+        self._save_disk(parsed)
+
+    def parse(self, data: bytes) -> ParsedPDF:
+        """
+        Devuelve el PDF parseado, usando el cache si ya se vio ese contenido.
+        """
+        return self.parse_file(BytesIO(data), pdf_digest(data))
+
+    def parse_file(self, f: BinaryIO, digest: str) -> ParsedPDF:
+        """
+        Igual que parse() con el hash ya calculado (engine.sessions lo calcula al recibir
+        la subida): si está en el cache no se vuelve a leer el archivo.
+        """
+        parsed = self.get(digest)
+        count("parse_cache_hit" if parsed is not None else "parse_cache_miss")
+        if parsed is None:
+            parsed = parse_pdf_file(f, digest)
+            self.put(parsed)
+        return parsed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+
+
+class RenderCache:
+    """
+    Memoiza un render caro (p.ej. métricas -> PDF) por hash de métricas.
+    submit() lo lanza en un hilo de fondo y vuelve enseguida; result() espera si hace falta.
+    Un solo worker por defecto: WeasyPrint no se comparte bien entre hilos.
+    """
+
+    def __init__(self, render: Callable[[Dict[str, Any]], bytes], max_entries: int = 32, workers: int = 1):
+        self.render = render
+        self.max_entries = max_entries
+        self._done: "OrderedDict[str, bytes]" = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+        self._errors: Dict[str, BaseException] = {}  # último fallo; submit() reintenta
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+
+    def _finish(self, digest: str, fut: Future) -> None:
+        with self._lock:
+            self._pending.pop(digest, None)
+            err = fut.exception()
+            if err is not None:
+                self._errors[digest] = err
+                return
+            self._done[digest] = fut.result()
+            while len(self._done) > self.max_entries:
+                self._done.popitem(last=False)
+
+    def submit(self, metrics: Dict[str, Any]) -> str:
+        digest = metrics_digest(metrics)
+        with self._lock:
+            if digest in self._done:
+                self._done.move_to_end(digest)
+                return digest
+            if digest in self._pending:
+                return digest
+            self._errors.pop(digest, None)
+            fut = self._pool.submit(self.render, metrics)
+            self._pending[digest] = fut
+        fut.add_done_callback(lambda f: self._finish(digest, f))
+        return digest
+
+    def preload(self, load: Callable[[], Any]) -> Future:
+        """
+        Corre `load` en el hilo de render (p.ej. importar WeasyPrint y parsear el CSS)
+        para que el primer render no lo pague. Los submit() posteriores esperan detrás.
+        """
+        return self._pool.submit(load)
+
+    def ready(self, digest: str) -> bool:
+        with self._lock:
+            return digest in self._done
+
+    def result(self, digest: str, timeout: Optional[float] = None) -> bytes:
+        """
+        Bytes ya generados, o espera al render en curso (re-lanza su excepción si falló).
+        """
+        with self._lock:
+            if digest in self._done:
+                return self._done[digest]
+            fut = self._pending.get(digest)
+            err = self._errors.get(digest)
+        if fut is None:
+            if err is not None:
+                raise err
+            raise KeyError(digest)
+        return fut.result(timeout)
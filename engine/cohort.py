@@ -0,0 +1,251 @@
+"""
+Scoring vectorizado para cohortes (muchos pacientes × analitos).
+
+Entrada en formato largo, una fila por observación:
+    patient_id | analyte | value | ref_low | ref_high
+Da los mismos resultados que flag / count_red_flags / inflammation_index /
+global_health_index / metabolic_age de engine.scores, pero con operaciones de arrays,
+sobre las mismas reglas compiladas (engine.rules): escaleras con np.digitize y rangos
+por sexo/edad con np.searchsorted.
+score_cohort acepta también una engine.obs_table.ObsTable.
+"""
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from engine.analytes import SYNONYMS, normalize_name
+from engine.obs_table import ObsTable
+from engine.rules import RuleSet, current_rules, sex_key
+
+def flags_vec(value: Any, low: Any, high: Any, rules: Optional[RuleSet] = None) -> np.ndarray:
+    """
+    Semáforo vectorizado (NaN = dato faltante). Devuelve array de 'green'/'yellow'/'red'/'gray'.
+    """
+    red_distance = (rules or current_rules()).red_distance
+    v = np.asarray(value, dtype=float)
+    lo = np.asarray(low, dtype=float)
+    hi = np.asarray(high, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        below = ~np.isnan(lo) & (v < lo)
+        above = ~below & ~np.isnan(hi) & (v > hi)
+        dist = np.where(
+            below,
+            (lo - v) / (np.abs(lo) + 1e-9),
+            (v - hi) / (np.abs(hi) + 1e-9),
+        )
+    missing = np.isnan(v) | (np.isnan(lo) & np.isnan(hi))
+    out_of_range = below | above
+    return np.select(
+        [missing, out_of_range & (dist > red_distance), out_of_range],
+        ["gray", "red", "yellow"],
+        default="green",
+    )
+
+
+def inflammation_vec(wide: pd.DataFrame, rules: Optional[RuleSet] = None) -> np.ndarray:
+    """
+    Suma de los términos de indices.inflammation; `wide` como en metabolic_years_vec.
+    """
+    rules = rules or current_rules()
+    col = lambda c: wide[c].to_numpy(dtype=float) if c in wide else np.full(len(wide), np.nan)
+    score = np.zeros(len(wide))
+    for term in rules.inflammation:
+        x = col(term.analyte)
+        use = ~np.isnan(x)
+        if term.unless is not None:
+            use &= np.isnan(col(term.unless))
+        s = (x + term.offset) * term.scale
+        if term.max is not None:
+            s = np.minimum(term.max, s)
+        if term.min is not None:
+            s = np.maximum(term.min, s)
+        score = score + np.where(use, s, 0.0)
+    lo, hi = rules.inflammation_bounds
+    return np.trunc(np.clip(score, lo, hi)).astype(int)
+
+
+def global_health_vec(infl: Any, red_flags: Any, rules: Optional[RuleSet] = None) -> np.ndarray:
+    base, w_infl, w_red, lo, hi = (rules or current_rules()).global_health
+    infl = np.asarray(infl)
+    red_flags = np.asarray(red_flags)
+    base = base - np.trunc(infl * w_infl) - np.trunc(red_flags * w_red)
+    return np.clip(base, lo, hi).astype(int)
+
+
+def metabolic_years_vec(wide: pd.DataFrame, rules: Optional[RuleSet] = None) -> np.ndarray:
+    """
+    Años extra por analito, sumados con np.digitize sobre las escaleras de las reglas.
+    `wide` tiene una columna por analito canónico (NaN si falta).
+    """
+    years = np.zeros(len(wide))
+    for ladder in (rules or current_rules()).metabolic:
+        if ladder.analyte not in wide:
+            continue
+        x = wide[ladder.analyte].to_numpy(dtype=float)
+        tramo = np.digitize(x, ladder.cuts, right=ladder.right)
+        years += np.where(np.isnan(x), 0, np.asarray(ladder.points, dtype=float)[tramo])
+    return years
+
+
+def metabolic_age_vec(age: Any, wide: pd.DataFrame, rules: Optional[RuleSet] = None) -> pd.array:
+    age = np.asarray(age, dtype=float)
+    out = np.round(age + metabolic_years_vec(wide, rules))
+    return pd.array(np.where(np.isnan(out), None, out), dtype="Int64")
+
+
+def reference_vec(
+    rules: RuleSet, canonical: str, sex: np.ndarray, age: np.ndarray, unit: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    RuleSet.reference para muchas filas de un analito: sex 'M'/'F'/None, age con NaN si falta.
+    Devuelve (low, high), NaN donde ninguna regla aplica.
+    """
+    n = len(age)
+    low, high = np.full(n, np.nan), np.full(n, np.nan)
+    found = np.zeros(n, dtype=bool)
+    units = np.array([normalize_name(u or "") for u in unit], dtype=object)
+    for g in rules.ranges.get(canonical, ()):
+        ok = ~found
+        if g.sex is not None:
+            ok &= sex == g.sex
+        if g.units:
+            ok &= np.isin(units, list(g.units))
+        if len(g.ages) == 1:
+            band = np.zeros(n, dtype=int)
+        else:
+            ok &= ~np.isnan(age)
+            band = np.searchsorted(g.ages, np.nan_to_num(age, nan=-np.inf), side="right") - 1
+        ok &= band >= 0
+        band = np.maximum(band, 0)
+        lows = np.array([np.nan if v is None else v for v in g.lows])
+        highs = np.array([np.nan if v is None else v for v in g.highs])
+        low = np.where(ok, lows[band], low)
+        high = np.where(ok, highs[band], high)
+        found |= ok
+    return low, high
+
+
+def _synonym_table(names: Iterable[str]) -> pd.DataFrame:
+    """
+    Para cada nombre crudo distinto: (canónico, prioridad del fragmento) con que calza.
+    Se recorre el vocabulario de nombres, no las filas.
+    """
+    rows = []
+    for name in names:
+        n = normalize_name(name)
+        for canonical, fragments in SYNONYMS.items():
+            for rank, frag in enumerate(fragments):
+                if frag in n:
+                    rows.append((name, canonical, rank))
+                    break
+    return pd.DataFrame(rows, columns=["analyte", "canonical", "rank"])
+
+
+def _canonical_rows(long_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    La fila que representa a cada (paciente, analito canónico), resolviendo igual que
+    AnalyteIndex: primero el fragmento de mayor prioridad, después el orden de aparición.
+    Columnas: patient_id, canonical, value y _pos (posición de la fila en long_df).
+    """
+    df = long_df[["patient_id", "analyte", "value"]].copy()
+    df["_pos"] = np.arange(len(df))
+    syn = _synonym_table(df["analyte"].unique())
+    m = df.merge(syn, on="analyte", how="inner")
+    m = m.sort_values(["patient_id", "canonical", "rank", "_pos"], kind="stable")
+    return m.drop_duplicates(["patient_id", "canonical"], keep="first")
+
+
+def canonical_wide(long_df: pd.DataFrame, rows: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    Pivotea a una columna por analito canónico (ver _canonical_rows).
+    """
+    m = _canonical_rows(long_df) if rows is None else rows
+    wide = m.pivot(index="patient_id", columns="canonical", values="value")
+    return wide.reindex(pd.unique(long_df["patient_id"]))
+
+
+def _fill_rule_ranges(long_df: pd.DataFrame, rows: pd.DataFrame, patients: Optional[pd.DataFrame], rules: RuleSet) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ref_low / ref_high de long_df completados con las reglas donde el PDF no trae referencia
+    (solo en la fila canónica de cada analito, como engine.scores.build_metrics).
+    """
+    low = long_df["ref_low"].to_numpy(dtype=float, copy=True)
+    high = long_df["ref_high"].to_numpy(dtype=float, copy=True)
+    if not rules.ranges:
+        return low, high
+    rows = rows[rows["canonical"].isin(list(rules.ranges))]
+    pos = rows["_pos"].to_numpy()
+    rows = rows[np.isnan(low[pos]) & np.isnan(high[pos])]
+    if rows.empty:
+        return low, high
+
+    def _patient_col(name: str, dtype: Any) -> np.ndarray:
+        if patients is None or name not in patients:
+            return np.full(len(rows), np.nan if dtype is float else None, dtype=dtype)
+        return patients[name].reindex(rows["patient_id"]).to_numpy(dtype=dtype)
+
+    age = _patient_col("age", float)
+    sex = np.array([sex_key(s) if isinstance(s, str) else None for s in _patient_col("sex", object)], dtype=object)
+    unit = long_df["unit"].to_numpy(dtype=object)[rows["_pos"].to_numpy()] if "unit" in long_df else np.full(len(rows), "", dtype=object)
+    canon = rows["canonical"].to_numpy()
+    pos = rows["_pos"].to_numpy()
+    for canonical in pd.unique(canon):
+        sel = canon == canonical
+        lo, hi = reference_vec(rules, canonical, sex[sel], age[sel], unit[sel])
+        low[pos[sel]] = lo
+        high[pos[sel]] = hi
+    return low, high
+
+
+def score_cohort(long_df: Any, patients: Optional[pd.DataFrame] = None, rules: Optional[RuleSet] = None) -> pd.DataFrame:
+    """
+    Re-score de una cohorte completa.
+    long_df: patient_id, analyte, value, ref_low, ref_high y opcional unit (o una ObsTable)
+    patients (opcional): indexado por patient_id, con columnas 'age' y/o 'sex'
+    (eligen los rangos de las reglas para analitos sin referencia).
+    Devuelve un DataFrame por paciente: red_flags, inflammation, global_health, metabolic_age.
+    """
+    rules = rules or current_rules()
+    if isinstance(long_df, ObsTable):
+        long_df = long_df.to_frame()
+    # como en el dict de Obs: un nombre repetido en el mismo reporte se queda con el último valor
+    long_df = long_df.drop_duplicates(["patient_id", "analyte"], keep="last")
+
+    rows = _canonical_rows(long_df)
+    low, high = _fill_rule_ranges(long_df, rows, patients, rules)
+    flags = flags_vec(long_df["value"], low, high, rules)
+    pids = pd.unique(long_df["patient_id"])
+    reds = (
+        pd.Series(flags == "red", index=long_df.index)
+        .groupby(long_df["patient_id"].to_numpy(), sort=False)
+        .sum()
+        .reindex(pids, fill_value=0)
+        .to_numpy()
+    )
+
+    wide = canonical_wide(long_df, rows)
+    infl = inflammation_vec(wide, rules)
+
+    if patients is not None and "age" in patients:
+        age = patients["age"].reindex(pids).to_numpy(dtype=float)
+    else:
+        age = np.full(len(pids), np.nan)
+
+    return pd.DataFrame(
+        {
+            "red_flags": reds.astype(int),
+            "inflammation": infl,
+            "global_health": global_health_vec(infl, reds, rules),
+            "metabolic_age": metabolic_age_vec(age, wide, rules),
+        },
+        index=pd.Index(pids, name="patient_id"),
+    )
+
+
+def obs_to_long(reports: Iterable[Tuple[Any, Dict[str, Any]]]) -> pd.DataFrame:
+    """
+    [(patient_id, obs), ...] -> DataFrame largo para score_cohort.
+    Pasa por ObsTable: sin una tupla de Python por fila.
+    """
+    return ObsTable.from_reports(reports).to_frame()[["patient_id", "analyte", "value", "ref_low", "ref_high", "unit"]]
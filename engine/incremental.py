@@ -0,0 +1,171 @@
+"""
+Re-score incremental para correcciones en la vista de auditoría.
+
+IncrementalReport arranca con build_metrics + el HTML por secciones y, al corregir una
+observación, recorre el grafo de dependencias:
+
+    observación -> fila de la tabla de analitos
+                -> conteo de banderas -> red_flags / urgency
+                -> índices que leen ese analito (RuleSet.index_inputs)
+    edad / sexo -> filas con rango de las reglas (engine.rules) o percentil poblacional
+                   (engine.population) + metabolic_age
+    inflammation + red_flags -> global_health
+    claves de métricas cambiadas -> secciones del HTML (report_html.SECTION_INPUTS)
+
+El reporte queda atado a la versión de reglas y a la referencia poblacional con que se
+armó (`rules`, `population`).
+
+Solo se recalcula y se re-renderiza lo que cambió; el resultado es el mismo que
+volver a correr build_metrics + render_report_html sobre las observaciones corregidas.
+"""
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Set
+
+from engine.analytes import AnalyteIndex
+from engine.parse_pdf import Obs
+from engine.perf import count
+from engine.population import Reference, current_population
+from engine.report_html import (
+    SECTION_INPUTS,
+    assemble_report_html,
+    render_analyte_row,
+    render_analytes,
+    render_section,
+    render_sections,
+)
+from engine.rules import RuleSet, current_rules
+from engine.scores import (
+    analyte_row,
+    build_metrics,
+    global_health_index,
+    inflammation_index,
+    metabolic_age,
+    urgency_level,
+)
+
+OBS_FIELDS = ("value", "unit", "ref_text", "ref_low", "ref_high")
+
+
+class IncrementalReport:
+    def __init__(
+        self,
+        obs: Dict[str, Obs],
+        patient: Optional[Dict[str, Any]] = None,
+        rules: Optional[RuleSet] = None,
+        population: Optional[Reference] = None,
+    ):
+        self.obs: Dict[str, Obs] = dict(obs)
+        self.patient: Dict[str, Any] = dict(patient or {})
+        self.rules = rules or current_rules()
+        self.population = population if population is not None else current_population()
+        self.index = AnalyteIndex(self.obs)  # mismo dict: ve los valores corregidos
+        self.metrics = build_metrics(self.obs, self.patient, self.rules, self.population)
+        self._canonical = {raw: c for c, raw in self.index.matches.items()}
+        self._position = {a["name"]: i for i, a in enumerate(self.metrics["analytes"])}
+        flags = [a["flag"] for a in self.metrics["analytes"]]
+        self._reds = sum(1 for f in flags if f in ("high", "low"))
+        self._borderline = flags.count("borderline")
+        self._rows: List[str] = [render_analyte_row(a) for a in self.metrics["analytes"]]
+        self.sections = render_sections(self.metrics)
+
+    @property
+    def html(self) -> str:
+        return assemble_report_html(self.sections)
+
+    def edit(self, name: str, **changes: Any) -> Set[str]:
+        """
+        Corrige la observación `name` (value, unit, ref_text, ref_low, ref_high).
+        Devuelve las secciones del HTML que se re-renderizaron (vacío si no cambió nada).
+        """
+        unknown = set(changes) - set(OBS_FIELDS)
+        if unknown:
+            raise ValueError(f"campos no editables: {sorted(unknown)}")
+        old = self.obs[name]
+        new = replace(old, **changes)
+        if new == old:
+            return set()
+        self.obs[name] = new
+        # copia superficial: quien tenga el dict anterior (p.ej. un PDF en segundo plano) no lo ve cambiar
+        self.metrics = {**self.metrics, "analytes": list(self.metrics["analytes"])}
+        changed = {"analytes"} if self._update_row(name) else set()
+        canonical = self._canonical.get(name)
+        return self._rescore(changed, {canonical} if canonical else set())
+
+    def edit_patient(self, **changes: Any) -> Set[str]:
+        """
+        Corrige edad/sexo/nombre del paciente. La edad alimenta metabolic_age; edad y sexo
+        eligen los rangos de las reglas de los analitos que no traen referencia y el grupo
+        poblacional de los percentiles.
+        """
+        patient = {**self.patient, **changes}
+        if patient == self.patient:
+            return set()
+        self.patient = patient
+        self.metrics = {
+            **self.metrics,
+            "patient": {k: patient.get(k) for k in ("name", "age", "sex")},
+            "analytes": list(self.metrics["analytes"]),
+        }
+        changed = {"patient"}
+        if "age" in changes or "sex" in changes:
+            for name, canonical in self._canonical.items():
+                if (canonical in self.rules.ranges or self.population is not None) and self._update_row(name):
+                    changed.add("analytes")
+        return self._rescore(changed, set(), age_changed="age" in changes)
+
+    def _update_row(self, name: str) -> bool:
+        """
+        Recalcula la fila de `name` y el conteo de banderas. True si la fila cambió.
+        """
+        i = self._position[name]
+        old_row = self.metrics["analytes"][i]
+        row = analyte_row(name, self.obs[name], self._canonical.get(name), self.patient, self.rules, self.population)
+        if row == old_row:
+            return False
+        self.metrics["analytes"][i] = row
+        self._rows[i] = render_analyte_row(row)
+        for flag, sign in ((old_row["flag"], -1), (row["flag"], 1)):
+            if flag in ("high", "low"):
+                self._reds += sign
+            elif flag == "borderline":
+                self._borderline += sign
+        return True
+
+    def _rescore(self, changed: Set[str], inputs: Set[str], age_changed: bool = False) -> Set[str]:
+        """
+        red_flags / urgency y los índices que leen `inputs` (analitos canónicos corregidos).
+        """
+        if self._reds != self.metrics["red_flags"]:
+            self.metrics["red_flags"] = self._reds
+            changed.add("red_flags")
+        urgency = urgency_level(self._reds, self._borderline, self.rules)
+        if urgency != self.metrics["urgency"]:
+            self.metrics["urgency"] = urgency
+            changed.add("urgency")
+
+        indices = dict(self.metrics["indices"])
+        reads = self.rules.index_inputs
+        if inputs & reads["inflammation"]:
+            count("rescore_index")
+            indices["inflammation"] = inflammation_index(self.index, self.rules)
+        if inputs & reads["metabolic_age"] or age_changed:
+            count("rescore_index")
+            indices["metabolic_age"] = metabolic_age(self.patient.get("age"), self.index, self.rules)
+        if indices["inflammation"] != self.metrics["indices"]["inflammation"] or "red_flags" in changed:
+            count("rescore_index")
+            indices["global_health"] = global_health_index(indices["inflammation"], self._reds, self.rules)
+        if indices != self.metrics["indices"]:
+            self.metrics["indices"] = indices
+            changed.add("indices")
+        return self._rerender(changed)
+
+    def _rerender(self, changed: Set[str]) -> Set[str]:
+        dirty = {s for s, inputs in SECTION_INPUTS.items() if changed.intersection(inputs)}
+        for s in dirty:
+            count("rerender_section")
+            if s == "analytes":
+                # solo las filas corregidas se volvieron a renderizar; aquí se vuelve a unir la tabla
+                self.sections[s] = render_analytes(self.metrics, self._rows)
+            else:
+                self.sections[s] = render_section(s, self.metrics)
+        return dirty
@@ -0,0 +1,195 @@
+"""
+Cola de trabajos acotada para generar reportes fuera de la UI (la usa api.py).
+
+- submit() encola o lanza QueueFull si ya hay max_queued esperando (backpressure).
+- N hilos despachadores toman trabajos y los corren en un ProcessPoolExecutor.
+- Cada trabajo tiene un ID, estado (queued/running/done/error) y un Event para esperar.
+- De los trabajos terminados se guardan como máximo keep_finished, y sus resultados
+  (HTML + PDF) no pasan de keep_bytes en total: los más viejos se descartan primero.
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Dict, Any, Optional
+
+from engine.parse_pdf import extract_streaming
+from engine.perf import Trace
+from engine.report_html import render_report_html
+from engine.scores import build_metrics
+
+QueueFull = queue.Full
+
+
+def run_report(data: bytes, want_pdf: bool = False, pdf_mode: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Pipeline completo desde bytes (corre en un proceso worker).
+    """
+    with Trace("api.job") as tr:
+        patient, obs = extract_streaming(BytesIO(data))
+        metrics = build_metrics(obs, patient)
+        html = render_report_html(metrics)
+        pdf = None
+        if want_pdf:
+            from engine.pdf_export import metrics_to_pdf
+            pdf = metrics_to_pdf(metrics, pdf_mode)
+    return {"metrics": metrics, "html": html, "pdf": pdf, "perf": tr.as_dict()}
+
+
+@dataclass
+class Job:
+    id: str
+    want_pdf: bool
+    pdf_mode: Optional[str] = None
+    status: str = "queued"
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    size: int = 0  # bytes del resultado que quedan en memoria (HTML + PDF)
+    data: Optional[bytes] = field(default=None, repr=False)
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "pdf": self.want_pdf,
+            "pdf_mode": self.pdf_mode,
+        }
+
+
+def _result_size(result: Optional[Dict[str, Any]]) -> int:
+    if not result:
+        return 0
+    return len(result.get("html") or "") + len(result.get("pdf") or b"")
+
+
+class JobQueue:
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_queued: int = 32,
+        keep_finished: int = 500,
+        keep_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.keep_finished = keep_finished
+        self.keep_bytes = keep_bytes
+        self._q: "queue.Queue[Optional[Job]]" = queue.Queue(maxsize=max_queued)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._running = 0
+        self._kept_bytes = 0
+        self._threads = [
+            threading.Thread(target=self._dispatch, name=f"job-dispatch-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, data: bytes, want_pdf: bool = False, pdf_mode: Optional[str] = None) -> Job:
+        job = Job(id=uuid.uuid4().hex, want_pdf=want_pdf, pdf_mode=pdf_mode, data=data)
+        # primero en la tabla: un despachador puede tomarlo (y terminarlo) apenas entra a la cola
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._q.put_nowait(job)  # QueueFull si está lleno
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            finished = sum(1 for j in self._jobs.values() if j.status in ("done", "error"))
+            return {
+                "workers": self.workers,
+                "queued": self._q.qsize(),
+                "max_queued": self._q.maxsize,
+                "running": self._running,
+                "finished": finished,
+                "kept_bytes": self._kept_bytes,
+            }
+
+    def _dispatch(self) -> None:
+        while True:
+            job = self._q.get()
+            if job is None:
+                return
+            with self._lock:
+                self._running += 1
+            job.status = "running"
+            job.started = time.time()
+            try:
+                job.result = self._pool.submit(run_report, job.data, job.want_pdf, job.pdf_mode).result()
+                job.status = "done"
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = "error"
+            finally:
+                job.data = None  # el PDF original ya no hace falta
+                job.finished = time.time()
+                job.size = _result_size(job.result)
+                with self._lock:
+                    self._running -= 1
+                    self._kept_bytes += job.size
+                    self._evict(keep=job.id)
+                job.done.set()
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """
+        Descarta terminados, del más viejo (por orden de envío) al más nuevo. `keep` es el
+        que acaba de terminar y se guarda siempre: quien lo espera con wait() todavía no lo
+        leyó, aunque otro enviado después haya terminado antes.
+        """
+        finished = [k for k, j in self._jobs.items() if j.status in ("done", "error") and k != keep]
+        excess = max(0, len(finished) + (keep is not None) - self.keep_finished)
+        for k in finished:
+            if excess <= 0 and self._kept_bytes <= self.keep_bytes:
+                break
+            self._kept_bytes -= self._jobs.pop(k).size
+            excess -= 1
+
+    def shutdown(self) -> None:
+        # los trabajos que seguían en cola se cancelan: con la cola llena, put() se quedaría
+        # esperando a un despachador que nunca la vacía
+        while True:
+            try:
+                job = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job.status = "error"
+                job.error = "cancelado: el servidor se está apagando"
+                job.data = None
+                job.finished = time.time()
+                job.done.set()
+        for _ in self._threads:
+            try:
+                self._q.put_nowait(None)
+            except queue.Full:  # un submit se coló: los hilos son daemon, no traban la salida
+                break
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,203 @@
+"""
+Extracción por geometría para reportes en tabla (pdfplumber.extract_words).
+
+En vez de aplanar la página a texto y adivinar columnas con una regex, se usa la
+posición x de cada palabra:
+- la fila de encabezado ('NOMBRE DE ESTUDIO  RESULTADO  UNIDAD  REFERENCIA') define
+  las columnas; si el encabezado se repite en la misma fila hay varias tablas lado a lado,
+- el layout se cachea por huella del encabezado (textos + posiciones), así cada plantilla
+  de laboratorio se aprende una sola vez,
+- con el layout conocido cada fila se reparte en celdas en una pasada (bisect sobre los
+  límites de columna); las filas sin número en la columna de resultado no tocan regex.
+"""
+import hashlib
+import re
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from engine.analytes import normalize_name
+from engine.perf import count
+
+Row = List[Dict[str, Any]]  # palabras de pdfplumber de una misma línea, ordenadas por x0
+Cells = Tuple[str, str, str, str]  # (nombre, valor, unidad, referencia) como texto
+
+ROW_TOLERANCE = 3.0  # diferencia máxima de 'top' entre palabras de una misma fila
+COLUMN_SLACK = 6.0   # margen a la izquierda del encabezado (números alineados a la derecha)
+MIN_TABULAR = 0.5    # fracción mínima de filas con celdas válidas para aceptar el layout
+
+# Palabra del encabezado (normalizada) -> rol de la columna
+HEADER_KEYWORDS: Dict[str, str] = {
+    "estudio": "name", "analito": "name", "prueba": "name", "examen": "name", "determinacion": "name",
+    "resultado": "value", "resultados": "value", "valor": "value",
+    "unidad": "unit", "unidades": "unit",
+    "referencia": "ref", "rango": "ref", "valores": "ref",
+}
+_HEADER_UPPER = frozenset(k.upper() for k in HEADER_KEYWORDS)
+
+# Token de resultado: '243', '4,5', '4', '590', '<0.5'
+_NUMERIC = re.compile(r"^[<>]?[-+]?\d[\d.,]*$").match
+
+
+@dataclass(frozen=True)
+class Column:
+    role: str   # name / value / unit / ref
+    group: int  # tabla (0, 1, ... si hay varias lado a lado)
+    x0: float   # inicio del texto del encabezado
+    x1: float   # fin del texto del encabezado
+
+
+@dataclass(frozen=True)
+class TableLayout:
+    fingerprint: str
+    columns: Tuple[Column, ...]
+    bounds: Tuple[float, ...]  # límite izquierdo de cada columna (el primero es -inf)
+    groups: int
+
+    def cells(self, row: Row) -> List[Cells]:
+        """
+        Reparte una fila en celdas. Devuelve una tupla por tabla con nombre y resultado
+        numérico; las filas de texto corrido (notas, firmas) no pasan el filtro.
+        """
+        parts: List[Dict[str, List[str]]] = [{} for _ in range(self.groups)]
+        for w in row:
+            col = self.columns[bisect_right(self.bounds, w["x0"]) - 1]
+            parts[col.group].setdefault(col.role, []).append(w["text"])
+
+        out: List[Cells] = []
+        for p in parts:
+            name, value = p.get("name"), p.get("value")
+            if not name or not value or not all(_NUMERIC(v) for v in value):
+                continue
+            unit, ref = p.get("unit", ()), p.get("ref", ())
+            if not unit and not ref:
+                continue
+            out.append((" ".join(name), " ".join(value), " ".join(unit), " ".join(ref)))
+        return out
+
+
+def group_rows(words: List[Dict[str, Any]]) -> List[Row]:
+    """
+    Agrupa las palabras en filas por su 'top' (con tolerancia) y las ordena por x.
+    """
+    rows: List[Row] = []
+    top = None
+    for w in sorted(words, key=lambda w: (w["top"], w["x0"])):
+        if top is not None and w["top"] - top <= ROW_TOLERANCE:
+            rows[-1].append(w)
+        else:
+            rows.append([w])
+            top = w["top"]
+    for r in rows:
+        r.sort(key=lambda w: w["x0"])
+    return rows
+
+
+def rows_text(rows: List[Row]) -> str:
+    """
+    Texto de la página reconstruido desde las filas (equivale a extract_text sin layout).
+    """
+    return "\n".join(" ".join(w["text"] for w in r) for r in rows)
+
+
+def _header_columns(row: Row) -> Optional[List[Column]]:
+    # barato: la mayoría de las filas no tiene ninguna palabra de encabezado
+    if not any(w["text"].upper().strip(":") in _HEADER_UPPER for w in row):
+        return None
+
+    cols: List[Column] = []
+    group = 0
+    start = None
+    for w in row:
+        if start is None:
+            start = w["x0"]
+        role = HEADER_KEYWORDS.get(normalize_name(w["text"]))
+        if role is None:
+            continue  # 'NOMBRE DE' se suma a la columna de la palabra clave que sigue
+        last = cols[-1] if cols else None
+        if last is not None and last.group == group and last.role == role:
+            cols[-1] = Column(role, group, last.x0, w["x1"])  # 'VALORES DE REFERENCIA'
+        else:
+            if role == "name" and any(c.group == group for c in cols):
+                group += 1
+            cols.append(Column(role, group, start, w["x1"]))
+        start = None
+
+    roles = {c.role for c in cols}
+    if len(cols) < 3 or not {"name", "value"} <= roles:
+        return None
+    return cols
+
+
+def _fingerprint(row: Row) -> str:
+    key = "|".join(f"{w['text']}@{round(w['x0'])}" for w in row)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _build_layout(fingerprint: str, cols: List[Column]) -> TableLayout:
+    bounds = [float("-inf")]
+    for prev, cur in zip(cols, cols[1:]):
+        bounds.append(cur.x0 - min(COLUMN_SLACK, max(0.0, cur.x0 - prev.x1) / 2))
+    return TableLayout(fingerprint, tuple(cols), tuple(bounds), cols[-1].group + 1)
+
+
+def _is_tabular(rows: List[Row], layout: TableLayout) -> bool:
+    """
+    Un encabezado con estas palabras no garantiza una tabla: en PDFs de texto corrido
+    las filas no caen alineadas bajo el encabezado. Se acepta el layout solo si la mayoría
+    de las filas con algo en la columna de resultado dan celdas válidas.
+    """
+    value_cols = {i for i, c in enumerate(layout.columns) if c.role == "value"}
+    candidates = ok = 0
+    for row in rows:
+        if not any(bisect_right(layout.bounds, w["x0"]) - 1 in value_cols for w in row):
+            continue
+        candidates += 1
+        if layout.cells(row):
+            ok += 1
+    return ok > 0 and ok >= MIN_TABULAR * candidates
+
+
+# Cache de layouts por huella del encabezado (LRU). None = "esta plantilla no es tabla".
+_LAYOUTS: "OrderedDict[str, Optional[TableLayout]]" = OrderedDict()
+_LAYOUTS_MAX = 128
+_LAYOUTS_LOCK = threading.Lock()
+
+
+def clear_layout_cache() -> None:
+    with _LAYOUTS_LOCK:
+        _LAYOUTS.clear()
+
+
+def match_layout(rows: List[Row], previous: Optional[TableLayout] = None) -> Tuple[Optional[TableLayout], int]:
+    """
+    Layout para esta página y el índice de la primera fila de datos.
+    Si la página no tiene encabezado (continuación) sigue valiendo el de la página anterior.
+    """
+    for i, row in enumerate(rows):
+        cols = _header_columns(row)
+        if cols is None:
+            continue
+        fp = _fingerprint(row)
+        with _LAYOUTS_LOCK:
+            if fp in _LAYOUTS:
+                _LAYOUTS.move_to_end(fp)
+                count("layout_cache_hit")
+                return _LAYOUTS[fp], i + 1
+        count("layout_cache_miss")
+        layout: Optional[TableLayout] = _build_layout(fp, cols)
+        if not _is_tabular(rows[i + 1:], layout):
+            layout = None
+        with _LAYOUTS_LOCK:
+            _LAYOUTS[fp] = layout
+            while len(_LAYOUTS) > _LAYOUTS_MAX:
+                _LAYOUTS.popitem(last=False)
+        return layout, i + 1
+    return previous, 0
+
+
+def iter_cells(rows: List[Row], layout: TableLayout) -> Iterator[Cells]:
+    for row in rows:
+        yield from layout.cells(row)
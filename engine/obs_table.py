@@ -0,0 +1,180 @@
+"""
+Almacenamiento compacto de observaciones (cohortes con millones de filas).
+
+ObsTable guarda cada campo en su propia columna en vez de un objeto por fila:
+- value / ref_low / ref_high: array('d') (None se guarda como NaN),
+- nombre, unidad, referencia y paciente: códigos array('i') sobre un vocabulario,
+  así cada texto distinto se guarda una sola vez.
+Para un reporte se comporta como el dict {nombre: Obs} (las funciones de engine.scores
+la aceptan tal cual) y to_frame() la pasa a pandas sin copiar las columnas numéricas.
+"""
+import math
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from engine.parse_pdf import Obs
+
+_NAN = float("nan")
+
+
+class _Vocab:
+    """
+    Texto (o id de paciente) <-> código entero.
+    """
+    __slots__ = ("items", "codes")
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.codes: Dict[Any, int] = {}
+
+    def code(self, item: Any) -> int:
+        c = self.codes.get(item)
+        if c is None:
+            c = self.codes[item] = len(self.items)
+            self.items.append(item)
+        return c
+
+
+def _nan(x: Optional[float]) -> float:
+    return _NAN if x is None else x
+
+
+def _none(x: float) -> Optional[float]:
+    return None if math.isnan(x) else x
+
+
+class ObsTable(Mapping):
+    """
+    Observaciones en columnas. La vista de dict (obs[nombre], obs.items(), len(obs))
+    es la de un reporte: si un nombre se repite gana la última fila, como en el dict de Obs.
+    Con varios pacientes usar report(pid) o to_frame() / engine.cohort.score_cohort.
+    """
+
+    def __init__(self):
+        self.value = array("d")
+        self.ref_low = array("d")
+        self.ref_high = array("d")
+        self.name = array("i")
+        self.unit = array("i")
+        self.ref_text = array("i")
+        self.patient = array("i")
+        self._strings = _Vocab()  # nombres, unidades y referencias comparten vocabulario
+        self._patients = _Vocab()
+        self._last: Dict[int, int] = {}  # código de nombre -> última fila
+
+    # --- carga ---
+    def append(self, o: Obs, patient_id: Any = None) -> None:
+        code = self._strings.code
+        row = len(self.value)
+        self.value.append(_nan(o.value))
+        self.ref_low.append(_nan(o.ref_low))
+        self.ref_high.append(_nan(o.ref_high))
+        self.name.append(code(o.key))
+        self.unit.append(code(o.unit))
+        self.ref_text.append(code(o.ref_text))
+        self.patient.append(self._patients.code(patient_id))
+        self._last[self.name[row]] = row
+
+    def extend(self, obs: Any, patient_id: Any = None) -> None:
+        """
+        Agrega un reporte: un dict {nombre: Obs} o un iterable de Obs.
+        """
+        for o in (obs.values() if isinstance(obs, Mapping) else obs):
+            self.append(o, patient_id)
+
+    @classmethod
+    def from_obs(cls, obs: Any, patient_id: Any = None) -> "ObsTable":
+        table = cls()
+        table.extend(obs, patient_id)
+        return table
+
+    @classmethod
+    def from_reports(cls, reports: Iterable[Tuple[Any, Any]]) -> "ObsTable":
+        """
+        [(patient_id, obs), ...] -> una tabla con todas las filas.
+        """
+        table = cls()
+        for pid, obs in reports:
+            table.extend(obs, pid)
+        return table
+
+    # --- filas ---
+    @property
+    def n_rows(self) -> int:
+        return len(self.value)
+
+    def row(self, i: int) -> Obs:
+        s = self._strings.items
+        return Obs(
+            key=s[self.name[i]],
+            value=_none(self.value[i]),
+            unit=s[self.unit[i]],
+            ref_text=s[self.ref_text[i]],
+            ref_low=_none(self.ref_low[i]),
+            ref_high=_none(self.ref_high[i]),
+        )
+
+    def patients(self) -> List[Any]:
+        return list(self._patients.items)
+
+    def report(self, patient_id: Any) -> "ObsTable":
+        """
+        Las filas de un paciente, como tabla propia (para build_metrics).
+        """
+        out = ObsTable()
+        code = self._patients.codes.get(patient_id)
+        for i, p in enumerate(self.patient):
+            if p == code:
+                out.append(self.row(i), patient_id)
+        return out
+
+    # --- vista dict {nombre: Obs} ---
+    def __getitem__(self, key: str) -> Obs:
+        code = self._strings.codes.get(key)
+        row = self._last.get(code) if code is not None else None
+        if row is None:
+            raise KeyError(key)
+        return self.row(row)
+
+    def __iter__(self) -> Iterator[str]:
+        s = self._strings.items
+        return (s[c] for c in self._last)
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+    # --- pandas ---
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Formato largo de engine.cohort (patient_id, analyte, value, ref_low, ref_high)
+        más unit y ref_text. value/ref_low/ref_high son vistas sobre los array('d')
+        (sin copia: no modificar la tabla mientras se usa el DataFrame); los textos
+        quedan como Categorical sobre el vocabulario.
+        """
+        strings = pd.Index(self._strings.items, dtype=object)
+        cat = lambda codes: pd.Categorical.from_codes(np.frombuffer(codes, dtype=np.int32), categories=strings)
+        patients = np.empty(len(self._patients.items), dtype=object)
+        patients[:] = self._patients.items
+        return pd.DataFrame(
+            {
+                "patient_id": patients[np.frombuffer(self.patient, dtype=np.int32)],
+                "analyte": cat(self.name),
+                "value": np.frombuffer(self.value),
+                "ref_low": np.frombuffer(self.ref_low),
+                "ref_high": np.frombuffer(self.ref_high),
+                "unit": cat(self.unit),
+                "ref_text": cat(self.ref_text),
+            },
+            copy=False,
+        )
+
+    def nbytes(self) -> int:
+        """
+        Memoria aproximada de las columnas (sin contar el vocabulario).
+        """
+        cols = (self.value, self.ref_low, self.ref_high, self.name, self.unit, self.ref_text, self.patient)
+        return sum(c.itemsize * len(c) for c in cols)
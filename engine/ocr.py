@@ -0,0 +1,313 @@
+"""
+OCR de respaldo para páginas escaneadas (sin capa de texto).
+
+- Solo entra en páginas sin texto extraíble y con imágenes; el resto no paga nada.
+- Rasteriza (pypdfium2, ya viene con pdfplumber) y reconoce (Tesseract vía pytesseract)
+  en un ProcessPoolExecutor, varias páginas en paralelo. Los workers reciben la ruta del
+  PDF (PdfSource.shared), no sus bytes.
+- Cache por hash de la página (bytes de sus imágenes + tamaño + idioma/dpi): el mismo
+  escaneo no se vuelve a reconocer. En memoria y, opcional, en disco.
+- OrderedPages mantiene el orden de las páginas mientras el OCR corre de fondo.
+
+Configuración por variables de entorno:
+    INTERLAB_OCR=0             desactiva el OCR
+    INTERLAB_OCR_LANG=spa      idioma de Tesseract
+    INTERLAB_OCR_DPI=300
+    INTERLAB_OCR_WORKERS=4     procesos (default: núcleos; 0 = en el mismo proceso)
+    INTERLAB_OCR_CACHE_DIR=... cache en disco
+Sin pytesseract o sin el binario tesseract el OCR queda apagado (las páginas siguen vacías).
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, BinaryIO, Callable, Deque, Iterator, Optional, Tuple, Union
+
+from engine.perf import count, stage
+
+logger = logging.getLogger("interlab.ocr")
+
+OCR_ENABLED = os.environ.get("INTERLAB_OCR", "1") != "0"
+OCR_LANG = os.environ.get("INTERLAB_OCR_LANG", "spa")
+OCR_DPI = int(os.environ.get("INTERLAB_OCR_DPI", "300"))
+OCR_WORKERS = os.environ.get("INTERLAB_OCR_WORKERS")
+OCR_CACHE_DIR = os.environ.get("INTERLAB_OCR_CACHE_DIR")
+OCR_CACHE_ENTRIES = 256
+
+
+@lru_cache(maxsize=None)
+def ocr_available() -> bool:
+    if not OCR_ENABLED:
+        return False
+    try:
+        import pypdfium2  # noqa: F401
+        import pytesseract
+        pytesseract.get_tesseract_version()
+    except Exception as e:  # sin pytesseract / sin binario tesseract
+        logger.warning("OCR desactivado: %s", e)
+        return False
+    return True
+
+
+def needs_ocr(page: Any, text: str) -> bool:
+    """
+    Página escaneada: sin texto pero con imágenes.
+    """
+    return not text.strip() and bool(page.images)
+
+
+def page_hash(page: Any, lang: str = OCR_LANG, dpi: int = OCR_DPI) -> str:
+    h = hashlib.sha256(f"{lang}|{dpi}|{page.width}x{page.height}".encode())
+    for im in page.images:
+        stream = im.get("stream")
+        if stream is not None:
+            h.update(stream.get_rawdata() or b"")
+    return h.hexdigest()
+
+
+def recognize_page(source: Union[str, BinaryIO], index: int, lang: str = OCR_LANG, dpi: int = OCR_DPI) -> str:
+    """
+    Rasteriza una página y la pasa por Tesseract (corre en un proceso worker, con la ruta
+    del PDF; en el mismo proceso puede recibir el archivo abierto).
+    """
+    import pypdfium2 as pdfium
+    import pytesseract
+
+    doc = pdfium.PdfDocument(source)
+    try:
+        image = doc[index].render(scale=dpi / 72).to_pil()
+    finally:
+        doc.close()
+    return pytesseract.image_to_string(image, lang=lang)
+
+
+class OcrCache:
+    """
+    Texto reconocido por hash de página: LRU en memoria + un .txt por hash en disco (opcional).
+    """
+
+    def __init__(self, max_entries: int = OCR_CACHE_ENTRIES, disk_dir: Optional[str] = OCR_CACHE_DIR):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._mem: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.txt")
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._mem.get(key)
+            if text is not None:
+                self._mem.move_to_end(key)
+                return text
+        if self.disk_dir and os.path.exists(self._path(key)):
+            with open(self._path(key), encoding="utf-8") as f:
+                text = f.read()
+            self._remember(key, text)
+            return text
+        return None
+
+    def _remember(self, key: str, text: str) -> None:
+        with self._lock:
+            self._mem[key] = text
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def put(self, key: str, text: str) -> None:
+        self._remember(key, text)
+        if self.disk_dir:
+            tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, self._path(key))
+
+
+class PageOcr:
+    """
+    Lanza el OCR de páginas en un pool de procesos, pasando antes por el cache.
+    Dentro de un proceso worker (lote, API) reconoce en el mismo proceso para no
+    anidar pools.
+    """
+
+    def __init__(self, workers: Optional[int] = None, cache: Optional[OcrCache] = None,
+                 lang: str = OCR_LANG, dpi: int = OCR_DPI):
+        if workers is None:
+            workers = 0 if multiprocessing.parent_process() is not None else (os.cpu_count() or 1)
+        self.workers = workers
+        self.cache = cache or OcrCache()
+        self.lang = lang
+        self.dpi = dpi
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def submit(self, source: "PdfSource", index: int, page: Any) -> "Future[str]":
+        key = page_hash(page, self.lang, self.dpi)
+        text = self.cache.get(key)
+        if text is not None:
+            count("ocr_cache_hit")
+            done: "Future[str]" = Future()
+            done.set_result(text)
+            return done
+
+        count("ocr_pages")
+        if self.workers:
+            # al worker va una ruta: el PDF entero por IPC en cada página costaría más que el OCR
+            fut = self._executor().submit(recognize_page, source.shared(), index, self.lang, self.dpi)
+        else:
+            fut = Future()
+            with stage("pdf.ocr"):
+                try:
+                    with source.local() as local:
+                        fut.set_result(recognize_page(local, index, self.lang, self.dpi))
+                except Exception as e:
+                    fut.set_exception(e)
+
+        def _remember(f: "Future[str]") -> None:
+            if not f.cancelled() and f.exception() is None:
+                self.cache.put(key, f.result())
+
+        fut.add_done_callback(_remember)
+        return fut
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+_page_ocr: Optional[PageOcr] = None
+_page_ocr_lock = threading.Lock()
+
+
+def page_ocr() -> Optional[PageOcr]:
+    """
+    PageOcr compartido del proceso, o None si el OCR no está disponible.
+    """
+    global _page_ocr
+    if not ocr_available():
+        return None
+    with _page_ocr_lock:
+        if _page_ocr is None:
+            workers = int(OCR_WORKERS) if OCR_WORKERS is not None else None
+            _page_ocr = PageOcr(workers=workers)
+        return _page_ocr
+
+
+class PdfSource:
+    """
+    El PDF en lectura, para abrirlo aparte de pdfplumber:
+    - local(): en este proceso (pypdfium2): la ruta, o el archivo abierto mismo, sin leerlo
+      entero; al salir se restaura su posición (pdfplumber lo sigue leyendo).
+    - shared(): para los procesos worker: una ruta. Un PDF que vino como archivo abierto
+      (subida, BytesIO) se copia una sola vez a un temporal, que close() borra.
+    Ninguno de los dos carga el PDF entero en memoria.
+    """
+
+    def __init__(self, pdf_path: Union[str, BinaryIO]):
+        self._src = pdf_path
+        self._tmp: Optional[str] = None
+
+    @contextmanager
+    def local(self) -> Iterator[Union[str, BinaryIO]]:
+        if isinstance(self._src, str):
+            yield self._src
+            return
+        pos = self._src.tell()
+        try:
+            self._src.seek(0)
+            yield self._src
+        finally:
+            self._src.seek(pos)
+
+    def shared(self) -> str:
+        if isinstance(self._src, str):
+            return self._src
+        if self._tmp is None:
+            fd, path = tempfile.mkstemp(prefix="interlab_pdf_", suffix=".pdf")
+            try:
+                with os.fdopen(fd, "wb") as out, self.local() as f:
+                    shutil.copyfileobj(f, out)
+            except BaseException:
+                os.unlink(path)
+                raise
+            self._tmp = path
+            count("pdf_shared_copies")
+        return self._tmp
+
+    def close(self) -> None:
+        if self._tmp is not None:
+            try:
+                os.unlink(self._tmp)
+            except OSError:
+                pass
+            self._tmp = None
+
+
+class OrderedPages:
+    """
+    Cola de páginas en orden de lectura donde algunas son Futures de OCR.
+    ready() entrega las del frente que ya están listas; con `window` Futures pendientes
+    espera al primero (así la lectura no se adelanta sin límite).
+    """
+
+    def __init__(self, window: int = 8):
+        self.window = window
+        self._q: Deque[Tuple[Any, Optional[Callable[[str], Any]]]] = deque()
+        self._pending = 0
+
+    def push(self, item: Any) -> None:
+        self._q.append((item, None))
+
+    def push_ocr(self, fut: "Future[str]", wrap: Callable[[str], Any] = lambda text: text) -> None:
+        self._q.append((fut, wrap))
+        self._pending += 1
+
+    def _pop(self) -> Any:
+        item, wrap = self._q.popleft()
+        if wrap is None:
+            return item
+        self._pending -= 1
+        with stage("pdf.ocr_wait"):
+            try:
+                text = item.result()
+            except Exception as e:  # una página que falla no tumba el reporte
+                logger.warning("OCR falló: %s", e)
+                count("ocr_errors")
+                text = ""
+        return wrap(text)
+
+    def ready(self) -> Iterator[Any]:
+        while self._q:
+            item, wrap = self._q[0]
+            if wrap is not None and not item.done() and self._pending < self.window:
+                return
+            yield self._pop()
+
+    def drain(self) -> Iterator[Any]:
+        while self._q:
+            yield self._pop()
+
+    def cancel(self) -> None:
+        for item, wrap in self._q:
+            if wrap is not None:
+                item.cancel()
+        self._q.clear()
+        self._pending = 0
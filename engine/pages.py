@@ -0,0 +1,240 @@
+"""
+Qué páginas de un PDF leer y cómo: triage barato por página + extracción en paralelo por tramos.
+
+Epicrisis y paquetes hospitalarios traen 40+ páginas (portada, notas legales, métodos) de
+las que solo unas pocas tienen resultados, y la extracción de pdfplumber (layout carácter
+por carácter) cuesta ~100 ms por página.
+
+- triage_pages: el texto crudo de cada página sale de pdfium (C, ~1 ms por página; viene
+  con pdfplumber) y se clasifica barato. Se lee la página si alguna línea calza con la
+  gramática de engine.parse_pdf, si trae el encabezado del paciente o de la tabla
+  (TRIAGE_KEYWORDS) o si es densa en números. Las páginas sin texto (escaneadas) se leen
+  siempre: decide el OCR. Ante la duda se lee, porque saltear una página con resultados
+  perdería analitos.
+- PageExtractor: con muchas páginas para leer, las reparte en tramos contiguos entre
+  procesos (cada uno abre el PDF y extrae su tramo). engine.parse_pdf las consume en el
+  orden del PDF a medida que llegan. Dentro de un proceso worker (lote, API) se extrae en
+  el mismo proceso, para no anidar pools.
+
+Configuración por variables de entorno:
+    INTERLAB_TRIAGE=0                 lee todas las páginas
+    INTERLAB_TRIAGE_MIN_PAGES=2       documentos más cortos no pasan por el triage
+    INTERLAB_EXTRACT_WORKERS=4        procesos (default: núcleos; 0 = en el mismo proceso)
+    INTERLAB_EXTRACT_PARALLEL_MIN=8   páginas a leer desde las que se reparte
+"""
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional, Sequence, Tuple, Union
+
+from engine.ocr import PdfSource
+from engine.perf import count, stage, timed
+
+logger = logging.getLogger("interlab.pages")
+
+TRIAGE_ENABLED = os.environ.get("INTERLAB_TRIAGE", "1") != "0"
+TRIAGE_MIN_PAGES = int(os.environ.get("INTERLAB_TRIAGE_MIN_PAGES", "2"))
+EXTRACT_WORKERS = os.environ.get("INTERLAB_EXTRACT_WORKERS")
+EXTRACT_PARALLEL_MIN = int(os.environ.get("INTERLAB_EXTRACT_PARALLEL_MIN", "8"))
+RANGE_MIN_PAGES = 4  # un tramo más chico no paga abrir el PDF en el worker
+
+# encabezados que marcan una página de resultados aunque sus líneas no calcen
+# (no 'referencia' suelta: las notas de método hablan de "valores de referencia")
+TRIAGE_KEYWORDS = ("paciente:", "edad:", "nombre de estudio")
+DENSE_MIN_NUMBERS = 12
+DENSE_MIN_RATIO = 0.2  # números / palabras
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def is_result_page(text: str) -> bool:
+    """
+    Clasificación de una página por su texto crudo (el de pdfium, no el de pdfplumber).
+    """
+    if not text.strip():
+        return True  # escaneada o sin capa de texto: la decide el OCR
+    low = text.lower()
+    if any(k in low for k in TRIAGE_KEYWORDS):
+        return True
+    # import tardío: engine.parse_pdf importa este módulo
+    from engine.parse_pdf import parse_line
+
+    for ln in text.splitlines():
+        if parse_line(ln.strip()) is not None:
+            return True
+    numbers = len(_NUMBER_RE.findall(text))
+    return numbers >= DENSE_MIN_NUMBERS and numbers >= DENSE_MIN_RATIO * len(text.split())
+
+
+@timed("pdf.triage")
+def triage_pages(source: Union[str, BinaryIO]) -> Optional[List[bool]]:
+    """
+    Qué páginas leer (una bandera por página), o None si no se pudo clasificar
+    (sin pypdfium2, PDF que pdfium no abre): entonces se leen todas.
+    `source` es una ruta o un archivo abierto: pdfium lee por partes, no hace falta
+    tener el PDF entero en memoria.
+    """
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        return None
+    try:
+        doc = pdfium.PdfDocument(source)
+    except Exception as e:  # cifrado, dañado: pdfplumber decide
+        logger.debug("triage no disponible: %s", e)
+        return None
+    try:
+        keep = []
+        for i in range(len(doc)):
+            page = doc[i]
+            textpage = page.get_textpage()
+            try:
+                keep.append(is_result_page(textpage.get_text_range()))
+            finally:
+                textpage.close()
+                page.close()
+        return keep
+    except Exception as e:
+        logger.debug("triage interrumpido: %s", e)
+        return None
+    finally:
+        doc.close()
+
+
+def extract_range(path: str, indices: Sequence[int], words: bool = False) -> List[Any]:
+    """
+    Texto (o palabras, para el modo tabla) de las páginas `indices` (corre en un proceso worker).
+    """
+    import pdfplumber
+
+    out: List[Any] = []
+    with pdfplumber.open(path) as pdf:
+        for i in indices:
+            p = pdf.pages[i]
+            out.append(p.extract_words() if words else (p.extract_text() or ""))
+            p.close()
+    return out
+
+
+def _split(indices: List[int], parts: int) -> List[List[int]]:
+    size, extra = divmod(len(indices), parts)
+    out, start = [], 0
+    for k in range(parts):
+        end = start + size + (1 if k < extra else 0)
+        out.append(indices[start:end])
+        start = end
+    return out
+
+
+class PageExtractor:
+    """
+    Pool de procesos para extraer tramos de páginas de un mismo PDF.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def submit(self, path: str, indices: List[int], words: bool = False) -> Dict[int, Tuple["Future[List[Any]]", int]]:
+        """
+        Reparte `indices` en tramos contiguos (cada worker abre `path`).
+        Devuelve página -> (Future del tramo, posición).
+        """
+        parts = max(1, min(self.workers, len(indices) // RANGE_MIN_PAGES))
+        where: Dict[int, Tuple["Future[List[Any]]", int]] = {}
+        ex = self._executor()
+        for chunk in _split(indices, parts):
+            fut = ex.submit(extract_range, path, chunk, words)
+            count("extract_ranges")
+            for k, i in enumerate(chunk):
+                where[i] = (fut, k)
+        return where
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+_extractor: Optional[PageExtractor] = None
+_extractor_lock = threading.Lock()
+
+
+def page_extractor() -> Optional[PageExtractor]:
+    """
+    PageExtractor compartido del proceso, o None si se extrae en el mismo proceso.
+    """
+    global _extractor
+    if multiprocessing.parent_process() is not None:
+        return None
+    workers = int(EXTRACT_WORKERS) if EXTRACT_WORKERS is not None else (os.cpu_count() or 1)
+    if workers < 2:
+        return None
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = PageExtractor(workers)
+        return _extractor
+
+
+class PagePlan:
+    """
+    Plan de lectura de un PDF: qué páginas se saltean y de dónde sale el resto
+    (de un tramo en paralelo o de la página misma, en este proceso).
+    """
+
+    def __init__(self, keep: Optional[List[bool]] = None, where: Optional[Dict[int, Tuple[Future, int]]] = None):
+        self._keep = keep
+        self._where = where or {}
+
+    def keep(self, i: int) -> bool:
+        if self._keep is None or i >= len(self._keep) or self._keep[i]:
+            return True
+        count("pages_skipped")
+        return False
+
+    def extract(self, i: int, page: Any, words: bool = False) -> Any:
+        hit = self._where.pop(i, None)
+        if hit is not None:
+            fut, k = hit
+            try:
+                with stage("pdf.extract_wait"):
+                    return fut.result()[k]
+            except Exception as e:  # el worker falló: esta página se lee acá
+                logger.warning("extracción en paralelo falló en la página %d: %s", i, e)
+                count("extract_errors")
+        return page.extract_words() if words else (page.extract_text() or "")
+
+    def cancel(self) -> None:
+        for fut, _ in self._where.values():
+            fut.cancel()
+        self._where.clear()
+
+
+def plan_pages(source: PdfSource, n_pages: int, words: bool = False) -> PagePlan:
+    """
+    `source` es el engine.ocr.PdfSource del PDF.
+    """
+    keep = None
+    if TRIAGE_ENABLED and n_pages >= TRIAGE_MIN_PAGES:
+        with source.local() as local:
+            keep = triage_pages(local)
+        if keep is not None and len(keep) != n_pages:
+            keep = None  # pdfium y pdfminer no ven las mismas páginas: se leen todas
+    todo = [i for i in range(n_pages) if keep is None or keep[i]]
+    where = None
+    if len(todo) >= EXTRACT_PARALLEL_MIN:
+        extractor = page_extractor()
+        if extractor is not None:
+            where = extractor.submit(source.shared(), todo, words)
+    return PagePlan(keep, where)
@@ -1,9 +1,15 @@
 import re
-import pdfplumber
+from io import BytesIO
 from dataclasses import dataclass
-from typing import Dict, Optional, Tuple, Any, List
+from typing import Dict, Optional, Tuple, Any, List, Union, BinaryIO, Iterable, Iterator
 
-@dataclass
+from engine.layout import Cells, TableLayout, group_rows, iter_cells, match_layout, rows_text
+from engine.ocr import OrderedPages, PdfSource, needs_ocr, page_ocr
+from engine.pages import plan_pages
+from engine.perf import count, stage, timed
+
+# slots: sin __dict__ por observación (ver engine.obs_table para cohortes)
+@dataclass(slots=True)
 class Obs:
     key: str
     value: Optional[float]
@@ -12,6 +18,22 @@ class Obs:
     ref_low: Optional[float] = None
     ref_high: Optional[float] = None
 
+# Patrones precompilados (se usan en cada línea de cada reporte)
+_THOUSANDS_RE = re.compile(r"(?<=\d)\s(?=\d{3}\b)")
+_HAS_DIGIT = re.compile(r"\d").search
+
+# Un solo patrón para todas las formas de referencia.
+# El rango "a - b" consume texto; las demás formas van en lookahead (ancho cero)
+# para no tapar un rango que empiece dentro de ellas, p.ej. '< 5 - 10'.
+_RANGE_RE = re.compile(
+    r"(?P<lo>-?\d+(?:\.\d+)?)\s*-\s*(?P<hi>-?\d+(?:\.\d+)?)"
+    r"|(?=(?:(?P<hasta>hasta):?|(?P<lt><)|(?P<ge>>=))\s*(?P<num>-?\d+(?:\.\d+)?))",
+    re.IGNORECASE,
+)
+
+_PATIENT_NAME_RE = re.compile(r"Paciente:\s*([A-ZÁÉÍÓÚÑ,\s]+)\s+Identificación:")
+_PATIENT_AGE_SEX_RE = re.compile(r"Edad:\s*(\d+)\s*Años\s+Sexo:\s*([A-Za-zÁÉÍÓÚÑ]+)")
+
 def _to_float(x: str) -> Optional[float]:
     if x is None:
         return None
@@ -20,10 +42,10 @@ def _to_float(x: str) -> Optional[float]:
         return None
     x = x.replace(",", ".")
     # quita miles tipo 4 590 000
-    x = re.sub(r"(?<=\d)\s(?=\d{3}\b)", "", x)
+    x = _THOUSANDS_RE.sub("", x)
     try:
         return float(x)
-    except:
+    except ValueError:
         return None
 
 def _parse_range(ref: str) -> Tuple[Optional[float], Optional[float]]:
@@ -33,83 +55,313 @@ def _parse_range(ref: str) -> Tuple[Optional[float], Optional[float]]:
     '0.00 - 30.00'
     'Hasta:4.50'
     '< 200'
+    '>= 40'
+    Prioridad (como antes): rango > Hasta > '<' > '>=', cada uno el primero que aparezca.
     """
     if not ref:
         return None, None
-    ref = ref.replace(",", ".")
-    m = re.search(r"(-?\d+(\.\d+)?)\s*-\s*(-?\d+(\.\d+)?)", ref)
-    if m:
-        return _to_float(m.group(1)), _to_float(m.group(3))
-    m = re.search(r"Hasta:?\s*(-?\d+(\.\d+)?)", ref, re.IGNORECASE)
-    if m:
-        return None, _to_float(m.group(1))
-    m = re.search(r"<\s*(-?\d+(\.\d+)?)", ref)
-    if m:
-        return None, _to_float(m.group(1))
-    m = re.search(r">=\s*(-?\d+(\.\d+)?)", ref)
-    if m:
-        return _to_float(m.group(1)), None
+    # '4 100 000 - 5 100 000' -> '4100000 - 5100000'
+    ref = _THOUSANDS_RE.sub("", ref.replace(",", "."))
+    hasta = lt = ge = None
+    for m in _RANGE_RE.finditer(ref):
+        lo, hi, is_hasta, is_lt, _, num = m.groups()
+        if lo is not None:
+            return float(lo), float(hi)
+        if is_hasta is not None:
+            if hasta is None:
+                hasta = float(num)
+        elif is_lt is not None:
+            if lt is None:
+                lt = float(num)
+        elif ge is None:
+            ge = float(num)
+    if hasta is not None:
+        return None, hasta
+    if lt is not None:
+        return None, lt
+    if ge is not None:
+        return ge, None
     return None, None
 
-def read_pdf_text(pdf_path: str) -> str:
-    with pdfplumber.open(pdf_path) as pdf:
-        return "\n".join([(p.extract_text() or "") for p in pdf.pages])
+@timed("pdf.extract_text")
+def read_pdf_text(pdf_path: Union[str, BinaryIO]) -> str:
+    return "\n".join(iter_pdf_pages(pdf_path))
+
+def read_pdf_bytes(data: bytes) -> str:
+    """
+    Igual que read_pdf_text pero desde memoria (sin archivo temporal).
+    """
+    return read_pdf_text(BytesIO(data))
+
+def _open_pdf(pdf_path: Union[str, BinaryIO]) -> Any:
+    # pdfplumber (y pdfminer) se importan en el primer PDF, no al importar el módulo:
+    # Obs, los parsers de línea y la app arrancan sin cargarlos
+    import pdfplumber
+
+    return pdfplumber.open(pdf_path)
+
+def iter_pdf_pages(pdf_path: Union[str, BinaryIO]) -> Iterator[str]:
+    """
+    Texto página por página. Libera los objetos de cada página al avanzar,
+    así la memoria queda acotada a una página.
+    Las páginas sin resultados (portadas, notas, métodos) se saltean con un triage barato
+    y salen vacías; en documentos largos el resto se extrae por tramos en paralelo
+    (engine.pages). Las páginas escaneadas (sin capa de texto) pasan por OCR en paralelo
+    (engine.ocr) mientras se siguen leyendo las demás; el orden de salida es el del PDF.
+    """
+    ocr = page_ocr()
+    source = PdfSource(pdf_path)
+    pages = OrderedPages()
+    plan = None
+    try:
+        with _open_pdf(pdf_path) as pdf:
+            plan = plan_pages(source, len(pdf.pages))
+            for i, p in enumerate(pdf.pages):
+                if not plan.keep(i):
+                    pages.push("")
+                    continue
+                with stage("pdf.extract_page"):
+                    text = plan.extract(i, p)
+                    if ocr is not None and needs_ocr(p, text):
+                        pages.push_ocr(ocr.submit(source, i, p))
+                    else:
+                        pages.push(text)
+                    p.close()
+                count("pages")
+                yield from pages.ready()
+        yield from pages.drain()
+    finally:
+        pages.cancel()
+        if plan is not None:
+            plan.cancel()
+        source.close()
+
+def iter_pdf_tables(pdf_path: Union[str, BinaryIO]) -> Iterator[Tuple[str, Optional[List[Cells]]]]:
+    """
+    Igual que iter_pdf_pages pero por geometría: una sola extracción de palabras por página
+    da el texto (para el encabezado del paciente) y las celdas de la tabla.
+    Las celdas son None si la página no tiene un layout de tabla reconocido.
+    Las páginas escaneadas salen del OCR como texto, sin celdas; las que el triage saltea,
+    vacías y sin celdas.
+    """
+    ocr = page_ocr()
+    source = PdfSource(pdf_path)
+    pages = OrderedPages()
+    layout: Optional[TableLayout] = None
+    plan = None
+    try:
+        with _open_pdf(pdf_path) as pdf:
+            plan = plan_pages(source, len(pdf.pages), words=True)
+            for i, p in enumerate(pdf.pages):
+                if not plan.keep(i):
+                    pages.push(("", None))
+                    continue
+                with stage("pdf.extract_words"):
+                    rows = group_rows(plan.extract(i, p, words=True))
+                    if ocr is not None and not rows and needs_ocr(p, ""):
+                        pages.push_ocr(ocr.submit(source, i, p), lambda text: (text, None))
+                        rows = None
+                    p.close()
+                count("pages")
+                if rows is not None:
+                    layout, first = match_layout(rows, layout)
+                    cells = list(iter_cells(rows[first:], layout)) if layout is not None else None
+                    pages.push((rows_text(rows), cells))
+                yield from pages.ready()
+        yield from pages.drain()
+    finally:
+        pages.cancel()
+        if plan is not None:
+            plan.cancel()
+        source.close()
+
+def iter_lines(text: str) -> Iterator[str]:
+    for ln in text.splitlines():
+        ln = ln.strip()
+        if ln:
+            yield ln
+
+def iter_pdf_lines(pdf_path: Union[str, BinaryIO]) -> Iterator[str]:
+    for page in iter_pdf_pages(pdf_path):
+        yield from iter_lines(page)
 
+@timed("parse.patient")
 def extract_patient(text: str) -> Dict[str, Any]:
     # Nombre
     name = None
-    m = re.search(r"Paciente:\s*([A-ZÁÉÍÓÚÑ,\s]+)\s+Identificación:", text)
+    m = _PATIENT_NAME_RE.search(text)
     if m:
         name = m.group(1).strip()
 
     # Edad/Sexo (toma el primero que encuentre)
     age = None
     sex = None
-    m = re.search(r"Edad:\s*(\d+)\s*Años\s+Sexo:\s*([A-Za-zÁÉÍÓÚÑ]+)", text)
+    m = _PATIENT_AGE_SEX_RE.search(text)
     if m:
         age = int(m.group(1))
         sex = m.group(2).strip()
     return {"name": name, "age": age, "sex": sex}
 
-def extract_analytes(text: str) -> Dict[str, Obs]:
+@dataclass(frozen=True)
+class LineFormat:
+    """
+    Un formato de línea de laboratorio. El patrón debe tener los grupos
+    name, value, unit y ref.
+    """
+    name: str
+    pattern: "re.Pattern[str]"
+
+# Gramática de líneas, en orden de prioridad (gana el primer formato que calza).
+LINE_FORMATS: Tuple[LineFormat, ...] = (
+    # 'Colesterol Sérico 243 mg/dl 0 - 200', 'TSH: 1.0947 µUI/mL 0.35 - 4.94'
+    LineFormat(
+        "valor_unidad_referencia",
+        re.compile(r"^(?P<name>.*?)[\s:]+(?P<value>[-+]?\d[\d\s.,]*)\s+(?P<unit>[^\d\s]+(?:/[^\s]+)?)\s+(?P<ref>.+)$"),
+    ),
+)
+
+def parse_line(ln: str) -> Optional[Obs]:
     """
     Parser robusto para líneas tipo:
     'Colesterol Sérico 243 mg/dl ...'
     'Hematíes 4590000 mm3 4100000 - 5100000'
     'TSH 1.0947 µUI/mL 0.35 - 4.94'
     """
-    obs: Dict[str, Obs] = {}
+    # Pre-filtro barato: todos los formatos exigen un valor numérico
+    if not _HAS_DIGIT(ln):
+        return None
 
-    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-    for ln in lines:
-        # Ignora encabezados
-        if ln.upper().startswith("NOMBRE DE ESTUDIO"):
-            continue
-
-        # Caso con rango final numérico "a - b"
-        m = re.match(r"^(.*?)[\s:]+([-+]?\d[\d\s.,]*)\s+([^\d\s]+(?:/[^\s]+)?)\s+(.+)$", ln)
-        if not m:
-            continue
-
-        name = m.group(1).strip(" .:-")
-        value = _to_float(m.group(2))
-        unit = m.group(3).strip()
-        ref_text = m.group(4).strip()
-
-        # Filtra “name” demasiado largo basura
-        if len(name) < 2 or value is None:
-            continue
-
-        ref_low, ref_high = _parse_range(ref_text)
-        key = name
-
-        obs[key] = Obs(
-            key=key,
-            value=value,
-            unit=unit,
-            ref_text=ref_text,
-            ref_low=ref_low,
-            ref_high=ref_high,
-        )
+    # Ignora encabezados
+    if ln.upper().startswith("NOMBRE DE ESTUDIO"):
+        return None
+
+    for fmt in LINE_FORMATS:
+        m = fmt.pattern.match(ln)
+        if m:
+            break
+    else:
+        return None
+
+    return make_obs(*m.group("name", "value", "unit", "ref"))
+
+def make_obs(name: str, value_text: str, unit: str, ref_text: str) -> Optional[Obs]:
+    """
+    Obs desde los textos crudos de nombre, valor, unidad y referencia
+    (salgan de una línea o de las celdas de una tabla).
+    """
+    name = name.strip(" .:-")
+    try:
+        # camino rápido: '243', '1.0947'; miles/comas caen a _to_float
+        value = float(value_text)
+    except ValueError:
+        value = _to_float(value_text)
+
+    # Filtra “name” demasiado largo basura
+    if len(name) < 2 or value is None:
+        return None
+
+    ref_text = ref_text.strip()
+    ref_low, ref_high = _parse_range(ref_text)
+    return Obs(
+        key=name,
+        value=value,
+        unit=unit.strip(),
+        ref_text=ref_text,
+        ref_low=ref_low,
+        ref_high=ref_high,
+    )
+
+def iter_analytes(lines: Iterable[str]) -> Iterator[Obs]:
+    n_lines = n_obs = 0
+    try:
+        for ln in lines:
+            ln = ln.strip()
+            if not ln:
+                continue
+            n_lines += 1
+            o = parse_line(ln)
+            if o is not None:
+                n_obs += 1
+                yield o
+    finally:
+        count("lines", n_lines)
+        count("analytes_matched", n_obs)
+
+def iter_cell_analytes(cells: Iterable[Cells]) -> Iterator[Obs]:
+    n_rows = n_obs = 0
+    try:
+        for c in cells:
+            n_rows += 1
+            o = make_obs(*c)
+            if o is not None:
+                n_obs += 1
+                yield o
+    finally:
+        count("table_rows", n_rows)
+        count("analytes_matched", n_obs)
 
+@timed("parse.analytes")
+def extract_analytes(text: str) -> Dict[str, Obs]:
+    obs: Dict[str, Obs] = {}
+    for o in iter_analytes(text.splitlines()):
+        obs[o.key] = o
     return obs
+
+def _merge_patient(patient: Dict[str, Any], found: Dict[str, Any]) -> None:
+    for k, v in found.items():
+        if patient.get(k) is None and v is not None:
+            patient[k] = v
+
+PARSE_MODES = ("text", "table")
+
+def iter_report(
+    pdf_path: Union[str, BinaryIO],
+    wanted: Optional[Iterable[str]] = None,
+    mode: str = "text",
+) -> Iterator[Tuple[int, Dict[str, Any], Dict[str, Obs]]]:
+    """
+    Lectura progresiva: por cada página devuelve (n° de página, paciente hasta ahora,
+    analitos nuevos de esa página).
+    Si se pasa `wanted` (fragmentos de nombre, como en scores.get), corta apenas
+    el encabezado del paciente está completo y se encontraron todos los analitos pedidos.
+    mode="table" lee por columnas (engine.layout); las páginas sin tabla reconocida
+    caen al parser de líneas.
+    """
+    if mode not in PARSE_MODES:
+        raise ValueError(f"mode debe ser uno de {PARSE_MODES}")
+    pending = {w.lower() for w in wanted} if wanted else None
+    patient: Dict[str, Any] = {"name": None, "age": None, "sex": None}
+
+    if mode == "table":
+        pages = iter_pdf_tables(pdf_path)
+    else:
+        pages = ((text, None) for text in iter_pdf_pages(pdf_path))
+
+    for i, (page, cells) in enumerate(pages):
+        _merge_patient(patient, extract_patient(page))
+        found = iter_analytes(iter_lines(page)) if cells is None else iter_cell_analytes(cells)
+        page_obs: Dict[str, Obs] = {}
+        for o in found:
+            page_obs[o.key] = o
+            if pending:
+                k = o.key.lower()
+                pending = {w for w in pending if w not in k}
+        yield i, dict(patient), page_obs
+
+        if pending is not None and not pending and all(v is not None for v in patient.values()):
+            return
+
+def extract_streaming(
+    pdf_path: Union[str, BinaryIO],
+    wanted: Optional[Iterable[str]] = None,
+    mode: str = "text",
+) -> Tuple[Dict[str, Any], Dict[str, Obs]]:
+    """
+    Igual que read_pdf_text + extract_patient + extract_analytes, pero página por página
+    (sin armar el texto completo) y con corte temprano opcional.
+    """
+    patient: Dict[str, Any] = {"name": None, "age": None, "sex": None}
+    obs: Dict[str, Obs] = {}
+    for _, patient, page_obs in iter_report(pdf_path, wanted, mode):
+        obs.update(page_obs)
+    return patient, obs
@@ -1,8 +1,348 @@
+"""
+PDF con ReportLab, sin HTML/CSS: el modo "fast" de exportación.
+
+- metrics_to_pdf_fast(metrics): el mismo reporte que templates/report.html (encabezado, paciente,
+  KPIs, tabla de analitos con semáforo, scores por sistema, pasos/FAQ) dibujado directo en el
+  canvas. Milisegundos por reporte: pensado para lotes grandes. Diseño más simple que el PDF
+  de WeasyPrint (sin tarjetas con borde ni emojis).
+- metrics_to_pdf(metrics, mode): elige entre "html" (WeasyPrint, engine.pdf_html) y "fast".
+- text_to_pdf_bytes(title, body): texto plano (p.ej. el reporte IA).
+
+El texto se corta por ancho real (stringWidth de la fuente), no por cantidad de caracteres.
+"""
+import os
+from datetime import datetime
+from functools import lru_cache
 from io import BytesIO
-from reportlab.lib.pagesizes import letter
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from reportlab.lib.colors import HexColor, white
+from reportlab.lib.pagesizes import A4, letter
+from reportlab.lib.units import inch, mm
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.pdfgen import canvas
-from reportlab.lib.units import inch
 
+from engine.perf import timed
+from engine.report_html import APP_NAME, FLAG_BADGES, REPORT_TITLE, URGENCY_BADGES
+
+PDF_MODES = ("html", "fast")
+PDF_MODE = os.environ.get("INTERLAB_PDF_MODE", "html")  # default de la app, el lote y la API
+
+# colores de templates/report.css
+BRAND = HexColor("#7a0f2b")
+TEXT = HexColor("#111827")
+MUTED = HexColor("#6b7280")
+LINE = HexColor("#eeeeee")
+BADGE_COLORS = {"ok": HexColor("#16a34a"), "warn": HexColor("#f59e0b"), "bad": HexColor("#dc2626"), "": MUTED}
+
+FONT = "Helvetica"
+BOLD = "Helvetica-Bold"
+
+PAGE_W, PAGE_H = A4
+MARGIN_X = 14 * mm
+MARGIN_Y = 18 * mm
+CONTENT_W = PAGE_W - 2 * MARGIN_X
+
+# columnas de la tabla de analitos (fracción del ancho útil)
+ANALYTE_COLS = (("Analito", 0.34), ("Resultado", 0.22), ("Referencia", 0.28), ("Estado", 0.16))
+SYSTEM_COLS = (("Sistema", 0.7), ("Score", 0.3))
+
+NOTE = "Este informe no sustituye consulta médica. Correlacionar con síntomas e historia clínica."
+NEXT_STEPS = (
+    "Correlacionar resultados con clínica y antecedentes.",
+    "Repetir/confirmar pruebas alteradas según criterio médico.",
+    "Control de factores de riesgo (dieta, actividad física, etc.) según hallazgos.",
+)
+FAQ = (
+    ("¿Esto es un diagnóstico?", "No. Es una interpretación automatizada orientativa."),
+    ("¿Qué hago si hay valores alterados?", "Consultar con tu médico para definir conducta."),
+    ("¿Por qué aparece N/E?", "Porque ese dato no estaba en el PDF o no se pudo extraer con seguridad."),
+    ("¿Puedo usar esto para tratamiento?", "No. Es apoyo informativo, no prescriptivo."),
+)
+
+
+# las fuentes estándar (Helvetica) solo cubren WinAnsi: lo demás se aproxima o queda '?'
+_WINANSI = str.maketrans({"≥": ">=", "≤": "<=", "μ": "µ", "−": "-", "✓": "v"})
+
+
+def pdf_text(text: str) -> str:
+    return text.translate(_WINANSI).encode("cp1252", "replace").decode("cp1252")
+
+
+def _ne(v: Any) -> str:
+    return "N/E" if v is None else pdf_text(str(v))
+
+
+@lru_cache(maxsize=4096)
+def wrap(text: str, font: str, size: float, width: float) -> Tuple[str, ...]:
+    """
+    Corta `text` en líneas que entran en `width` puntos (respeta los saltos de línea).
+    Cacheado: en un lote los nombres, unidades y rangos se repiten de reporte en reporte.
+    """
+    text = pdf_text(text)
+    if "\n" not in text and stringWidth(text, font, size) <= width:
+        return (text,)
+    return tuple(simpleSplit(text, font, size, width)) or ("",)
+
+
+class _Flow:
+    """
+    Cursor vertical sobre el canvas: salta de página cuando no entra el próximo bloque.
+    """
+
+    def __init__(self, c: canvas.Canvas):
+        self.c = c
+        self.page = 1
+        self.y = PAGE_H - MARGIN_Y
+        self.on_new_page = None  # p.ej. repetir el encabezado de la tabla en curso
+        self.forms: Dict[Tuple[str, str, float], str] = {}  # badges ya dibujados como XObject
+
+    def need(self, h: float) -> None:
+        if self.y - h >= MARGIN_Y:
+            return
+        self._page_number()
+        self.c.showPage()
+        self.page += 1
+        self.y = PAGE_H - MARGIN_Y
+        if self.on_new_page:
+            self.on_new_page()
+
+    def _page_number(self) -> None:
+        self.c.setFont(FONT, 8)
+        self.c.setFillColor(MUTED)
+        self.c.drawRightString(PAGE_W - MARGIN_X, MARGIN_Y / 2, f"{APP_NAME} – página {self.page}")
+
+    def finish(self) -> None:
+        self._page_number()
+
+
+def _badge(f: _Flow, x: float, y: float, cls: str, label: str, size: float = 8) -> None:
+    """
+    Badge redondeado con la línea base en `y`. Cada badge distinto se dibuja una sola vez por
+    documento (Form XObject) y las filas solo lo referencian: menos operaciones y menos bytes.
+    """
+    c, key = f.c, (cls, label, size)
+    name = f.forms.get(key)
+    if name is None:
+        name = f.forms[key] = f"badge{len(f.forms)}"
+        w, h = stringWidth(label, BOLD, size) + 10, size + 5
+        c.beginForm(name, 0, -3, w, h - 3)
+        c.setFillColor(BADGE_COLORS.get(cls, MUTED))
+        c.roundRect(0, -3, w, h, h / 2, stroke=0, fill=1)
+        c.setFillColor(white)
+        c.setFont(BOLD, size)
+        c.drawString(5, 0, label)
+        c.endForm()
+    c.saveState()
+    c.translate(x, y)
+    c.doForm(name)
+    c.restoreState()
+
+
+def _header(f: _Flow, generated: str) -> None:
+    c, h = f.c, 16 * mm
+    top = f.y
+    c.setFillColor(BRAND)
+    c.roundRect(MARGIN_X, top - h, CONTENT_W, h, 5 * mm, stroke=0, fill=1)
+    c.setFillColor(white)
+    c.setFont(BOLD, 16)
+    c.drawString(MARGIN_X + 6 * mm, top - 7.5 * mm, f"{APP_NAME} – {REPORT_TITLE}")
+    c.setFont(FONT, 8.5)
+    c.drawString(MARGIN_X + 6 * mm, top - 12.5 * mm, f"Generado: {generated}")
+
+    pill = "Reporte clínico"
+    pw = c.stringWidth(pill, BOLD, 8.5) + 16
+    px = MARGIN_X + CONTENT_W - 6 * mm - pw
+    c.roundRect(px, top - 9 * mm, pw, 6 * mm, 3 * mm, stroke=0, fill=1)
+    c.setFillColor(BRAND)
+    c.setFont(BOLD, 8.5)
+    c.drawString(px + 8, top - 7 * mm, pill)
+    f.y = top - h - 5 * mm
+
+
+def _title(f: _Flow, text: str, keep: float = 0) -> None:
+    """
+    Título de sección; `keep` reserva lugar para lo que sigue (no queda huérfano al pie).
+    """
+    f.need(10 * mm + keep)
+    c = f.c
+    c.setFillColor(BRAND)
+    c.setFont(BOLD, 13)
+    c.drawString(MARGIN_X, f.y - 13, text)
+    f.y -= 13 + 3 * mm
+
+
+def _kpis(f: _Flow, items: Sequence[Tuple[str, str, Optional[Tuple[str, str]]]]) -> None:
+    """
+    Grilla de KPIs (label, valor, badge opcional) en columnas iguales.
+    """
+    c, h, gap = f.c, 15 * mm, 3 * mm
+    w = (CONTENT_W - gap * (len(items) - 1)) / len(items)
+    f.need(h)
+    for i, (label, value, badge) in enumerate(items):
+        x = MARGIN_X + i * (w + gap)
+        c.setStrokeColor(LINE)
+        c.roundRect(x, f.y - h, w, h, 3 * mm, stroke=1, fill=0)
+        c.setFillColor(MUTED)
+        c.setFont(FONT, 8)
+        c.drawString(x + 3.5 * mm, f.y - 5 * mm, label)
+        c.setFillColor(TEXT)
+        c.setFont(BOLD, 15)
+        c.drawString(x + 3.5 * mm, f.y - 11.5 * mm, value)
+        if badge:
+            _badge(f, x + 3.5 * mm + c.stringWidth(value, BOLD, 15) + 6, f.y - 11.5 * mm, *badge)
+    f.y -= h + 3 * mm
+
+
+def _paragraph(f: _Flow, text: str, size: float = 8.5, color=MUTED, indent: float = 0, bullet: str = "") -> None:
+    c, lead = f.c, size * 1.35
+    for i, line in enumerate(wrap(text, FONT, size, CONTENT_W - indent)):
+        f.need(lead)
+        f.y -= lead
+        c.setFillColor(color)
+        c.setFont(FONT, size)
+        if bullet and i == 0:
+            c.drawString(MARGIN_X + indent - 8, f.y, bullet)
+        c.drawString(MARGIN_X + indent, f.y, line)
+
+
+def _table(f: _Flow, cols: Sequence[Tuple[str, float]], rows: Iterable[Sequence[Any]], empty: str) -> None:
+    """
+    Tabla con encabezado repetido en cada página. Cada fila: textos por columna; un valor
+    (cls, label) en la última columna se dibuja como badge. Las celdas largas se cortan por ancho.
+    """
+    c, size, pad = f.c, 9, 1.8 * mm
+    lead = size * 1.3
+    widths = [CONTENT_W * frac for _, frac in cols]
+    xs = [MARGIN_X + sum(widths[:i]) for i in range(len(cols))]
+
+    def head() -> None:
+        f.need(lead + 2 * pad)
+        c.setFillColor(TEXT)
+        c.setFont(BOLD, size)
+        for (name, _), x in zip(cols, xs):
+            c.drawString(x + pad, f.y - pad - size, name)
+        f.y -= lead + 2 * pad
+        c.setStrokeColor(TEXT)
+        c.setLineWidth(1.2)
+        c.line(MARGIN_X, f.y, MARGIN_X + CONTENT_W, f.y)
+        c.setLineWidth(1)
+
+    head()
+    f.on_new_page = head
+    n = 0
+    for row in rows:
+        n += 1
+        # str -> líneas cortadas por ancho; tupla (cls, label) -> badge
+        lines = [wrap(cell, FONT, size, w - 2 * pad) if isinstance(cell, str) else None for cell, w in zip(row, widths)]
+        h = max(len(ls) if ls else 1 for ls in lines) * lead + 2 * pad
+        f.need(h)
+        c.setFont(FONT, size)
+        c.setFillColor(TEXT)
+        badges = []
+        for cell, ls, x in zip(row, lines, xs):
+            base = f.y - pad - size
+            if ls is None:
+                badges.append((x + pad, base, cell))
+                continue
+            for line in ls:
+                c.drawString(x + pad, base, line)
+                base -= lead
+        for x, base, (cls, label) in badges:
+            _badge(f, x, base, cls, label)
+        f.y -= h
+        c.setStrokeColor(LINE)
+        c.line(MARGIN_X, f.y, MARGIN_X + CONTENT_W, f.y)
+    f.on_new_page = None
+    if not n:
+        f.need(lead + 2 * pad)
+        c.setFillColor(MUTED)
+        c.setFont(FONT, size)
+        c.drawString(MARGIN_X + pad, f.y - pad - size, empty)
+        f.y -= lead + 2 * pad
+    f.y -= 5 * mm
+
+
+def _analyte_rows(analytes: Iterable[Dict[str, Any]]) -> Iterable[Tuple[str, str, str, Tuple[str, str]]]:
+    unknown = FLAG_BADGES["unknown"]
+    for a in analytes:
+        value = f"{_ne(a.get('value'))} {a.get('unit') or ''}".rstrip()
+        if a.get("pct") is not None:
+            value = f"{value} · P{round(a['pct'])}"  # percentil poblacional (engine.population)
+        yield _ne(a.get("name")), value, _ne(a.get("ref")), FLAG_BADGES.get(a.get("flag"), unknown)
+
+
+@timed("render.pdf_fast")
+def metrics_to_pdf_fast(metrics: Dict[str, Any], generated: Optional[str] = None) -> bytes:
+    """
+    Reporte completo desde el dict de métricas (engine.scores.build_metrics), sin WeasyPrint.
+    """
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    c.setTitle(f"{APP_NAME} – {REPORT_TITLE}")
+    f = _Flow(c)
+
+    _header(f, generated or datetime.now().strftime("%Y-%m-%d %H:%M"))
+
+    patient = metrics.get("patient") or {}
+    urgency = _ne(metrics.get("urgency"))
+    _title(f, "Datos del paciente", keep=15 * mm)
+    _kpis(f, (
+        ("Edad", _ne(patient.get("age")), None),
+        ("Sexo", _ne(patient.get("sex")), None),
+        ("Urgencia", urgency, URGENCY_BADGES.get(urgency)),
+    ))
+    _paragraph(f, NOTE)
+    f.y -= 4 * mm
+
+    indices = metrics.get("indices") or {}
+    _title(f, "Resumen ejecutivo", keep=15 * mm)
+    _kpis(f, (
+        ("Índice global", _ne(indices.get("global_health")), None),
+        ("Inflamación", _ne(indices.get("inflammation")), None),
+        ("Edad metabólica", _ne(indices.get("metabolic_age")), None),
+    ))
+    f.y -= 2 * mm
+
+    _title(f, "Resultados (con semáforo)", keep=12 * mm)
+    _table(f, ANALYTE_COLS, _analyte_rows(metrics.get("analytes") or ()),
+           "No se detectaron analitos estructurados (revisar parser).")
+
+    _title(f, "Risk score por sistema", keep=12 * mm)
+    _table(f, SYSTEM_COLS, ((str(k), str(v)) for k, v in (metrics.get("system_scores") or {}).items()), "N/E")
+
+    _title(f, "Próximos pasos sugeridos", keep=8 * mm)
+    for step in NEXT_STEPS:
+        _paragraph(f, step, size=9, color=TEXT, indent=10, bullet="•")
+    f.y -= 4 * mm
+    _title(f, "FAQ", keep=8 * mm)
+    for q, a in FAQ:
+        _paragraph(f, f"{q} {a}", size=9, color=TEXT, indent=10, bullet="•")
+    f.y -= 2 * mm
+    _paragraph(f, f"© {APP_NAME}. Uso interno / informativo.")
+
+    f.finish()
+    c.save()
+    return buffer.getvalue()
+
+
+def metrics_to_pdf(metrics: Dict[str, Any], mode: Optional[str] = None) -> bytes:
+    """
+    PDF del reporte en el modo pedido: "html" (WeasyPrint, idéntico a la vista previa) o
+    "fast" (ReportLab, para volumen).
+    """
+    mode = mode or PDF_MODE
+    if mode == "fast":
+        return metrics_to_pdf_fast(metrics)
+    if mode != "html":
+        raise ValueError(f"modo de PDF desconocido: {mode!r} (opciones: {', '.join(PDF_MODES)})")
+    from engine.pdf_html import metrics_to_pdf_bytes  # import tardío: WeasyPrint es pesado
+
+    return metrics_to_pdf_bytes(metrics)
+
+
+@timed("render.pdf_text")
 def text_to_pdf_bytes(title: str, body: str) -> bytes:
     """
     Convierte texto (markdown simple) a un PDF básico.
@@ -26,14 +366,8 @@ def text_to_pdf_bytes(title: str, body: str) -> bytes:
     lines = []
     for raw_line in clean.splitlines():
         line = raw_line.strip()
-        if not line:
-            lines.append("")
-        else:
-            # corta líneas muy largas
-            while len(line) > 110:
-                lines.append(line[:110])
-                line = line[110:]
-            lines.append(line)
+        # corta por ancho real de la fuente (no por cantidad de caracteres)
+        lines.extend(wrap(line, "Helvetica", 10, width - 2 * x) if line else [""])
 
     for line in lines:
         if y < 0.8 * inch:
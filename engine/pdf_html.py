@@ -1,9 +1,80 @@
-from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML
-
-def render_pdf_from_template(context: dict) -> bytes:
-    env = Environment(loader=FileSystemLoader("templates"))
-    tpl = env.get_template("report.html")
-    html_str = tpl.render(**context)
-    pdf_bytes = HTML(string=html_str).write_pdf()
-    return pdf_bytes
+import warnings
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+from engine.perf import timed
+from engine.report_html import TEMPLATE_DIR, render_many, render_report_html, report_css
+
+
+class ReportRenderer:
+    """
+    Renderer de larga vida para WeasyPrint: el CSS se parsea una vez y las fuentes se
+    cargan una vez (FontConfiguration compartida). El HTML sale de la plantilla compilada
+    de engine.report_html, la misma de la vista previa.
+    """
+
+    def __init__(
+        self,
+        css: str,
+        base_url: str = TEMPLATE_DIR,
+        font_config: Optional[FontConfiguration] = None,
+    ):
+        self.font_config = font_config or FontConfiguration()
+        self.stylesheet = CSS(string=css, font_config=self.font_config)
+        self.base_url = base_url
+
+    @timed("render.pdf")
+    def html_to_pdf(self, html: str) -> bytes:
+        return HTML(string=html, base_url=self.base_url).write_pdf(
+            stylesheets=[self.stylesheet],
+            font_config=self.font_config,
+        )
+
+    def render(self, metrics: Dict) -> bytes:
+        return self.html_to_pdf(render_report_html(metrics, inline_css=False))
+
+    def render_many(self, metrics_list: Iterable[Dict]) -> List[bytes]:
+        return [self.html_to_pdf(html) for html in render_many(metrics_list, inline_css=False)]
+
+
+@lru_cache(maxsize=None)
+def metrics_renderer() -> ReportRenderer:
+    # templates/report.html + templates/report.css (la misma plantilla de la vista previa)
+    return ReportRenderer(report_css())
+
+
+def html_to_pdf_bytes(html: str) -> bytes:
+    return metrics_renderer().html_to_pdf(html)
+
+
+def metrics_to_pdf_bytes(metrics: dict) -> bytes:
+    return metrics_renderer().render(metrics)
+
+
+def metrics_to_pdf_many(metrics_list: Iterable[dict]) -> List[bytes]:
+    return metrics_renderer().render_many(metrics_list)
+
+
+# --- API anterior (una plantilla aparte con su propio contexto) ---
+def template_renderer() -> ReportRenderer:
+    """
+    Obsoleto: queda una sola plantilla (la de metrics_renderer).
+    """
+    warnings.warn("template_renderer() está obsoleto: usar metrics_renderer()", DeprecationWarning, stacklevel=2)
+    return metrics_renderer()
+
+
+def render_pdf_from_template(metrics: dict) -> bytes:
+    """
+    Obsoleto: la plantilla ya no recibe un contexto armado a mano (name, age, systems...);
+    recibe las métricas de engine.scores.build_metrics, igual que metrics_to_pdf_bytes.
+    """
+    warnings.warn(
+        "render_pdf_from_template() está obsoleto: usar metrics_to_pdf_bytes(metrics)",
+        DeprecationWarning,
+        stacklevel=2,
+    )
+    return metrics_to_pdf_bytes(metrics)
@@ -0,0 +1,271 @@
+"""
+Instrumentación liviana del pipeline de reportes.
+
+    with Trace("reporte") as tr:          # una por request / archivo
+        with stage("parse.analytes"):      # tiempo (y memoria pico, opcional) por etapa
+            ...
+        count("analytes", len(obs))        # contadores: páginas, líneas, analitos...
+
+Las funciones del engine ya llaman a stage()/count(); sin Trace activa solo
+alimentan las estadísticas globales de latencia (p50/p95/p99 por etapa).
+
+Variables de entorno:
+    INTERLAB_PERF_MEMORY=1              mide memoria pico por etapa (tracemalloc, tiene costo)
+
+tracemalloc es del proceso entero: el pico de una etapa incluye lo que asignan otros hilos.
+Las Trace que miden memoria comparten el arranque/parada (se apaga con la última) y solo
+se reinicia el pico mientras mide una sola; si se superponen (sesiones de Streamlit o
+hilos de la API a la vez) sus etapas no miden memoria y la Trace queda con
+memory_shared=True. Los picos son confiables con una Trace por vez (CLI, bench).
+    INTERLAB_PROFILE_DIR=/ruta          guarda un perfil por Trace
+    INTERLAB_PROFILER=pyinstrument      usa pyinstrument (si está instalado) en vez de cProfile
+"""
+import cProfile
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, List, Iterator, Callable
+
+logger = logging.getLogger("interlab.perf")
+
+RECENT_SAMPLES = 1000  # ventana por etapa para percentiles
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("interlab_trace", default=None)
+_recent: Dict[str, deque] = {}
+_recent_lock = threading.Lock()
+_memory_lock = threading.Lock()
+_memory_users = 0  # Trace activas que miden memoria
+_memory_owned = False  # tracemalloc lo arrancó la primera de ellas (y lo para la última)
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _memory_acquire() -> None:
+    global _memory_users, _memory_owned
+    with _memory_lock:
+        if _memory_users == 0:
+            _memory_owned = not tracemalloc.is_tracing()
+            if _memory_owned:
+                tracemalloc.start()
+        _memory_users += 1
+
+
+def _memory_release() -> None:
+    global _memory_users
+    with _memory_lock:
+        _memory_users -= 1
+        if _memory_users == 0 and _memory_owned:
+            tracemalloc.stop()
+
+
+def _record_latency(name: str, seconds: float) -> None:
+    with _recent_lock:
+        q = _recent.get(name)
+        if q is None:
+            q = _recent[name] = deque(maxlen=RECENT_SAMPLES)
+        q.append(seconds)
+
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    # nearest-rank
+    k = max(0, min(len(sorted_vals) - 1, int(round(q * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+
+def latency_summary() -> Dict[str, Dict[str, float]]:
+    """
+    Percentiles de las últimas RECENT_SAMPLES ejecuciones de cada etapa (en ms).
+    """
+    with _recent_lock:
+        snap = {k: sorted(v) for k, v in _recent.items() if v}
+    return {
+        k: {
+            "n": len(v),
+            "p50_ms": round(_percentile(v, 0.50) * 1000, 2),
+            "p95_ms": round(_percentile(v, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(v, 0.99) * 1000, 2),
+            "max_ms": round(v[-1] * 1000, 2),
+        }
+        for k, v in sorted(snap.items())
+    }
+
+
+class Trace:
+    """
+    Mediciones de un request: etapas (tiempo, llamadas, memoria pico) y contadores.
+    Al cerrar se loguea como JSON en el logger 'interlab.perf'.
+    """
+
+    def __init__(
+        self,
+        name: str = "report",
+        trace_memory: Optional[bool] = None,
+        profile_dir: Optional[str] = None,
+        profiler: Optional[str] = None,
+    ):
+        self.name = name
+        self.request_id = uuid.uuid4().hex[:12]
+        self.trace_memory = _env_flag("INTERLAB_PERF_MEMORY") if trace_memory is None else trace_memory
+        self.profile_dir = profile_dir or os.environ.get("INTERLAB_PROFILE_DIR")
+        self.profiler = profiler or os.environ.get("INTERLAB_PROFILER", "cprofile")
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.counts: Dict[str, int] = {}
+        self.total_s: Optional[float] = None
+        self.profile_path: Optional[str] = None
+        self._frames: List[Dict[str, Any]] = []
+        self._token = None
+        self._prof = None
+        self._memory = False
+        self.memory_shared = False
+
+    # --- contexto ---
+    def __enter__(self) -> "Trace":
+        self._token = _current.set(self)
+        if self.trace_memory:
+            _memory_acquire()
+            self._memory = True
+        if self.profile_dir:
+            self._start_profiler()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.total_s = time.perf_counter() - self._t0
+        if self._prof is not None:
+            self._stop_profiler()
+        if self._memory:
+            self._memory = False
+            _memory_release()
+        _current.reset(self._token)
+        _record_latency(f"{self.name}.total", self.total_s)
+        logger.info(json.dumps(self.as_dict(), ensure_ascii=False, default=str))
+
+    # --- perfiles ---
+    def _start_profiler(self) -> None:
+        if self.profiler == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+                self._prof = Profiler()
+                self._prof.start()
+                return
+            except ImportError:
+                self.profiler = "cprofile"
+        self._prof = cProfile.Profile()
+        self._prof.enable()
+
+    def _stop_profiler(self) -> None:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, f"{self.name}-{self.request_id}")
+        if self.profiler == "pyinstrument":
+            self._prof.stop()
+            self.profile_path = f"{base}.html"
+            with open(self.profile_path, "w", encoding="utf-8") as f:
+                f.write(self._prof.output_html())
+        else:
+            self._prof.disable()
+            self.profile_path = f"{base}.prof"
+            self._prof.dump_stats(self.profile_path)
+        self._prof = None
+
+    # --- etapas ---
+    def _enter_stage(self) -> Dict[str, Any]:
+        frame: Dict[str, Any] = {"t0": time.perf_counter(), "mem0": None, "peak": 0}
+        if self._memory and _memory_users > 1:
+            self.memory_shared = True  # reset_peak() le arruinaría el pico a las otras
+        elif self._memory:
+            cur, pk = tracemalloc.get_traced_memory()
+            if self._frames:
+                parent = self._frames[-1]
+                parent["peak"] = max(parent["peak"], pk - parent["mem0"])
+            tracemalloc.reset_peak()
+            frame["mem0"] = cur
+        self._frames.append(frame)
+        return frame
+
+    def _exit_stage(self, name: str, frame: Dict[str, Any]) -> float:
+        elapsed = time.perf_counter() - frame["t0"]
+        self._frames.pop()
+        st = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "peak_kb": None})
+        st["seconds"] += elapsed
+        st["calls"] += 1
+        if frame["mem0"] is not None and _memory_users > 1:
+            self.memory_shared = True  # otra Trace empezó a medir durante la etapa
+        elif frame["mem0"] is not None:
+            _, pk = tracemalloc.get_traced_memory()
+            frame["peak"] = max(frame["peak"], pk - frame["mem0"])
+            st["peak_kb"] = max(st["peak_kb"] or 0, round(frame["peak"] / 1024, 1))
+            if self._frames and self._frames[-1]["mem0"] is not None:
+                parent = self._frames[-1]
+                parent["peak"] = max(parent["peak"], frame["peak"] + frame["mem0"] - parent["mem0"])
+        return elapsed
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "trace": self.name,
+            "request_id": self.request_id,
+            "total_ms": None if self.total_s is None else round(self.total_s * 1000, 2),
+            "stages": {
+                k: {
+                    "ms": round(v["seconds"] * 1000, 2),
+                    "calls": v["calls"],
+                    "peak_kb": v["peak_kb"],
+                }
+                for k, v in self.stages.items()
+            },
+            "counts": dict(self.counts),
+            "memory_shared": self.memory_shared,
+            "profile": self.profile_path,
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    tr = _current.get()
+    if tr is None:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            _record_latency(name, time.perf_counter() - t0)
+        return
+    frame = tr._enter_stage()
+    try:
+        yield
+    finally:
+        _record_latency(name, tr._exit_stage(name, frame))
+
+
+def timed(name: str) -> Callable:
+    """
+    Decorador: @timed("render.html") equivale a envolver el cuerpo en stage("render.html").
+    """
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def count(name: str, n: int = 1) -> None:
+    tr = _current.get()
+    if tr is not None:
+        tr.count(name, n)
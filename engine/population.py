@@ -0,0 +1,580 @@
+"""
+Referencia poblacional: en qué percentil de la población atendida cae cada resultado,
+por analito × unidad × sexo × banda de edad.
+
+Cada grupo es un Sketch: un t-digest con fusión (~COMPRESSION/2 centroides, más finos en
+las colas) más n / media / varianza exactas. Los sketches se suman entre sí: cada lote,
+worker o máquina arma el suyo y se fusiona con la referencia guardada sin volver a
+recorrer el historial (update_population, `merge`).
+
+Para el scoring, Population.freeze() congela cada grupo en una tabla fija de cuantiles
+(QUANTILE_GRID): percentil y z-score salen de un bisect sobre esa tabla, el mismo costo
+con cien resultados detrás que con un millón. Un grupo con menos de MIN_N resultados cede
+al siguiente más general: (sexo, banda de edad) -> (sexo, todas las edades) -> (todos).
+
+Los percentiles son orientativos y no cambian las banderas del reporte (esas salen del
+rango del laboratorio o de engine.rules).
+
+Configuración por variables de entorno:
+    INTERLAB_POPULATION=ruta.json     referencia a usar (sin ella los reportes no llevan percentil)
+    INTERLAB_POPULATION_MIN_N=30      resultados mínimos para usar un grupo
+    INTERLAB_POPULATION_CHECK=30      segundos entre revisiones del archivo
+
+Uso:
+    python -m engine.population build --db historial.db -o poblacion.json
+    python -m engine.population merge lote1.json lote2.json -o poblacion.json
+    python -m engine.population show poblacion.json
+"""
+import argparse
+import base64
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from engine.perf import timed
+from engine.rules import sex_key
+
+logger = logging.getLogger("interlab.population")
+
+POPULATION_PATH = os.environ.get("INTERLAB_POPULATION")
+POPULATION_MIN_N = int(os.environ.get("INTERLAB_POPULATION_MIN_N", "30"))
+POPULATION_CHECK_SECONDS = float(os.environ.get("INTERLAB_POPULATION_CHECK", "30"))
+
+FORMAT_VERSION = 1
+COMPRESSION = 100  # δ del t-digest: ~δ/2 centroides por sketch, error < 0.3 percentiles
+BUFFER = 5 * COMPRESSION  # valores sueltos antes de comprimir
+AGE_EDGES = (18, 30, 40, 50, 60, 70, 80)
+ALL = "*"
+# percentiles (en %) de la tabla congelada: paso 1 en el centro, más fino en las colas
+QUANTILE_GRID = (0.0, 0.1, 0.5, 1.0, 2.5) + tuple(float(p) for p in range(5, 96)) + (97.5, 99.0, 99.5, 99.9, 100.0)
+
+Key = Tuple[str, str, str, str]  # (analito canónico, unidad, sexo, banda de edad)
+# grupo congelado: (cuantiles en QUANTILE_GRID, media, desvío o None, n)
+Table = Tuple[Tuple[float, ...], float, Optional[float], int]
+
+
+@lru_cache(maxsize=256)
+def unit_key(unit: Optional[str]) -> str:
+    """
+    'mg/dL' / 'mg/dl' / ' mg / dl ' -> 'mg/dl'; 'µUI/mL' -> 'uui/ml'.
+    """
+    return "".join((unit or "").split()).lower().replace("µ", "u").replace("μ", "u")
+
+
+@lru_cache(maxsize=64)
+def _sex(sex: Optional[str]) -> str:
+    return sex_key(sex) or ALL
+
+
+def age_band(age: Any) -> str:
+    """
+    Banda de edad ('0-17', '18-29', ..., '80+'), o '*' sin edad.
+    """
+    try:
+        age = float(age)
+    except (TypeError, ValueError):
+        return ALL
+    if age != age or age < 0:
+        return ALL
+    i = bisect_right(AGE_EDGES, age)
+    if i == 0:
+        return f"0-{AGE_EDGES[0] - 1}"
+    if i == len(AGE_EDGES):
+        return f"{AGE_EDGES[-1]}+"
+    return f"{AGE_EDGES[i - 1]}-{AGE_EDGES[i] - 1}"
+
+
+def _keys(analyte: str, unit: str, sex: str, band: str) -> Tuple[Key, ...]:
+    """
+    Grupos de un resultado, del más específico al más general.
+    """
+    if sex == ALL:
+        return ((analyte, unit, ALL, ALL),)
+    if band == ALL:
+        return (analyte, unit, sex, ALL), (analyte, unit, ALL, ALL)
+    return (analyte, unit, sex, band), (analyte, unit, sex, ALL), (analyte, unit, ALL, ALL)
+
+
+# =========================
+# SKETCH (t-digest con fusión)
+# =========================
+def _k(q: float, d: float) -> float:
+    return d / (2 * math.pi) * math.asin(2 * q - 1)
+
+
+def _q_limit(q: float, d: float) -> float:
+    """
+    Hasta qué cuantil puede crecer un centroide que empieza en q (escala k1).
+    """
+    k = _k(q, d) + 1
+    if k >= d / 4:
+        return 1.0
+    return (math.sin(2 * math.pi * k / d) + 1) / 2
+
+
+class Sketch:
+    """
+    Cuantiles aproximados + momentos exactos de un grupo. add() es O(1) amortizado,
+    merge() suma otro sketch (mismo resultado que haber visto los dos conjuntos).
+    """
+
+    __slots__ = ("compression", "means", "weights", "_buf", "n", "mean", "m2", "min", "max")
+
+    def __init__(self, compression: int = COMPRESSION):
+        self.compression = compression
+        self.means: List[float] = []
+        self.weights: List[float] = []
+        self._buf: List[float] = []
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x: float) -> None:
+        # Welford: media y varianza sin guardar los valores
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        self._buf.append(x)
+        if len(self._buf) >= BUFFER:
+            self._flush()
+
+    def merge(self, other: "Sketch") -> "Sketch":
+        if not other.n:
+            return self
+        # momentos combinados (Chan et al.)
+        n = self.n + other.n
+        d = other.mean - self.mean
+        self.m2 += other.m2 + d * d * self.n * other.n / n
+        self.mean += d * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        other._flush()
+        self._compress(
+            list(zip(self.means, self.weights))
+            + list(zip(other.means, other.weights))
+            + [(x, 1.0) for x in self._buf]
+        )
+        return self
+
+    def _flush(self) -> None:
+        if self._buf:
+            self._compress(list(zip(self.means, self.weights)) + [(x, 1.0) for x in self._buf])
+
+    def _compress(self, points: List[Tuple[float, float]]) -> None:
+        self._buf = []
+        if not points:
+            return
+        points.sort()
+        total = sum(w for _, w in points)
+        d = self.compression
+        means: List[float] = []
+        weights: List[float] = []
+        done = 0.0
+        m, w = points[0]
+        limit = _q_limit(0.0, d) * total
+        for pm, pw in points[1:]:
+            if done + w + pw <= limit:
+                w += pw
+                m += (pm - m) * pw / w
+            else:
+                means.append(m)
+                weights.append(w)
+                done += w
+                limit = _q_limit(done / total, d) * total
+                m, w = pm, pw
+        means.append(m)
+        weights.append(w)
+        self.means, self.weights = means, weights
+
+    @property
+    def sd(self) -> Optional[float]:
+        if self.n < 2 or self.m2 <= 0:
+            return None
+        return math.sqrt(self.m2 / (self.n - 1))
+
+    def quantiles(self, qs: Iterable[float]) -> Tuple[float, ...]:
+        """
+        Valores en los cuantiles `qs` (0..1, ordenados): interpolación lineal entre los
+        centros de los centroides, con el mínimo y el máximo exactos en los extremos.
+        """
+        self._flush()
+        if not self.n:
+            raise ValueError("sketch vacío")
+        total = sum(self.weights)
+        xs = [0.0]
+        vs = [self.min]
+        cum = 0.0
+        for m, w in zip(self.means, self.weights):
+            xs.append(cum + w / 2)
+            vs.append(m)
+            cum += w
+        xs.append(total)
+        vs.append(self.max)
+        out = []
+        i = 1
+        for q in qs:
+            t = q * total
+            while i < len(xs) - 1 and xs[i] < t:
+                i += 1
+            x0, x1 = xs[i - 1], xs[i]
+            v0, v1 = vs[i - 1], vs[i]
+            out.append(v1 if x1 <= x0 else v0 + (v1 - v0) * (t - x0) / (x1 - x0))
+        return tuple(out)
+
+    def quantile(self, q: float) -> float:
+        return self.quantiles((q,))[0]
+
+    # --- persistencia: centroides como float32 little-endian en base64 ---
+    def to_dict(self) -> Dict[str, Any]:
+        self._flush()
+        packed = array("f", self.means + self.weights)
+        if sys.byteorder == "big":
+            packed.byteswap()
+        return {
+            "n": self.n, "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max,
+            "c": base64.b64encode(packed.tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], compression: int = COMPRESSION) -> "Sketch":
+        """
+        ValueError ante cualquier dato mal formado (campo faltante, tipo equivocado, base64
+        roto), así quien carga un archivo ajeno tiene un solo error que atrapar.
+        """
+        if not isinstance(data, dict):
+            raise ValueError(f"sketch inválido: se esperaba un objeto, llegó {type(data).__name__}")
+        s = cls(compression)
+        try:
+            s.n, s.mean, s.m2 = int(data["n"]), float(data["mean"]), float(data["m2"])
+            s.min, s.max = float(data["min"]), float(data["max"])
+            raw = base64.b64decode(data["c"], validate=True)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"sketch inválido: {type(e).__name__}: {e}") from e
+        if len(raw) % 8:
+            raise ValueError("sketch inválido: centroides incompletos")
+        packed = array("f")
+        packed.frombytes(raw)
+        if sys.byteorder == "big":
+            packed.byteswap()
+        half = len(packed) // 2
+        s.means, s.weights = packed[:half].tolist(), packed[half:].tolist()
+        return s
+
+
+# =========================
+# POBLACIÓN (mutable, se fusiona)
+# =========================
+class Population:
+    def __init__(self, compression: int = COMPRESSION):
+        self.compression = compression
+        self.sketches: Dict[Key, Sketch] = {}
+
+    def __len__(self) -> int:
+        return len(self.sketches)
+
+    def add(self, analyte: str, unit: Optional[str], sex: Optional[str], age: Any, value: Any) -> bool:
+        if value is None or isinstance(value, bool):
+            return False
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        if not math.isfinite(value):
+            return False
+        for key in _keys(analyte, unit_key(unit), _sex(sex), age_band(age)):
+            s = self.sketches.get(key)
+            if s is None:
+                s = self.sketches[key] = Sketch(self.compression)
+            s.add(value)
+        return True
+
+    def add_metrics(self, metrics: Dict[str, Any]) -> int:
+        """
+        Suma los analitos reconocidos de un reporte (métricas de engine.scores.build_metrics).
+        Devuelve cuántos resultados se sumaron.
+        """
+        patient = metrics.get("patient") or {}
+        rows = {a.get("name"): a for a in metrics.get("analytes") or ()}
+        added = 0
+        for canonical, raw in (metrics.get("analyte_map") or {}).items():
+            a = rows.get(raw)
+            if a is not None and self.add(canonical, a.get("unit"), patient.get("sex"), patient.get("age"), a.get("value")):
+                added += 1
+        return added
+
+    def merge(self, other: "Population") -> "Population":
+        for key, s in other.sketches.items():
+            mine = self.sketches.get(key)
+            if mine is None:
+                mine = self.sketches[key] = Sketch(self.compression)
+            mine.merge(s)
+        return self
+
+    def freeze(self, min_n: int = POPULATION_MIN_N, version: str = "") -> "Reference":
+        grid = [p / 100 for p in QUANTILE_GRID]
+        tables = {
+            key: (s.quantiles(grid), s.mean, s.sd, s.n)
+            for key, s in self.sketches.items()
+            if s.n >= min_n
+        }
+        return Reference(tables, version)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": FORMAT_VERSION,
+            "compression": self.compression,
+            "age_edges": list(AGE_EDGES),
+            "groups": {"|".join(key): s.to_dict() for key, s in sorted(self.sketches.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Population":
+        """
+        Errores de estructura (no solo de versión) salen como ValueError.
+        """
+        if not isinstance(data, dict):
+            raise ValueError(f"la referencia debe ser un objeto JSON, llegó {type(data).__name__}")
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"versión de referencia no soportada: {data.get('version')!r}")
+        edges, groups = data.get("age_edges") or (), data.get("groups") or {}
+        if not isinstance(edges, list) or tuple(edges) != AGE_EDGES:
+            raise ValueError("la referencia usa otras bandas de edad")
+        if not isinstance(groups, dict):
+            raise ValueError(f"'groups' debe ser un objeto, llegó {type(groups).__name__}")
+        compression = data.get("compression") or COMPRESSION
+        if not isinstance(compression, int) or isinstance(compression, bool) or compression <= 0:
+            raise ValueError(f"'compression' inválido: {compression!r}")
+        pop = cls(compression)
+        for key, s in groups.items():
+            parts = tuple(key.split("|"))
+            if len(parts) != 4:
+                raise ValueError(f"grupo inválido: {key!r}")
+            try:
+                pop.sketches[parts] = Sketch.from_dict(s, pop.compression)
+            except ValueError as e:
+                raise ValueError(f"grupo {key!r}: {e}") from e
+        return pop
+
+    def save(self, path: str) -> None:
+        """
+        Escritura atómica (archivo temporal + rename): quien lee nunca ve un archivo a medias.
+        """
+        folder = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(prefix=".population-", suffix=".json", dir=folder)
+        try:
+            try:
+                mode = os.stat(path).st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o644
+            os.chmod(tmp, mode)  # mkstemp crea 0600: la app / la API la leen con otro usuario
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "Population":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+@contextmanager
+def _locked(path: str) -> Iterator[None]:
+    try:
+        import fcntl
+    except ImportError:  # Windows: sin lock entre procesos
+        yield
+        return
+    with open(f"{path}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@timed("population.update")
+def update_population(path: str, partial: Population) -> Population:
+    """
+    Fusiona `partial` (p.ej. los resultados de un lote) con la referencia guardada en
+    `path` y la vuelve a escribir. Procesos que actualizan a la vez se turnan con un lock.
+    """
+    with _locked(path):
+        try:
+            pop = Population.load(path)
+        except FileNotFoundError:
+            pop = Population(partial.compression)
+        pop.merge(partial)
+        pop.save(path)
+    return pop
+
+
+# =========================
+# REFERENCIA (congelada, para el scoring)
+# =========================
+class Reference:
+    __slots__ = ("tables", "version")
+
+    def __init__(self, tables: Dict[Key, Table], version: str = ""):
+        self.tables = tables
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+    def lookup(self, analyte: str, unit: Optional[str], sex: Optional[str], age: Any) -> Optional[Table]:
+        for key in _keys(analyte, unit_key(unit), _sex(sex), age_band(age)):
+            table = self.tables.get(key)
+            if table is not None:
+                return table
+        return None
+
+    def score(self, analyte: str, unit: Optional[str], sex: Optional[str], age: Any, value: Any) -> Optional[Tuple[float, Optional[float]]]:
+        """
+        (percentil 0-100, z-score o None) del valor en su grupo, o None si no hay grupo.
+        """
+        if value is None or isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+            return None
+        table = self.lookup(analyte, unit, sex, age)
+        if table is None:
+            return None
+        qs, mean, sd, _ = table
+        z = round((value - mean) / sd, 2) if sd else None
+        return round(_percentile(qs, value), 1), z
+
+
+def _percentile(qs: Tuple[float, ...], v: float) -> float:
+    lo = bisect_left(qs, v)
+    hi = bisect_right(qs, v)
+    if hi == 0:
+        return QUANTILE_GRID[0]
+    if lo == len(qs):
+        return QUANTILE_GRID[-1]
+    if lo < hi:
+        # el valor coincide con uno o más puntos de la tabla (valores repetidos): el medio
+        return (QUANTILE_GRID[lo] + QUANTILE_GRID[hi - 1]) / 2
+    x0, x1 = qs[lo - 1], qs[lo]
+    g0, g1 = QUANTILE_GRID[lo - 1], QUANTILE_GRID[lo]
+    return g0 + (g1 - g0) * (v - x0) / (x1 - x0)
+
+
+# =========================
+# RECARGA EN CALIENTE
+# =========================
+_current: Optional[Reference] = None
+_stamp: Optional[Tuple[int, int]] = None
+_checked = -math.inf
+_lock = threading.Lock()
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def current_population() -> Optional[Reference]:
+    """
+    Referencia vigente (None sin INTERLAB_POPULATION o si el archivo todavía no existe).
+    Como mucho cada POPULATION_CHECK_SECONDS mira si el archivo cambió (un lote la
+    actualizó) y la vuelve a congelar; si el archivo nuevo falla se queda con la anterior.
+    """
+    global _current, _stamp, _checked
+    if not POPULATION_PATH:
+        return None
+    ref = _current
+    if time.monotonic() - _checked < POPULATION_CHECK_SECONDS:
+        return ref
+    with _lock:
+        _checked = time.monotonic()
+        stamp = _file_stamp(POPULATION_PATH)
+        if stamp == _stamp:
+            return _current
+        if stamp is None:
+            _current = None
+        else:
+            try:
+                _current = Population.load(POPULATION_PATH).freeze(version=f"{stamp[0]}:{stamp[1]}")
+                logger.info("referencia poblacional cargada: %s (%d grupos)", POPULATION_PATH, len(_current))
+            except Exception as e:  # el scoring nunca debe ver un archivo roto: sigue la anterior
+                logger.warning("referencia poblacional no cargada (%s): %s", POPULATION_PATH, e)
+                return _current
+        _stamp = stamp
+        return _current
+
+
+# =========================
+# CLI
+# =========================
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Interlab IA – referencia poblacional (percentiles por analito)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="arma la referencia desde el historial SQLite")
+    b.add_argument("--db", required=True, help="historial (engine.store)")
+    b.add_argument("--since", type=date.fromisoformat, help="desde esta fecha de toma (YYYY-MM-DD)")
+    b.add_argument("--until", type=date.fromisoformat, help="hasta esta fecha de toma (YYYY-MM-DD)")
+    b.add_argument("-o", "--out", required=True, help="referencia a escribir")
+    b.add_argument("--update", action="store_true", help="fusiona con --out si ya existe en vez de reemplazarla")
+    m = sub.add_parser("merge", help="fusiona referencias (p.ej. de varias máquinas o lotes)")
+    m.add_argument("inputs", nargs="+")
+    m.add_argument("-o", "--out", required=True)
+    s = sub.add_parser("show", help="grupos de una referencia con n, media y percentiles 5/50/95")
+    s.add_argument("path")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        from engine.store import ResultStore
+
+        pop = Population()
+        store = ResultStore(args.db)
+        try:
+            reports = values = 0
+            for r in store.iter_reports(args.since, args.until):
+                values += pop.add_metrics(r["metrics"])
+                reports += 1
+        finally:
+            store.close()
+        if args.update:
+            update_population(args.out, pop)
+        else:
+            pop.save(args.out)
+        print(f"{args.out}: {reports} reportes, {values} resultados, {len(pop)} grupos")
+    elif args.cmd == "merge":
+        pop = Population()
+        for path in args.inputs:
+            pop.merge(Population.load(path))
+        pop.save(args.out)
+        print(f"{args.out}: {len(args.inputs)} referencias, {len(pop)} grupos")
+    else:
+        pop = Population.load(args.path)
+        for key, sk in sorted(pop.sketches.items()):
+            p5, p50, p95 = sk.quantiles((0.05, 0.5, 0.95))
+            print(f"{' | '.join(key):<40} n={sk.n:<7} media={sk.mean:<10.4g} P5={p5:<10.4g} P50={p50:<10.4g} P95={p95:.4g}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
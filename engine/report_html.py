@@ -0,0 +1,203 @@
+"""
+Reporte HTML desde templates/report.html (Jinja, compilado una vez por proceso).
+
+La misma plantilla sirve a la vista previa (CSS inline) y al PDF (el CSS va aparte a
+WeasyPrint, ya parseado: ver engine.pdf_html). Los estilos son por clase (templates/report.css):
+una fila de la tabla de analitos es solo texto + clases, sin estilos repetidos.
+
+- render_report_html(metrics): el documento completo.
+- iter_report_html(metrics): el mismo documento en trozos (Template.generate), para
+  escribirlo o enviarlo mientras se genera.
+- render_many(metrics_list): muchos reportes con la plantilla ya compilada.
+- render_section / render_analyte_row / assemble_report_html: por secciones (engine.incremental).
+"""
+import os
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from engine.perf import timed
+
+APP_NAME = "Interlab IA"
+REPORT_TITLE = "Reporte clínico"
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+TEMPLATE_NAME = "report.html"
+# bytecode de la plantilla compilada, compartido entre procesos (workers del lote, API):
+# solo el primero paga la compilación. Default: el directorio temporal del usuario.
+TEMPLATE_CACHE_DIR = os.environ.get("INTERLAB_TEMPLATE_CACHE_DIR")
+
+# El reporte se arma por secciones para poder re-renderizar solo las que cambian
+# (ver engine.incremental). SECTION_INPUTS: claves de métricas que usa cada sección.
+SECTION_INPUTS = {
+    "patient": ("patient", "urgency"),
+    "summary": ("indices",),
+    "analytes": ("analytes",),
+    "systems": ("system_scores",),
+}
+SECTIONS = ("header", "patient", "summary", "analytes", "systems", "footer")
+
+# estado del analito / nivel de urgencia -> (clase CSS, texto del badge)
+FLAG_BADGES = {
+    "ok": ("ok", "Normal"),
+    "borderline": ("warn", "Límite"),
+    "high": ("bad", "Alterado"),
+    "low": ("bad", "Alterado"),
+    "unknown": ("", "N/E"),
+}
+URGENCY_BADGES = {
+    "U0": ("ok", "Sin alteraciones"),
+    "U1": ("warn", "Valores límite"),
+    "U2": ("bad", "Alterado"),
+    "U3": ("bad", "Prioritario"),
+}
+
+
+@lru_cache(maxsize=None)
+def report_css() -> str:
+    with open(os.path.join(TEMPLATE_DIR, "report.css"), encoding="utf-8") as f:
+        return f.read()
+
+
+@lru_cache(maxsize=None)
+def report_template() -> Any:
+    """
+    La plantilla compilada (import tardío de jinja2: la app no lo paga al arrancar).
+    """
+    from jinja2 import (
+        ChainableUndefined,
+        Environment,
+        FileSystemBytecodeCache,
+        FileSystemLoader,
+        Undefined,
+        select_autoescape,
+    )
+    from markupsafe import Markup
+
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=select_autoescape(["html"]),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        auto_reload=False,
+        undefined=ChainableUndefined,  # métricas incompletas: 'N/E' en vez de error
+        bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+    )
+    env.filters["ne"] = lambda v: "N/E" if v is None or isinstance(v, Undefined) else v
+    badges = lambda table: {
+        k: Markup('<span class="badge {}">{}</span>').format(cls, label) for k, (cls, label) in table.items()
+    }
+    env.globals.update(
+        app_name=APP_NAME,
+        report_title=REPORT_TITLE,
+        section_names=SECTIONS,
+        flag_badges=badges(FLAG_BADGES),
+        urgency_badges=badges(URGENCY_BADGES),
+    )
+    return env.get_template(TEMPLATE_NAME)
+
+
+def _macros() -> Any:
+    return report_template().module
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M")
+
+
+def semaforo(status: str) -> str:
+    """
+    status esperado: 'ok', 'borderline', 'high', 'low', 'unknown'
+    """
+    badges = report_template().globals["flag_badges"]
+    return badges.get((status or "unknown").lower()) or badges["unknown"]
+
+
+# =========================
+# SECCIONES
+# =========================
+def render_header() -> str:
+    return _macros().header(_now())
+
+
+def render_patient(metrics: dict) -> str:
+    return _macros().patient(metrics)
+
+
+def render_summary(metrics: dict) -> str:
+    return _macros().summary(metrics)
+
+
+def render_analyte_row(a: dict) -> str:
+    # Esperado: {"name": "...", "value":..., "unit":"...", "ref":"...", "flag":"ok/high/low/borderline/unknown"}
+    return _macros().analyte_rows((a,))
+
+
+def render_analytes(metrics: dict, rows: Optional[List[str]] = None) -> str:
+    """
+    Tabla de analitos. `rows` permite pasar filas ya renderizadas (render_analyte_row).
+    """
+    return _macros().analytes(metrics, rows)
+
+
+def render_systems(metrics: dict) -> str:
+    return _macros().systems(metrics)
+
+
+def render_footer() -> str:
+    return _macros().footer()
+
+
+def render_section(name: str, metrics: dict, generated: Optional[str] = None) -> str:
+    macros = _macros()
+    if name == "header":
+        return macros.header(generated or _now())
+    if name == "footer":
+        return macros.footer()
+    if name not in SECTION_INPUTS:
+        raise KeyError(name)
+    return getattr(macros, name)(metrics)
+
+
+def render_sections(metrics: dict) -> Dict[str, str]:
+    generated = _now()
+    return {name: render_section(name, metrics, generated) for name in SECTIONS}
+
+
+# =========================
+# DOCUMENTO
+# =========================
+def _context(metrics: Optional[dict] = None, sections: Optional[Dict[str, str]] = None, inline_css: bool = True) -> Dict[str, Any]:
+    from markupsafe import Markup
+
+    return {
+        "metrics": metrics,
+        "sections": sections,
+        "css": Markup(report_css()) if inline_css else "",
+        "generated": _now(),
+    }
+
+
+def assemble_report_html(sections: Dict[str, str], inline_css: bool = True) -> str:
+    from markupsafe import Markup
+
+    # las secciones ya son HTML (salen de los macros); no se vuelven a escapar
+    return report_template().render(_context(sections={k: Markup(v) for k, v in sections.items()}, inline_css=inline_css))
+
+
+@timed("render.html")
+def render_report_html(metrics: dict, inline_css: bool = True) -> str:
+    return report_template().render(_context(metrics, inline_css=inline_css))
+
+
+def iter_report_html(metrics: dict, inline_css: bool = True) -> Iterator[str]:
+    """
+    El documento en trozos, a medida que la plantilla avanza.
+    """
+    return report_template().generate(_context(metrics, inline_css=inline_css))
+
+
+def render_many(metrics_list: Iterable[dict], inline_css: bool = True) -> Iterator[str]:
+    template = report_template()
+    for metrics in metrics_list:
+        yield template.render(_context(metrics, inline_css=inline_css))
@@ -1,4 +1,15 @@
-from openai import OpenAI
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import random
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, AsyncIterator, Iterator
+
+import openai
+from openai import OpenAI, AsyncOpenAI
 
 SYSTEM_PROMPT = """
 Eres un generador de reportes clínicos para Interlab IA.
@@ -12,13 +23,27 @@ REGLAS:
 - Finaliza con: 3-5 próximos pasos + 4-6 FAQ personalizadas.
 """
 
-def generate_report_with_gpt(metrics_json: dict, api_key: str, model: str = "gpt-4o-mini") -> str:
-    if not api_key:
-        return "N/E: Falta OPENAI_API_KEY. Configura Secrets en Streamlit para habilitar IA."
+# Subir cuando cambie SYSTEM_PROMPT o build_user_prompt: invalida el cache de respuestas.
+PROMPT_VERSION = "2"
+
+DEFAULT_MODEL = "gpt-4o-mini"
+MISSING_KEY_MSG = "N/E: Falta OPENAI_API_KEY. Configura Secrets en Streamlit para habilitar IA."
+
+# Errores transitorios: se reintentan con backoff exponencial
+RETRYABLE = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def canonical_json(metrics: Dict[str, Any]) -> str:
+    return json.dumps(metrics, sort_keys=True, ensure_ascii=False, indent=1, default=str)
 
-    client = OpenAI(api_key=api_key)
 
-    user_prompt = f"""
+def build_user_prompt(metrics_json: Dict[str, Any]) -> str:
+    return f"""
 Genera un reporte clínico en español estilo Interlab IA, con secciones:
 
 1) Datos del paciente
@@ -31,14 +56,223 @@ Genera un reporte clínico en español estilo Interlab IA, con secciones:
 8) FAQ (4–6)
 
 JSON (usa SOLO esto):
-{metrics_json}
+{canonical_json(metrics_json)}
 """
+
+
+def build_messages(metrics_json: Dict[str, Any]) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_user_prompt(metrics_json)},
+    ]
+
+
+def response_cache_key(metrics_json: Dict[str, Any], model: str) -> str:
+    payload = f"{PROMPT_VERSION}\n{model}\n{canonical_json(metrics_json)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=8)
+def _sync_client(api_key: str, base_url: Optional[str] = None) -> OpenAI:
+    # un cliente (y su pool HTTP) por API key, no uno por llamada
+    return OpenAI(api_key=api_key, base_url=base_url)
+
+
+def generate_report_with_gpt(metrics_json: dict, api_key: str, model: str = DEFAULT_MODEL) -> str:
+    if not api_key:
+        return MISSING_KEY_MSG
+
+    client = _sync_client(api_key)
     r = client.chat.completions.create(
         model=model,
         temperature=0.3,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
+        messages=build_messages(metrics_json),
     )
     return r.choices[0].message.content
+
+
+class AsyncReportGenerator:
+    """
+    Generador asíncrono de reportes LLM:
+    - un AsyncOpenAI compartido (pool de conexiones) por event loop,
+    - máximo `max_concurrency` requests en vuelo,
+    - reintentos con backoff exponencial + jitter ante rate limits / errores transitorios,
+    - streaming de tokens,
+    - cache por hash del JSON canónico de métricas + modelo + PROMPT_VERSION.
+    `base_url` permite apuntar a un servidor stub local.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = DEFAULT_MODEL,
+        base_url: Optional[str] = None,
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        timeout: float = 120.0,
+        cache_entries: int = 256,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[AsyncOpenAI] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    # --- cache ---
+    def cached(self, metrics_json: Dict[str, Any]) -> Optional[str]:
+        key = response_cache_key(metrics_json, self.model)
+        with self._lock:
+            text = self._cache.get(key)
+            if text is not None:
+                self._cache.move_to_end(key)
+            return text
+
+    def _remember(self, metrics_json: Dict[str, Any], text: str) -> None:
+        key = response_cache_key(metrics_json, self.model)
+        with self._lock:
+            self._cache[key] = text
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    # --- cliente / semáforo (atados al event loop en uso) ---
+    def _bind(self) -> None:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,  # los reintentos los maneja _backoff
+                timeout=self.timeout,
+            )
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+
+    async def _backoff(self, attempt: int, err: Exception) -> None:
+        if attempt >= self.max_retries:
+            raise err
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        # respeta Retry-After si el servidor lo manda
+        retry_after = getattr(getattr(err, "response", None), "headers", {}).get("retry-after")
+        try:
+            delay = max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            pass
+        await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    # --- API ---
+    async def stream(self, metrics_json: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Tokens a medida que llegan. Si la respuesta está en cache sale de una sola vez.
+        Solo se reintenta antes del primer token (después no se puede deshacer lo emitido).
+        """
+        if not self.api_key:
+            yield MISSING_KEY_MSG
+            return
+        text = self.cached(metrics_json)
+        if text is not None:
+            yield text
+            return
+
+        self._bind()
+        async with self._sem:
+            attempt = 0
+            while True:
+                parts: List[str] = []
+                try:
+                    resp = await self._client.chat.completions.create(
+                        model=self.model,
+                        temperature=0.3,
+                        messages=build_messages(metrics_json),
+                        stream=True,
+                    )
+                    async for chunk in resp:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+                    break
+                except RETRYABLE as e:
+                    if parts:
+                        raise
+                    await self._backoff(attempt, e)
+                    attempt += 1
+
+        self._remember(metrics_json, "".join(parts))
+
+    async def generate(self, metrics_json: Dict[str, Any]) -> str:
+        return "".join([t async for t in self.stream(metrics_json)])
+
+    async def generate_many(self, metrics_list: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Varios reportes en paralelo (acotado por max_concurrency).
+        Un fallo no corta el resto: en su lugar queda la excepción.
+        """
+        return await asyncio.gather(*(self.generate(m) for m in metrics_list), return_exceptions=True)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._loop = None
+
+
+class _LoopThread:
+    """
+    Event loop propio en un hilo de fondo, para usar el generador async desde código
+    sincrónico (Streamlit) sin crear un loop ni un cliente nuevo por llamada.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        t = threading.Thread(target=self.loop.run_forever, name="llm-loop", daemon=True)
+        t.start()
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+_loop_thread: Optional[_LoopThread] = None
+_loop_thread_lock = threading.Lock()
+
+
+def _background_loop() -> _LoopThread:
+    global _loop_thread
+    with _loop_thread_lock:
+        if _loop_thread is None:
+            _loop_thread = _LoopThread()
+        return _loop_thread
+
+
+def iter_report_tokens(gen: AsyncReportGenerator, metrics_json: Dict[str, Any]) -> Iterator[str]:
+    """
+    Versión sincrónica de gen.stream(): sirve para st.write_stream.
+    """
+    lt = _background_loop()
+    agen = gen.stream(metrics_json)
+    while True:
+        try:
+            yield lt.run(agen.__anext__())
+        except StopAsyncIteration:
+            return
+
+
+def generate_many_sync(gen: AsyncReportGenerator, metrics_list: List[Dict[str, Any]]) -> List[Any]:
+    return _background_loop().run(gen.generate_many(metrics_list))
+
+
+def submit_report(gen: AsyncReportGenerator, metrics_json: Dict[str, Any]) -> "concurrent.futures.Future":
+    """
+    Lanza la generación sin esperar (p.ej. mientras el lote sigue renderizando PDFs).
+    """
+    return asyncio.run_coroutine_threadsafe(gen.generate(metrics_json), _background_loop().loop)
@@ -0,0 +1,411 @@
+"""
+Reglas clínicas declarativas: rangos de referencia por sexo/edad y umbrales de los índices.
+
+Las reglas viven en un archivo de datos (JSON, o YAML si está PyYAML) y se compilan al
+cargar a tablas de búsqueda:
+- rangos: por analito, grupos (sexo, unidades) con tramos de edad ordenados -> bisect,
+- metabolic_age: escaleras (cortes ordenados + puntos por tramo) -> bisect
+  (engine.cohort usa las mismas tablas con np.digitize),
+- inflamación: términos lineales recortados; global_health y urgencia: pesos y cortes.
+
+Los rangos de las reglas solo se usan cuando el PDF no trae referencia (la del
+laboratorio manda) y, si la regla lista unidades, solo con esas unidades.
+
+current_rules() revisa el archivo cada INTERLAB_RULES_CHECK segundos y lo recompila si
+cambió: los umbrales se ajustan sin reiniciar. Un archivo inválido se reporta en el log y
+se siguen usando las reglas anteriores.
+
+Configuración por variables de entorno:
+    INTERLAB_RULES=ruta.json|.yaml   (default: rules/default.json)
+    INTERLAB_RULES_CHECK=2           segundos entre revisiones del archivo (0 = siempre)
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from engine.analytes import SYNONYMS, normalize_name
+
+logger = logging.getLogger("interlab.rules")
+
+RULES_PATH = os.environ.get("INTERLAB_RULES") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rules", "default.json"
+)
+RULES_CHECK_SECONDS = float(os.environ.get("INTERLAB_RULES_CHECK", "2"))
+
+Range = Tuple[Optional[float], Optional[float], str]  # (low, high, texto de referencia)
+# escalera aplanada para el loop caliente: (analito, cortes, puntos, bisect_left|bisect_right)
+LadderRow = Tuple[str, Tuple[float, ...], Tuple[float, ...], Callable[..., int]]
+# término aplanado: (analito, unless, offset, scale, min, max)
+TermRow = Tuple[str, Optional[str], float, float, Optional[float], Optional[float]]
+
+
+class RuleError(ValueError):
+    pass
+
+
+def sex_key(sex: Optional[str]) -> Optional[str]:
+    """
+    'Masculino' / 'Hombre' / 'M' -> 'M'; 'Femenino' / 'Mujer' / 'F' -> 'F'; otro -> None.
+    """
+    n = normalize_name(sex or "")
+    if n.startswith(("muj", "fem", "f")):
+        return "F"
+    if n.startswith(("masc", "hom", "m", "h")):
+        return "M"
+    return None
+
+
+def _num(x: Any, where: str) -> Optional[float]:
+    if x is None:
+        return None
+    if isinstance(x, bool) or not isinstance(x, (int, float)):
+        raise RuleError(f"{where}: se esperaba un número, vino {x!r}")
+    return float(x)
+
+
+def _req(x: Any, where: str) -> float:
+    if x is None:
+        raise RuleError(f"{where}: se esperaba un número, vino null")
+    return _num(x, where)
+
+
+def _int(x: Any, where: str) -> int:
+    if isinstance(x, bool) or not isinstance(x, (int, float)) or x != int(x):
+        raise RuleError(f"{where}: se esperaba un entero, vino {x!r}")
+    return int(x)
+
+
+def _obj(x: Any, where: str) -> Dict[str, Any]:
+    if x is None:
+        return {}
+    if not isinstance(x, dict):
+        raise RuleError(f"{where}: se esperaba un objeto, vino {x!r}")
+    return x
+
+
+def _list(x: Any, where: str) -> List[Any]:
+    if x is None:
+        return []
+    if not isinstance(x, list):
+        raise RuleError(f"{where}: se esperaba una lista, vino {x!r}")
+    return x
+
+
+def _canonical(name: Any, where: str) -> str:
+    if name not in SYNONYMS:
+        raise RuleError(f"{where}: analito desconocido {name!r} (ver engine.analytes.SYNONYMS)")
+    return name
+
+
+def _range_text(low: Optional[float], high: Optional[float]) -> str:
+    fmt = lambda x: f"{x:g}"
+    if low is not None and high is not None:
+        return f"{fmt(low)} - {fmt(high)} (regla)"
+    if low is not None:
+        return f">= {fmt(low)} (regla)"
+    return f"< {fmt(high)} (regla)"
+
+
+# =========================
+# RANGOS DE REFERENCIA
+# =========================
+@dataclass(frozen=True)
+class RangeGroup:
+    """
+    Reglas de un analito para un sexo (None = ambos) y un juego de unidades (vacío = cualquiera),
+    con tramos de edad: el tramo i va de ages[i] (inclusive) a ages[i + 1].
+    """
+    sex: Optional[str]
+    units: FrozenSet[str]
+    ages: Tuple[float, ...]
+    lows: Tuple[Optional[float], ...]
+    highs: Tuple[Optional[float], ...]
+    texts: Tuple[str, ...]
+
+    def accepts(self, sex: Optional[str], unit: str) -> bool:
+        if self.sex is not None and self.sex != sex:
+            return False
+        return not self.units or normalize_name(unit) in self.units
+
+    def band(self, age: Optional[float]) -> Optional[int]:
+        if age is None:
+            # sin edad solo sirve una regla que no dependa de ella
+            return 0 if len(self.ages) == 1 else None
+        i = bisect_right(self.ages, age) - 1
+        return i if i >= 0 else None
+
+
+def _compile_ranges(canonical: str, entries: Any) -> Tuple[RangeGroup, ...]:
+    if not isinstance(entries, list) or not entries:
+        raise RuleError(f"ranges.{canonical}: se esperaba una lista de reglas")
+    groups: Dict[Tuple[Optional[str], FrozenSet[str]], List[Tuple[float, Optional[float], Optional[float], str]]] = {}
+    for i, e in enumerate(entries):
+        where = f"ranges.{canonical}[{i}]"
+        if not isinstance(e, dict):
+            raise RuleError(f"{where}: se esperaba un objeto, vino {e!r}")
+        sex = e.get("sex")
+        if sex not in (None, "M", "F"):
+            raise RuleError(f"{where}: sex debe ser 'M' o 'F'")
+        low, high = _num(e.get("low"), where), _num(e.get("high"), where)
+        if low is None and high is None:
+            raise RuleError(f"{where}: falta low o high")
+        if low is not None and high is not None and low > high:
+            raise RuleError(f"{where}: low > high")
+        units = _list(e.get("units"), f"{where}.units")
+        if not all(isinstance(u, str) for u in units):
+            raise RuleError(f"{where}.units: se esperaban textos")
+        text = e.get("text")
+        if text is not None and not isinstance(text, str):
+            raise RuleError(f"{where}.text: se esperaba un texto")
+        age = _req(e.get("age_min", 0), where)
+        groups.setdefault((sex, frozenset(normalize_name(u) for u in units)), []).append(
+            (age, low, high, text or _range_text(low, high))
+        )
+
+    out = []
+    for (sex, units), bands in groups.items():
+        bands.sort(key=lambda b: b[0])
+        ages = tuple(b[0] for b in bands)
+        if len(set(ages)) != len(ages):
+            raise RuleError(f"ranges.{canonical}: tramos de edad repetidos para sex={sex} units={sorted(units)}")
+        out.append(RangeGroup(
+            sex, units, ages,
+            tuple(b[1] for b in bands), tuple(b[2] for b in bands), tuple(b[3] for b in bands),
+        ))
+    # lo más específico primero: con sexo antes que sin sexo, con unidades antes que sin unidades
+    out.sort(key=lambda g: (g.sex is None, not g.units))
+    return tuple(out)
+
+
+# =========================
+# ÍNDICES
+# =========================
+@dataclass(frozen=True)
+class Ladder:
+    """
+    Puntos por tramo: cortes ordenados, len(points) == len(cuts) + 1.
+    right=False: cortes tipo '>= x'; right=True: cortes tipo '> x' (como np.digitize).
+    """
+    analyte: str
+    cuts: Tuple[float, ...]
+    points: Tuple[float, ...]
+    right: bool = False
+
+    @property
+    def find(self) -> Callable[..., int]:
+        return bisect_left if self.right else bisect_right
+
+
+@dataclass(frozen=True)
+class Term:
+    """
+    Aporte lineal recortado: clip((x + offset) * scale, min, max).
+    `unless`: el término no cuenta si ese otro analito está (p.ej. leucocitos solo sin PCR).
+    """
+    analyte: str
+    scale: float = 1.0
+    offset: float = 0.0
+    min: Optional[float] = None
+    max: Optional[float] = None
+    unless: Optional[str] = None
+
+
+def _compile_ladder(e: Any, where: str) -> Ladder:
+    e = _obj(e, where)
+    cuts = tuple(_req(c, where) for c in _list(e.get("cuts"), f"{where}.cuts"))
+    points = tuple(_req(p, where) for p in _list(e.get("points"), f"{where}.points"))
+    if list(cuts) != sorted(cuts) or len(points) != len(cuts) + 1:
+        raise RuleError(f"{where}: cortes ordenados y len(points) == len(cuts) + 1")
+    return Ladder(_canonical(e.get("analyte"), where), cuts, points, bool(e.get("right", False)))
+
+
+def _compile_term(e: Any, where: str) -> Term:
+    e = _obj(e, where)
+    unless = e.get("unless")
+    return Term(
+        _canonical(e.get("analyte"), where),
+        scale=_req(e.get("scale", 1), where),
+        offset=_req(e.get("offset", 0), where),
+        min=_num(e.get("min"), where),
+        max=_num(e.get("max"), where),
+        unless=_canonical(unless, where) if unless is not None else None,
+    )
+
+
+# =========================
+# REGLAS COMPILADAS
+# =========================
+@dataclass(frozen=True)
+class RuleSet:
+    version: str  # hash del archivo: cambia con cada edición
+    path: Optional[str]
+    red_distance: float
+    urgency: Tuple[int, int, int]  # rojas para U3, rojas para U2, límites para U1
+    ranges: Dict[str, Tuple[RangeGroup, ...]]
+    inflammation: Tuple[Term, ...]
+    inflammation_bounds: Tuple[float, float]
+    metabolic: Tuple[Ladder, ...]
+    global_health: Tuple[float, float, float, float, float]  # base, peso inflamación, peso rojas, min, max
+    metabolic_table: Tuple[LadderRow, ...] = ()
+    inflammation_table: Tuple[TermRow, ...] = ()
+
+    @property
+    def index_inputs(self) -> Dict[str, FrozenSet[str]]:
+        """
+        Analitos canónicos que lee cada índice (engine.incremental recalcula solo esos).
+        """
+        return {
+            "inflammation": frozenset(t.analyte for t in self.inflammation)
+            | frozenset(t.unless for t in self.inflammation if t.unless),
+            "metabolic_age": frozenset(l.analyte for l in self.metabolic),
+        }
+
+    def reference(self, canonical: Optional[str], sex: Optional[str], age: Optional[float], unit: str = "") -> Optional[Range]:
+        """
+        Rango de las reglas para un analito y paciente, o None si ninguna regla aplica.
+        """
+        groups = self.ranges.get(canonical) if canonical is not None else None
+        if not groups:
+            return None
+        s = sex_key(sex)
+        for g in groups:
+            if g.accepts(s, unit):
+                i = g.band(age)
+                if i is not None:
+                    return g.lows[i], g.highs[i], g.texts[i]
+        return None
+
+    def urgency_level(self, red_flags: int, borderline: int) -> str:
+        red_u3, red_u2, borderline_u1 = self.urgency
+        if red_flags >= red_u3:
+            return "U3"
+        if red_flags >= red_u2:
+            return "U2"
+        if borderline >= borderline_u1:
+            return "U1"
+        return "U0"
+
+
+def compile_rules(data: Dict[str, Any], version: str = "", path: Optional[str] = None) -> RuleSet:
+    """
+    dict (el contenido del archivo de reglas) -> RuleSet. RuleError si algo no cierra.
+    """
+    if not isinstance(data, dict):
+        raise RuleError("el archivo de reglas debe ser un objeto")
+    flag = _obj(data.get("flag"), "flag")
+    urgency = _obj(data.get("urgency"), "urgency")
+    indices = _obj(data.get("indices"), "indices")
+    infl = _obj(indices.get("inflammation"), "indices.inflammation")
+    meta = _obj(indices.get("metabolic_age"), "indices.metabolic_age")
+    gh = _obj(indices.get("global_health"), "indices.global_health")
+
+    ranges = {
+        _canonical(c, f"ranges.{c}"): _compile_ranges(c, entries)
+        for c, entries in _obj(data.get("ranges"), "ranges").items()
+    }
+    inflammation = tuple(
+        _compile_term(t, f"indices.inflammation.terms[{i}]")
+        for i, t in enumerate(_list(infl.get("terms"), "indices.inflammation.terms"))
+    )
+    metabolic = tuple(
+        _compile_ladder(l, f"indices.metabolic_age.ladders[{i}]")
+        for i, l in enumerate(_list(meta.get("ladders"), "indices.metabolic_age.ladders"))
+    )
+    return RuleSet(
+        version=version,
+        path=path,
+        red_distance=_req(flag.get("red_distance", 0.15), "flag.red_distance"),
+        urgency=tuple(
+            _int(urgency.get(k, d), f"urgency.{k}") for k, d in (("red_U3", 3), ("red_U2", 1), ("borderline_U1", 1))
+        ),
+        ranges=ranges,
+        inflammation=inflammation,
+        inflammation_bounds=(
+            _req(infl.get("min", 0), "indices.inflammation.min"),
+            _req(infl.get("max", 100), "indices.inflammation.max"),
+        ),
+        metabolic=metabolic,
+        global_health=tuple(
+            _req(gh.get(k, d), f"indices.global_health.{k}")
+            for k, d in (("base", 90), ("inflammation", 0.5), ("red_flags", 8), ("min", 0), ("max", 100))
+        ),
+        metabolic_table=tuple((l.analyte, l.cuts, l.points, l.find) for l in metabolic),
+        inflammation_table=tuple((t.analyte, t.unless, t.offset, t.scale, t.min, t.max) for t in inflammation),
+    )
+
+
+def _parse(raw: bytes, path: str) -> Dict[str, Any]:
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError as e:
+            raise RuleError("reglas en YAML requieren PyYAML (pip install pyyaml)") from e
+        return yaml.safe_load(raw)
+    return json.loads(raw)
+
+
+def load_rules(path: str = RULES_PATH) -> RuleSet:
+    with open(path, "rb") as f:
+        raw = f.read()
+    try:
+        data = _parse(raw, path)
+    except RuleError:
+        raise
+    except Exception as e:
+        raise RuleError(f"{path}: {e}") from e
+    try:
+        return compile_rules(data, version=hashlib.sha1(raw).hexdigest()[:12], path=path)
+    except RuleError:
+        raise
+    except Exception as e:  # un tipo inesperado que la validación no cubre: tampoco tumba el scoring
+        raise RuleError(f"{path}: {type(e).__name__}: {e}") from e
+
+
+# =========================
+# RECARGA EN CALIENTE
+# =========================
+_current: Optional[RuleSet] = None
+_stamp: Optional[Tuple[int, int]] = None
+_checked = 0.0
+_lock = threading.Lock()
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def current_rules() -> RuleSet:
+    """
+    Reglas vigentes. Como mucho cada RULES_CHECK_SECONDS mira si el archivo cambió y lo
+    recompila; si la versión nueva falla se queda con la anterior.
+    """
+    global _current, _stamp, _checked
+    rules = _current
+    if rules is not None and time.monotonic() - _checked < RULES_CHECK_SECONDS:
+        return rules
+    with _lock:
+        _checked = time.monotonic()
+        stamp = _file_stamp(RULES_PATH)
+        if _current is not None and stamp == _stamp:
+            return _current
+        try:
+            _current = load_rules(RULES_PATH)
+            if rules is not None:
+                logger.info("reglas recargadas: %s (versión %s)", RULES_PATH, _current.version)
+        except (OSError, RuleError) as e:
+            if _current is None:
+                raise
+            logger.warning("reglas no recargadas, sigo con la versión %s: %s", _current.version, e)
+        _stamp = stamp
+        return _current
+
@@ -1,25 +1,35 @@
 from typing import Dict, Optional, Any, Tuple
-import math
 
-def flag(value: Optional[float], low: Optional[float], high: Optional[float]) -> str:
+from engine.analytes import AnalyteIndex, analyte_index
+from engine.perf import timed
+from engine.population import Reference, current_population
+from engine.rules import RuleSet, current_rules
+
+# Umbrales, pesos y rangos de referencia por sexo/edad vienen de engine.rules
+# (rules/default.json). Cada función acepta `rules` para evaluar todo un reporte con
+# la misma versión; sin él usa current_rules().
+# El percentil poblacional de cada analito (engine.population) es informativo: no cambia flags.
+
+def flag(value: Optional[float], low: Optional[float], high: Optional[float], rules: Optional[RuleSet] = None) -> str:
     """
     Semáforo:
     green = dentro
     yellow = leve fuera
-    red = muy fuera
+    red = muy fuera (más de rules.red_distance relativo al límite)
     gray = N/E
     """
     if value is None:
         return "gray"
     if low is None and high is None:
         return "gray"
+    red_distance = (rules or current_rules()).red_distance
     if low is not None and value < low:
         # qué tan lejos
         dist = (low - value) / (abs(low) + 1e-9)
-        return "red" if dist > 0.15 else "yellow"
+        return "red" if dist > red_distance else "yellow"
     if high is not None and value > high:
         dist = (value - high) / (abs(high) + 1e-9)
-        return "red" if dist > 0.15 else "yellow"
+        return "red" if dist > red_distance else "yellow"
     return "green"
 
 def get(obs: Dict[str, Any], key_contains: str) -> Optional[float]:
@@ -29,101 +39,163 @@ def get(obs: Dict[str, Any], key_contains: str) -> Optional[float]:
             return getattr(v, "value", None)
     return None
 
-def inflammation_index(obs: Dict[str, Any]) -> int:
+def inflammation_index(obs: Dict[str, Any], rules: Optional[RuleSet] = None) -> int:
     """
-    0–100 (menor es mejor). Heurística:
+    0–100 (menor es mejor). Suma de aportes recortados (indices.inflammation.terms):
     - PCR (si existe)
     - VSG / eritrosedimentación
-    - leucocitos
+    - leucocitos (solo sin PCR)
     """
-    esr = get(obs, "eritrosed") or get(obs, "vsg")
-    crp = get(obs, "proteína c") or get(obs, "pcr")
-    wbc = get(obs, "leucoc")
-
+    rules = rules or current_rules()
+    idx = analyte_index(obs)
+    raw_of, values = idx.matches.get, idx.obs
     score = 0.0
-    if esr is not None:
-        score += min(60, esr)  # 0–60
-    if crp is not None:
-        score += min(40, crp * 5)  # PCR 0–8 -> 0–40 aprox
-    elif wbc is not None:
-        score += max(0, min(40, (wbc - 7) * 6))  # leucocitos altos suben
-
-    return int(max(0, min(100, score)))
-
-def global_health_index(infl: int, red_flags: int) -> int:
+    for analyte, unless, offset, scale, lo, hi in rules.inflammation_table:
+        raw = raw_of(analyte)
+        x = None if raw is None else values[raw].value
+        if x is None:
+            continue
+        if unless is not None:
+            other = raw_of(unless)
+            if other is not None and values[other].value is not None:
+                continue
+        s = (x + offset) * scale
+        if hi is not None:
+            s = min(hi, s)
+        if lo is not None:
+            s = max(lo, s)
+        score += s
+    lo, hi = rules.inflammation_bounds
+    return int(max(lo, min(hi, score)))
+
+def global_health_index(infl: int, red_flags: int, rules: Optional[RuleSet] = None) -> int:
     """
     0–100 (más es mejor).
     Penaliza inflamación y banderas rojas.
     """
-    base = 90
-    base -= int(infl * 0.5)
-    base -= int(red_flags * 8)
-    return int(max(0, min(100, base)))
+    base, w_infl, w_red, lo, hi = (rules or current_rules()).global_health
+    base -= int(infl * w_infl)
+    base -= int(red_flags * w_red)
+    return int(max(lo, min(hi, base)))
 
-def metabolic_age(age: int, obs: Dict[str, Any]) -> int:
+def metabolic_age(age: int, obs: Dict[str, Any], rules: Optional[RuleSet] = None) -> int:
     """
     MIRA es propietario; aquí hacemos tu versión:
     suma “años” según riesgo cardiometabólico/renal/inflamatorio.
-    Calibrable para que te dé ~42 en el caso LDL alto.
+    Cada analito aporta según su escalera (indices.metabolic_age.ladders: LDL, colesterol
+    total, HDL, HbA1c, triglicéridos, TFG, PCR); calibrada para ~42 con 37 años y LDL ~174.
     """
     if age is None:
         return None
 
+    idx = analyte_index(obs)
+    raw_of, values = idx.matches.get, idx.obs
     years = 0.0
-
-    ldl = get(obs, "l d l") or get(obs, "ldl")
-    tc  = get(obs, "colesterol sérico") or get(obs, "colesterol total")
-    hdl = get(obs, "h d l") or get(obs, "hdl")
-    a1c = get(obs, "hemoglobina glicosilada") or get(obs, "hba1c")
-    tg  = get(obs, "triglic")
-    egfr = get(obs, "tfg")  # si viene en el pdf
-    crp = get(obs, "pcr") or get(obs, "proteína c")
-
-    # LDL: principal (para que 37 -> ~42 cuando LDL ~174)
-    if ldl is not None:
-        if ldl >= 190: years += 7
-        elif ldl >= 160: years += 5
-        elif ldl >= 130: years += 3
-        elif ldl >= 100: years += 1
-
-    # Colesterol total
-    if tc is not None:
-        if tc >= 240: years += 2
-        elif tc >= 200: years += 1
-
-    # HDL bajo
-    if hdl is not None:
-        if hdl < 40: years += 2
-        elif hdl < 50: years += 1
-
-    # HbA1c
-    if a1c is not None:
-        if a1c >= 6.5: years += 6
-        elif a1c >= 5.7: years += 3
-
-    # Triglicéridos
-    if tg is not None:
-        if tg >= 200: years += 2
-        elif tg >= 150: years += 1
-
-    # eGFR bajo
-    if egfr is not None:
-        if egfr < 60: years += 6
-        elif egfr < 90: years += 2
-
-    # PCR alta
-    if crp is not None:
-        if crp > 10: years += 3
-        elif crp > 3: years += 1
+    for analyte, cuts, points, find in (rules or current_rules()).metabolic_table:
+        raw = raw_of(analyte)
+        if raw is not None:
+            x = values[raw].value
+            if x is not None:
+                years += points[find(cuts, x)]
 
     return int(round(age + years))
 
-def count_red_flags(obs: Dict[str, Any]) -> int:
-    reds = 0
-    for k, v in obs.items():
-        low = getattr(v, "ref_low", None)
-        high = getattr(v, "ref_high", None)
-        val = getattr(v, "value", None)
-        if flag(val, low, high) == "red":
-            reds += 1
-    return reds
+def count_red_flags(obs: Dict[str, Any], patient: Optional[Dict[str, Any]] = None, rules: Optional[RuleSet] = None) -> int:
+    rules = rules or current_rules()
+    canonical = {raw: c for c, raw in AnalyteIndex(obs).matches.items()}
+    return sum(
+        1 for k, v in obs.items()
+        if analyte_row(k, v, canonical.get(k), patient or {}, rules)["flag"] in ("high", "low")
+    )
+
+def analyte_status(value: Optional[float], low: Optional[float], high: Optional[float], rules: Optional[RuleSet] = None) -> str:
+    """
+    Traduce el semáforo a los estados que usa el reporte:
+    'ok', 'borderline', 'high', 'low', 'unknown'
+    """
+    color = flag(value, low, high, rules)
+    if color == "green":
+        return "ok"
+    if color == "yellow":
+        return "borderline"
+    if color == "red":
+        return "low" if low is not None and value < low else "high"
+    return "unknown"
+
+def analyte_row(
+    name: str,
+    o: Any,
+    canonical: Optional[str],
+    patient: Dict[str, Any],
+    rules: RuleSet,
+    population: Optional[Reference] = None,
+) -> Dict[str, Any]:
+    """
+    Fila de la tabla de analitos del reporte (la usan build_metrics y engine.incremental).
+    Sin referencia en el PDF se usa la de las reglas para el sexo/edad del paciente.
+    Con `population` la fila lleva además "pct" (percentil 0-100) y "z" en su grupo.
+    """
+    low, high, ref_text = o.ref_low, o.ref_high, o.ref_text
+    if low is None and high is None and canonical in rules.ranges:
+        ref = rules.reference(canonical, patient.get("sex"), patient.get("age"), o.unit)
+        if ref is not None:
+            low, high, ref_text = ref
+    row = {
+        "name": name,
+        "value": o.value,
+        "unit": o.unit,
+        "ref": ref_text or "N/E",
+        "flag": analyte_status(o.value, low, high, rules),
+    }
+    if population is not None and canonical is not None:
+        scored = population.score(canonical, o.unit, patient.get("sex"), patient.get("age"), o.value)
+        if scored is not None:
+            row["pct"], row["z"] = scored
+    return row
+
+def urgency_level(red_flags: int, borderline: int, rules: Optional[RuleSet] = None) -> str:
+    """
+    U0 = todo en rango, U1 = solo valores límite,
+    U2 = 1–2 banderas rojas, U3 = 3 o más banderas rojas (cortes en rules.urgency).
+    """
+    return (rules or current_rules()).urgency_level(red_flags, borderline)
+
+@timed("score")
+def build_metrics(
+    obs: Dict[str, Any],
+    patient: Optional[Dict[str, Any]] = None,
+    rules: Optional[RuleSet] = None,
+    population: Optional[Reference] = None,
+) -> Dict[str, Any]:
+    """
+    Arma el dict de métricas que consumen el reporte HTML/PDF y el LLM.
+    Sin `population` usa current_population() (ninguna si INTERLAB_POPULATION no está).
+    """
+    patient = patient or {}
+    rules = rules or current_rules()
+    population = population if population is not None else current_population()
+    idx = AnalyteIndex(obs)  # una vez por reporte, lo comparten todos los índices
+    canonical = {raw: c for c, raw in idx.matches.items()}
+    analytes = [analyte_row(k, v, canonical.get(k), patient, rules, population) for k, v in obs.items()]
+
+    reds = sum(1 for a in analytes if a["flag"] in ("high", "low"))
+    borderline = sum(1 for a in analytes if a["flag"] == "borderline")
+    infl = inflammation_index(idx, rules)
+
+    return {
+        "patient": {
+            "name": patient.get("name"),
+            "age": patient.get("age"),
+            "sex": patient.get("sex"),
+        },
+        "urgency": urgency_level(reds, borderline, rules),
+        "red_flags": reds,
+        "indices": {
+            "global_health": global_health_index(infl, reds, rules),
+            "inflammation": infl,
+            "metabolic_age": metabolic_age(patient.get("age"), idx, rules),
+        },
+        "analytes": analytes,
+        "analyte_map": dict(idx.matches),  # canónico -> nombre en el PDF (auditoría)
+        "system_scores": {},
+    }
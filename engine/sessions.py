@@ -0,0 +1,347 @@
+"""
+Estado por sesión de la app, acotado en memoria y en disco.
+
+Con muchas sesiones abiertas, lo que cada una sube o arma no puede vivir en
+st.session_state ni quedar tirado en /tmp:
+
+- UploadManager: cada subida se copia una vez a un SpooledTemporaryFile (en memoria
+  hasta UPLOAD_SPOOL_MB, después en un archivo temporal ya borrado del directorio),
+  calculando el SHA-256 al copiar. Límites por archivo (según tipo) y por sesión; si una
+  sesión se pasa, se sueltan sus subidas más viejas. La sesión guarda solo un
+  UploadHandle (nombre, tamaño, hash). Las carpetas de trabajo (p.ej. la salida de un
+  lote) también son de la sesión. Todo se libera con release_session o cuando la sesión
+  pasa SESSION_TTL sin actividad; las carpetas que dejó un proceso caído se borran al
+  arrancar.
+- SessionReports: el reporte en edición de cada sesión (engine.incremental), en un LRU
+  compartido. Si se descarta se vuelve a armar desde el cache de parseo.
+
+Configuración por variables de entorno:
+    INTERLAB_UPLOAD_MAX_MB=20      por PDF
+    INTERLAB_BATCH_MAX_MB=200      por ZIP de lote
+    INTERLAB_SESSION_MAX_MB=250    por sesión (suma de sus subidas)
+    INTERLAB_UPLOAD_SPOOL_MB=2     hasta este tamaño la subida queda en memoria
+    INTERLAB_UPLOAD_DIR=/ruta      subidas y carpetas de trabajo (default: <tmp>/interlab_uploads)
+    INTERLAB_SESSION_TTL=3600      segundos sin actividad hasta liberar una sesión
+    INTERLAB_SESSION_REPORTS=64    reportes en edición en memoria (todas las sesiones)
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+from engine.perf import count
+
+logger = logging.getLogger("interlab.sessions")
+
+MB = 1024 * 1024
+UPLOAD_MAX_MB = float(os.environ.get("INTERLAB_UPLOAD_MAX_MB", "20"))
+BATCH_MAX_MB = float(os.environ.get("INTERLAB_BATCH_MAX_MB", "200"))
+SESSION_MAX_MB = float(os.environ.get("INTERLAB_SESSION_MAX_MB", "250"))
+UPLOAD_SPOOL_MB = float(os.environ.get("INTERLAB_UPLOAD_SPOOL_MB", "2"))
+UPLOAD_DIR = os.environ.get("INTERLAB_UPLOAD_DIR") or os.path.join(tempfile.gettempdir(), "interlab_uploads")
+SESSION_TTL = float(os.environ.get("INTERLAB_SESSION_TTL", "3600"))
+SESSION_REPORTS = int(os.environ.get("INTERLAB_SESSION_REPORTS", "64"))
+SWEEP_SECONDS = 60  # como mucho una barrida de sesiones vencidas por minuto
+COPY_CHUNK = 1024 * 1024
+
+# tipo de subida -> (tope en MB, firma del archivo, descripción para el error)
+UPLOAD_KINDS: Dict[str, Tuple[float, bytes, str]] = {
+    "pdf": (UPLOAD_MAX_MB, b"%PDF", "PDF"),
+    "zip": (BATCH_MAX_MB, b"PK", "ZIP"),
+}
+
+
+class UploadError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class UploadHandle:
+    """
+    Lo único que la sesión guarda de una subida.
+    """
+
+    session: str
+    digest: str  # SHA-256 del contenido (el mismo que engine.cache.pdf_digest)
+    name: str
+    size: int
+    kind: str
+
+
+@dataclass
+class _Session:
+    uploads: "OrderedDict[str, Tuple[UploadHandle, Any]]" = field(default_factory=OrderedDict)
+    workdirs: Dict[str, str] = field(default_factory=dict)
+    size: int = 0
+    seen: float = field(default_factory=time.monotonic)
+
+
+def _mb(n: float) -> str:
+    return f"{n / MB:.1f} MB"
+
+
+class UploadManager:
+    """
+    Subidas y carpetas de trabajo de todas las sesiones. Thread-safe (Streamlit atiende
+    cada sesión en su propio hilo).
+    """
+
+    def __init__(
+        self,
+        upload_dir: str = UPLOAD_DIR,
+        session_max_mb: float = SESSION_MAX_MB,
+        spool_mb: float = UPLOAD_SPOOL_MB,
+        ttl: float = SESSION_TTL,
+    ):
+        self.upload_dir = upload_dir
+        self.session_max = int(session_max_mb * MB)
+        self.spool = int(spool_mb * MB)
+        self.ttl = ttl
+        self._sessions: Dict[str, _Session] = {}
+        self._lock = threading.Lock()
+        self._swept = time.monotonic()
+        os.makedirs(upload_dir, exist_ok=True)
+        self._remove_orphans()
+
+    # --- subidas ---
+    def put(self, session: str, upload: BinaryIO, name: str, kind: str = "pdf", size: Optional[int] = None) -> UploadHandle:
+        """
+        Copia `upload` (p.ej. el UploadedFile de Streamlit) al almacenamiento de la sesión.
+        Lanza UploadError si es más grande que el tope de su tipo o no es de ese tipo.
+        Subir otra vez el mismo contenido devuelve el handle que ya estaba.
+        """
+        if kind not in UPLOAD_KINDS:
+            raise ValueError(f"kind debe ser uno de {tuple(UPLOAD_KINDS)}")
+        max_mb, magic, label = UPLOAD_KINDS[kind]
+        limit = min(int(max_mb * MB), self.session_max)
+        if size is not None and size > limit:
+            count("upload_rejected")
+            raise UploadError(f"{name}: {_mb(size)}, el máximo por {label} es {_mb(limit)}")
+
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool, dir=self.upload_dir)
+        try:
+            h = hashlib.sha256()
+            total = 0
+            upload.seek(0)
+            while True:
+                chunk = upload.read(COPY_CHUNK)
+                if not chunk:
+                    break
+                if total == 0 and not chunk.startswith(magic):
+                    raise UploadError(f"{name}: el archivo no es un {label}")
+                total += len(chunk)
+                if total > limit:
+                    count("upload_rejected")
+                    raise UploadError(f"{name}: más de {_mb(limit)}, el máximo por {label}")
+                h.update(chunk)
+                spool.write(chunk)
+            if total == 0:
+                raise UploadError(f"{name}: archivo vacío")
+        except BaseException:
+            spool.close()
+            raise
+
+        digest = h.hexdigest()
+        with self._lock:
+            s = self._session(session)
+            old = s.uploads.get(digest)
+            if old is not None:
+                s.uploads.move_to_end(digest)
+                spool.close()
+                return old[0]
+            # lugar para la subida nueva: se sueltan las más viejas de la sesión
+            while s.uploads and s.size + total > self.session_max:
+                _, (gone, f) = s.uploads.popitem(last=False)
+                s.size -= gone.size
+                f.close()
+                count("upload_evicted")
+            handle = UploadHandle(session, digest, name, total, kind)
+            s.uploads[digest] = (handle, spool)
+            s.size += total
+        count("upload_bytes", total)
+        self._maybe_sweep()
+        return handle
+
+    def has(self, handle: Optional[UploadHandle]) -> bool:
+        if handle is None:
+            return False
+        with self._lock:
+            s = self._sessions.get(handle.session)
+            return s is not None and handle.digest in s.uploads
+
+    @contextmanager
+    def open(self, handle: UploadHandle) -> Iterator[BinaryIO]:
+        """
+        El archivo de la subida, desde el principio. Lanza UploadError si ya se liberó.
+        """
+        with self._lock:
+            s = self._sessions.get(handle.session)
+            entry = s.uploads.get(handle.digest) if s is not None else None
+            if entry is None:
+                raise UploadError(f"{handle.name}: la subida ya no está disponible, volver a subirla")
+            s.uploads.move_to_end(handle.digest)
+            s.seen = time.monotonic()
+        f = entry[1]
+        f.seek(0)
+        yield f
+
+    def release(self, handle: UploadHandle) -> None:
+        with self._lock:
+            s = self._sessions.get(handle.session)
+            entry = s.uploads.pop(handle.digest, None) if s is not None else None
+            if entry is not None:
+                s.size -= handle.size
+                entry[1].close()
+
+    # --- carpetas de trabajo ---
+    def workdir(self, session: str, name: str) -> str:
+        """
+        Carpeta vacía `name` de la sesión (p.ej. la salida de un lote). La anterior con el
+        mismo nombre se borra: cada sesión tiene como mucho una por nombre.
+        """
+        path = tempfile.mkdtemp(prefix=f"{name}_", dir=self.upload_dir)
+        with self._lock:
+            old = self._session(session).workdirs.get(name)
+            self._sessions[session].workdirs[name] = path
+        if old:
+            shutil.rmtree(old, ignore_errors=True)
+        return path
+
+    # --- sesiones ---
+    def _session(self, session: str) -> _Session:
+        s = self._sessions.get(session)
+        if s is None:
+            s = self._sessions[session] = _Session()
+        s.seen = time.monotonic()
+        return s
+
+    def touch(self, session: str) -> None:
+        """
+        Marca actividad de la sesión (en cada rerun) y, de paso, libera las vencidas.
+        """
+        with self._lock:
+            s = self._sessions.get(session)
+            if s is not None:
+                s.seen = time.monotonic()
+        self._maybe_sweep()
+
+    def release_session(self, session: str) -> None:
+        with self._lock:
+            s = self._sessions.pop(session, None)
+        if s is not None:
+            self._close(s)
+
+    def _close(self, s: _Session) -> None:
+        for _, f in s.uploads.values():
+            f.close()
+        s.uploads.clear()
+        s.size = 0
+        for path in s.workdirs.values():
+            shutil.rmtree(path, ignore_errors=True)
+        s.workdirs.clear()
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        if now - self._swept >= SWEEP_SECONDS:
+            self.sweep(now)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Libera las sesiones sin actividad hace más de `ttl` segundos. Devuelve cuántas.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._swept = now
+            expired = [k for k, s in self._sessions.items() if now - s.seen > self.ttl]
+            gone = [self._sessions.pop(k) for k in expired]
+        for s in gone:
+            self._close(s)
+        if gone:
+            count("sessions_expired", len(gone))
+            logger.info("sesiones liberadas por inactividad: %d", len(gone))
+        return len(gone)
+
+    def _remove_orphans(self) -> None:
+        """
+        Carpetas de trabajo de un proceso anterior (caído o reiniciado) más viejas que el TTL.
+        """
+        cutoff = time.time() - self.ttl
+        try:
+            entries = list(os.scandir(self.upload_dir))
+        except OSError:
+            return
+        for e in entries:
+            try:
+                if e.stat().st_mtime < cutoff:
+                    if e.is_dir(follow_symlinks=False):
+                        shutil.rmtree(e.path, ignore_errors=True)
+                    else:
+                        os.unlink(e.path)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for s in sessions:
+            self._close(s)
+
+    def usage(self) -> Dict[str, Any]:
+        """
+        Para el panel de performance: sesiones, subidas y bytes en memoria / en disco.
+        """
+        with self._lock:
+            sizes = [h.size for s in self._sessions.values() for h, _ in s.uploads.values()]
+            workdirs = sum(len(s.workdirs) for s in self._sessions.values())
+            sessions = len(self._sessions)
+        # el SpooledTemporaryFile pasa a disco apenas supera `spool` bytes
+        return {
+            "sessions": sessions,
+            "uploads": len(sizes),
+            "memory_mb": round(sum(n for n in sizes if n <= self.spool) / MB, 2),
+            "disk_mb": round(sum(n for n in sizes if n > self.spool) / MB, 2),
+            "workdirs": workdirs,
+        }
+
+
+class SessionReports:
+    """
+    El reporte en edición de cada sesión (uno por sesión: abrir otro PDF reemplaza al
+    anterior), con un máximo de `max_entries` entre todas. Las sesiones menos recientes
+    se descartan primero; quien lo pide de nuevo lo vuelve a armar.
+    """
+
+    def __init__(self, max_entries: int = SESSION_REPORTS):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, Tuple[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, session: str, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(session)
+            if item is None or item[0] != key:
+                return None
+            self._items.move_to_end(session)
+            return item[1]
+
+    def put(self, session: str, key: str, report: Any) -> None:
+        with self._lock:
+            self._items[session] = (key, report)
+            self._items.move_to_end(session)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                count("session_report_evicted")
+
+    def drop(self, session: str) -> None:
+        with self._lock:
+            self._items.pop(session, None)
@@ -0,0 +1,347 @@
+"""
+Historial local de resultados (SQLite): paciente, observaciones e índices por reporte.
+
+Permite tendencias y deltas entre visitas sin volver a leer ningún PDF:
+    store = ResultStore("interlab.db")
+    store.save_report(metrics, taken_at="2024-05-02")
+    store.history("PEREZ, JUAN", "LDL")                        # LDL del paciente en el tiempo
+    store.search("HbA1c", gt=6.5, since=date.today() - timedelta(days=30))
+
+Los analitos se guardan por nombre canónico (engine.analytes: 'LDL', 'HBA1C', ...)
+cuando el reporte lo resolvió; si no, por el nombre crudo normalizado.
+Las fechas van como texto ISO ('YYYY-MM-DD'), que en SQLite se ordena y compara bien.
+"""
+import json
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from engine.analytes import SYNONYMS, normalize_name
+from engine.cache import metrics_digest
+from engine.rules import sex_key
+
+DateLike = Union[date, datetime, str, None]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,          -- nombre normalizado + sexo
+    name TEXT,
+    sex TEXT
+);
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    patient_id INTEGER NOT NULL REFERENCES patients(id),
+    report_key TEXT NOT NULL UNIQUE,   -- hash del PDF o de las métricas: guardar dos veces no duplica
+    taken_at TEXT NOT NULL,
+    age INTEGER,
+    urgency TEXT,
+    red_flags INTEGER,
+    global_health INTEGER,
+    inflammation INTEGER,
+    metabolic_age INTEGER,
+    created REAL NOT NULL,
+    metrics TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS observations (
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    patient_id INTEGER NOT NULL,       -- repetidos de reports para que los índices cubran la consulta
+    taken_at TEXT NOT NULL,
+    analyte TEXT NOT NULL,
+    name TEXT NOT NULL,                -- nombre tal como vino en el PDF
+    value REAL,
+    unit TEXT,
+    ref TEXT,
+    flag TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_reports_patient_date ON reports(patient_id, taken_at);
+CREATE INDEX IF NOT EXISTS ix_reports_date ON reports(taken_at);
+CREATE INDEX IF NOT EXISTS ix_obs_patient_analyte_date ON observations(patient_id, analyte, taken_at);
+CREATE INDEX IF NOT EXISTS ix_obs_analyte_date_value ON observations(analyte, taken_at, value);
+"""
+
+INDEX_FIELDS = ("urgency", "red_flags", "global_health", "inflammation", "metabolic_age")
+SCHEMA_VERSION = 1  # 1: claves de paciente con el sexo normalizado (rules.sex_key)
+
+
+def patient_key(name: Optional[str], sex: Optional[str] = None) -> Optional[str]:
+    """
+    'PEREZ, JUAN' + 'Masculino' (o 'Hombre', 'M') -> 'perezjuan|m'. None si el reporte no
+    trae nombre. El sexo se normaliza como en las reglas (rules.sex_key); sin sexo, 'perezjuan|'.
+    """
+    n = normalize_name(name or "")
+    if not n:
+        return None
+    return f"{n}|{(sex_key(sex) or '').lower()}"
+
+
+def analyte_key(name: str) -> str:
+    """
+    Nombre a consultar -> clave guardada: 'LDL', 'ldl', 'Colesterol L D L' -> 'LDL';
+    un analito sin canónico queda normalizado ('Ácido Úrico' -> 'acidourico').
+    """
+    if name in SYNONYMS:
+        return name
+    n = normalize_name(name)
+    for canonical, fragments in SYNONYMS.items():
+        if any(f in n for f in fragments):
+            return canonical
+    return n
+
+
+def _iso(d: DateLike) -> str:
+    if d is None or d == "":
+        raise ValueError("falta la fecha (YYYY-MM-DD)")
+    if isinstance(d, datetime):
+        return d.date().isoformat()
+    if isinstance(d, date):
+        return d.isoformat()
+    # se guarda y se compara como texto ISO: "2024-5-2" o "el martes" quedarían fuera de los rangos
+    try:
+        return date.fromisoformat(d).isoformat()
+    except (TypeError, ValueError):
+        raise ValueError(f"fecha inválida: {d!r} (se espera YYYY-MM-DD)") from None
+
+
+class ResultStore:
+    """
+    Una conexión SQLite compartida (WAL) protegida con un lock: Streamlit atiende cada
+    sesión en su propio hilo. ':memory:' sirve para pruebas.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA foreign_keys=ON")
+            self._db.executescript(SCHEMA)
+            if self._db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._rekey_patients()
+                self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _rekey_patients(self) -> None:
+        """
+        Bases anteriores usaban la primera letra del sexo tal como venía ('Hombre' -> 'h',
+        'Masculino' -> 'm'): se recalculan las claves y se unen los pacientes repetidos.
+        """
+        for r in self._db.execute("SELECT id, key, name, sex FROM patients").fetchall():
+            key = patient_key(r["name"], r["sex"])
+            if key is None or key == r["key"]:
+                continue
+            other = self._db.execute("SELECT id FROM patients WHERE key = ?", (key,)).fetchone()
+            if other is None:
+                self._db.execute("UPDATE patients SET key = ? WHERE id = ?", (key, r["id"]))
+                continue
+            self._db.execute("UPDATE reports SET patient_id = ? WHERE patient_id = ?", (other["id"], r["id"]))
+            self._db.execute("UPDATE observations SET patient_id = ? WHERE patient_id = ?", (other["id"], r["id"]))
+            self._db.execute("DELETE FROM patients WHERE id = ?", (r["id"],))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _query(self, sql: str, params: Any = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(r) for r in self._db.execute(sql, params)]
+
+    # --- escritura ---
+    def save_report(
+        self,
+        metrics: Dict[str, Any],
+        taken_at: DateLike,
+        report_key: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        Guarda un reporte (métricas de engine.scores.build_metrics). Devuelve su id,
+        o None si el reporte no trae nombre de paciente (no hay con qué relacionarlo).
+        `taken_at` es la fecha de toma de la muestra (no la de hoy: historial y deltas se
+        ordenan por ella); sin fecha lanza ValueError.
+        `report_key` identifica el reporte (p.ej. el hash del PDF); por defecto el hash de
+        las métricas. Guardar otra vez la misma clave actualiza el registro (correcciones).
+        """
+        patient = metrics.get("patient") or {}
+        pkey = patient_key(patient.get("name"), patient.get("sex"))
+        if pkey is None:
+            return None
+        day = _iso(taken_at)
+        rkey = report_key or metrics_digest(metrics)
+        indices = metrics.get("indices") or {}
+        canonical = {raw: c for c, raw in (metrics.get("analyte_map") or {}).items()}
+        payload = json.dumps(metrics, ensure_ascii=False, default=str)
+
+        with self._lock, self._db:
+            row = self._db.execute("SELECT id, taken_at, metrics FROM reports WHERE report_key = ?", (rkey,)).fetchone()
+            if row is not None and row["metrics"] == payload and row["taken_at"] == day:
+                return row["id"]
+            self._db.execute(
+                "INSERT INTO patients(key, name, sex) VALUES (?, ?, ?) ON CONFLICT(key) DO NOTHING",
+                (pkey, patient.get("name"), patient.get("sex")),
+            )
+            pid = self._db.execute("SELECT id FROM patients WHERE key = ?", (pkey,)).fetchone()["id"]
+            values = (
+                pid, day, patient.get("age"), metrics.get("urgency"), metrics.get("red_flags"),
+                indices.get("global_health"), indices.get("inflammation"), indices.get("metabolic_age"),
+                time.time(), payload,
+            )
+            if row is None:
+                rid = self._db.execute(
+                    "INSERT INTO reports(patient_id, taken_at, age, urgency, red_flags, global_health,"
+                    " inflammation, metabolic_age, created, metrics, report_key)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    values + (rkey,),
+                ).lastrowid
+            else:
+                rid = row["id"]
+                self._db.execute(
+                    "UPDATE reports SET patient_id = ?, taken_at = ?, age = ?, urgency = ?, red_flags = ?,"
+                    " global_health = ?, inflammation = ?, metabolic_age = ?, created = ?, metrics = ?"
+                    " WHERE id = ?",
+                    values + (rid,),
+                )
+                self._db.execute("DELETE FROM observations WHERE report_id = ?", (rid,))
+            self._db.executemany(
+                "INSERT INTO observations(report_id, patient_id, taken_at, analyte, name, value, unit, ref, flag)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        rid, pid, day, canonical.get(a["name"]) or normalize_name(a["name"]), a["name"],
+                        a.get("value"), a.get("unit"), a.get("ref"), a.get("flag"),
+                    )
+                    for a in metrics.get("analytes") or []
+                ],
+            )
+            return rid
+
+    # --- lectura ---
+    def find_patients(self, name: str = "") -> List[Dict[str, Any]]:
+        like = f"%{normalize_name(name)}%"
+        return self._query(
+            "SELECT p.id, p.name, p.sex, COUNT(r.id) AS reports, MAX(r.taken_at) AS last_report"
+            " FROM patients p LEFT JOIN reports r ON r.patient_id = p.id"
+            " WHERE p.key LIKE ? GROUP BY p.id ORDER BY p.name",
+            (like,),
+        )
+
+    def _patient_id(self, patient: Union[int, str], sex: Optional[str] = None) -> Optional[int]:
+        if isinstance(patient, int):
+            return patient
+        rows = self._query(
+            "SELECT id FROM patients WHERE key = ? OR key LIKE ?",
+            (patient_key(patient, sex), f"{normalize_name(patient)}|%"),
+        )
+        return rows[0]["id"] if len(rows) == 1 else None
+
+    def history(self, patient: Union[int, str], analyte: str, sex: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Serie de un analito para un paciente (id o nombre), de la visita más vieja a la más nueva.
+        Un nombre que corresponde a varios pacientes (mismo nombre, distinto sexo) pide `sex`.
+        """
+        pid = self._patient_id(patient, sex)
+        if pid is None:
+            return []
+        return self._query(
+            "SELECT taken_at, value, unit, ref, flag, name, report_id FROM observations"
+            " WHERE patient_id = ? AND analyte = ? ORDER BY taken_at, report_id",
+            (pid, analyte_key(analyte)),
+        )
+
+    def index_history(self, patient: Union[int, str], sex: Optional[str] = None) -> List[Dict[str, Any]]:
+        pid = self._patient_id(patient, sex)
+        if pid is None:
+            return []
+        return self._query(
+            f"SELECT id AS report_id, taken_at, age, {', '.join(INDEX_FIELDS)} FROM reports"
+            " WHERE patient_id = ? ORDER BY taken_at, id",
+            (pid,),
+        )
+
+    def deltas(self, patient: Union[int, str], sex: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Último valor de cada analito contra el de la visita anterior.
+        """
+        pid = self._patient_id(patient, sex)
+        if pid is None:
+            return []
+        rows = self._query(
+            "SELECT analyte, name, unit, value, flag, taken_at FROM ("
+            "  SELECT *, ROW_NUMBER() OVER (PARTITION BY analyte ORDER BY taken_at DESC, report_id DESC) AS k"
+            "  FROM observations WHERE patient_id = ?"
+            ") WHERE k <= 2 ORDER BY analyte, k",
+            (pid,),
+        )
+        out: List[Dict[str, Any]] = []
+        for r in rows:
+            if out and out[-1]["analyte"] == r["analyte"]:
+                prev = out[-1]
+                prev["previous"], prev["previous_at"] = r["value"], r["taken_at"]
+                if prev["value"] is not None and r["value"] is not None:
+                    prev["delta"] = prev["value"] - r["value"]
+            else:
+                out.append({**r, "previous": None, "previous_at": None, "delta": None})
+        return out
+
+    def search(
+        self,
+        analyte: str,
+        gt: Optional[float] = None,
+        ge: Optional[float] = None,
+        lt: Optional[float] = None,
+        le: Optional[float] = None,
+        since: DateLike = None,
+        until: DateLike = None,
+        limit: int = 1000,
+    ) -> List[Dict[str, Any]]:
+        """
+        Observaciones de un analito en toda la base, p.ej. HbA1c > 6.5 del último mes.
+        Usa el índice (analyte, taken_at, value).
+        """
+        where, params = ["o.analyte = ?"], [analyte_key(analyte)]
+        for op, v in ((">", gt), (">=", ge), ("<", lt), ("<=", le)):
+            if v is not None:
+                where.append(f"o.value {op} ?")
+                params.append(v)
+        if since is not None:
+            where.append("o.taken_at >= ?")
+            params.append(_iso(since))
+        if until is not None:
+            where.append("o.taken_at <= ?")
+            params.append(_iso(until))
+        params.append(limit)
+        return self._query(
+            "SELECT p.name, p.sex, o.taken_at, o.value, o.unit, o.flag, o.report_id"
+            " FROM observations o JOIN patients p ON p.id = o.patient_id"
+            f" WHERE {' AND '.join(where)} ORDER BY o.taken_at DESC, o.value DESC LIMIT ?",
+            params,
+        )
+
+    def report_metrics(self, report_id: int) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT metrics FROM reports WHERE id = ?", (report_id,))
+        return json.loads(rows[0]["metrics"]) if rows else None
+
+    def iter_reports(self, since: DateLike = None, until: DateLike = None, page: int = 50) -> Iterator[Dict[str, Any]]:
+        """
+        Reportes completos (con métricas) por fecha de toma, de a `page` por consulta
+        (paginado por (taken_at, id)): exportar un mes no carga el mes entero en memoria
+        ni retiene el lock entre páginas.
+        """
+        last_at, last_id = (_iso(since) if since is not None else ""), 0
+        until_sql, params = ("AND r.taken_at <= ?", [_iso(until)]) if until is not None else ("", [])
+        while True:
+            rows = self._query(
+                "SELECT r.id, r.taken_at, p.name, p.sex, r.metrics"
+                " FROM reports r JOIN patients p ON p.id = r.patient_id"
+                f" WHERE (r.taken_at > ? OR (r.taken_at = ? AND r.id > ?)) {until_sql}"
+                " ORDER BY r.taken_at, r.id LIMIT ?",
+                [last_at, last_at, last_id, *params, page],
+            )
+            for r in rows:
+                r["metrics"] = json.loads(r["metrics"])
+                yield r
+            if len(rows) < page:
+                return
+            last_at, last_id = rows[-1]["taken_at"], rows[-1]["id"]
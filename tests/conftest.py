@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def lab_pdf():
+    """
+    PDF sintético del corpus del benchmark (bench.corpus), por perfil y semilla.
+    """
+    pytest.importorskip("reportlab")
+    from bench.corpus import make_pdf
+
+    cache = {}
+
+    def _make(profile="small", seed=0):
+        key = (profile, seed)
+        if key not in cache:
+            cache[key] = make_pdf(profile, seed)
+        return cache[key]
+
+    return _make
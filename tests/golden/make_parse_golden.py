@@ -0,0 +1,127 @@
+"""
+Regenera tests/golden/parse_corpus.json: la salida del parser de líneas ORIGINAL
+(engine/parse_pdf.py en la revisión `--rev`, default el primer commit) sobre el corpus
+del benchmark, más las diferencias esperadas del parser actual con su motivo.
+
+Uso (desde la raíz del repo):
+    python -m tests.golden.make_parse_golden
+"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from io import BytesIO
+from typing import Any, Dict, List, Tuple
+
+import pdfplumber
+
+from bench.corpus import make_pdf
+from engine.parse_pdf import extract_analytes
+
+OUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parse_corpus.json")
+
+# (perfil, semillas) del corpus de bench.corpus
+CORPUS: List[Tuple[str, Tuple[int, ...]]] = [
+    ("small", (0, 1, 2)),
+    ("medium", (0, 1)),
+    ("large", (0,)),
+    ("bundle", (0, 1)),
+    ("table", (0, 1)),
+    ("table2", (0, 1)),
+]
+
+# diferencias buscadas desde el parser original: (commit, motivo, condición sobre la referencia)
+KNOWN_CHANGES = [
+    ("user-013", "los rangos de referencia ignoran separadores de miles ('4 100 000 - 5 100 000')",
+     re.compile(r"\d \d{3}\b").search),
+]
+
+
+def obs_row(o: Any) -> List[Any]:
+    return [o.value, o.unit, o.ref_text, o.ref_low, o.ref_high]
+
+
+def corpus_text(profile: str, seed: int) -> str:
+    # el mismo texto que leía el parser original (read_pdf_text, todas las páginas)
+    with pdfplumber.open(BytesIO(make_pdf(profile, seed))) as pdf:
+        return "\n".join((p.extract_text() or "") for p in pdf.pages)
+
+
+def load_original(rev: str) -> Any:
+    src = subprocess.check_output(["git", "show", f"{rev}:engine/parse_pdf.py"])
+    with tempfile.NamedTemporaryFile("wb", suffix=".py", delete=False) as f:
+        f.write(src)
+    try:
+        spec = importlib.util.spec_from_file_location("parse_pdf_original", f.name)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+    finally:
+        os.unlink(f.name)
+    return mod
+
+
+def build(rev: str) -> Dict[str, Any]:
+    original = load_original(rev)
+    files: Dict[str, Any] = {}
+    changes: Dict[str, Any] = {}
+    for profile, seeds in CORPUS:
+        for seed in seeds:
+            name = f"{profile}_{seed:03d}"
+            text = corpus_text(profile, seed)
+            before = {k: obs_row(o) for k, o in original.extract_analytes(text).items()}
+            after = {k: obs_row(o) for k, o in extract_analytes(text).items()}
+            files[name] = before
+            for key in sorted(set(before) | set(after)):
+                if before.get(key) == after.get(key):
+                    continue
+                ref = (after.get(key) or before.get(key))[2]
+                why = next((c for c in KNOWN_CHANGES if c[2](ref)), None)
+                if why is None:
+                    raise SystemExit(f"{name}: {key!r} difiere del parser original sin motivo conocido:"
+                                     f" {before.get(key)} -> {after.get(key)}")
+                changes.setdefault(name, {})[key] = {"expected": after.get(key), "change": why[0], "why": why[1]}
+    return {"revision": rev, "corpus": CORPUS, "files": files, "changes": changes}
+
+
+def write_golden(golden: Dict[str, Any], f: Any) -> None:
+    """
+    JSON con un analito por línea: los diffs del golden se leen por analito.
+    """
+    def dumps(x: Any) -> str:
+        return json.dumps(x, ensure_ascii=False, sort_keys=True)
+
+    f.write("{\n")
+    f.write(f'"revision": {dumps(golden["revision"])},\n')
+    f.write(f'"corpus": {dumps(golden["corpus"])},\n')
+    for section in ("changes", "files"):
+        f.write(f'"{section}": {{\n')
+        names = sorted(golden[section])
+        for i, name in enumerate(names):
+            f.write(f"{dumps(name)}: {{\n")
+            rows = golden[section][name]
+            keys = sorted(rows)
+            f.write(",\n".join(f"  {dumps(k)}: {dumps(rows[k])}" for k in keys))
+            f.write("\n}" + ("," if i < len(names) - 1 else "") + "\n")
+        f.write("}" + ("," if section == "changes" else "") + "\n")
+    f.write("}\n")
+
+
+def main(argv: Any = None) -> None:
+    root = subprocess.check_output(["git", "rev-list", "--max-parents=0", "HEAD"], text=True).split()[0]
+    ap = argparse.ArgumentParser(description="Regenera el golden del parser de líneas")
+    ap.add_argument("--rev", default=root, help="revisión con el parser original (default: primer commit)")
+    args = ap.parse_args(argv)
+    golden = build(args.rev)
+    with open(OUT, "w", encoding="utf-8") as f:
+        write_golden(golden, f)
+    n = sum(len(v) for v in golden["files"].values())
+    print(f"{OUT}: {len(golden['files'])} archivos, {n} analitos, "
+          f"{sum(len(v) for v in golden['changes'].values())} diferencias conocidas", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
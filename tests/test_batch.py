@@ -0,0 +1,52 @@
+import io
+import os
+import zipfile
+
+from engine.batch import run_batch
+
+
+class _FlakyStore:
+    """Historial que falla al guardar un paciente puntual (p.ej. sqlite bloqueado)."""
+
+    def __init__(self, fail_name):
+        self.fail_name = fail_name
+        self.saved = []
+
+    def save_report(self, metrics, taken_at):
+        name = metrics["patient"]["name"]
+        if name == self.fail_name:
+            raise RuntimeError("database is locked")
+        self.saved.append(name)
+
+
+def _zip(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def test_stem_collisions_do_not_overwrite(tmp_path, lab_pdf):
+    src = _zip({"a/b.pdf": lab_pdf("small", 0), "a__b.pdf": lab_pdf("small", 1), "X.PDF": lab_pdf("small", 2),
+                "x.pdf": lab_pdf("small", 3)})
+    rows = run_batch(src, str(tmp_path), workers=1, export_pdf=False)
+    assert [r["status"] for r in rows] == ["ok"] * 4
+    reports = sorted(r["report"] for r in rows)
+    assert len(set(r.casefold() for r in reports)) == 4
+    for r in reports:
+        assert os.path.exists(tmp_path / r)
+
+
+def test_store_error_marks_only_that_row(tmp_path, lab_pdf):
+    src = _zip({f"p{i}.pdf": lab_pdf("small", i) for i in range(3)})
+    from engine.cache import parse_pdf_bytes
+
+    names = [parse_pdf_bytes(lab_pdf("small", i)).patient["name"] for i in range(3)]
+    store = _FlakyStore(fail_name=names[1])
+    rows = run_batch(src, str(tmp_path), workers=1, export_pdf=False, store=store, taken_at="2024-05-02")
+    status = {r["file"]: (r["status"], r["error"]) for r in rows}
+    assert status["p1.pdf"] == ("error", "RuntimeError: database is locked")
+    assert status["p0.pdf"][0] == status["p2.pdf"][0] == "ok"
+    assert sorted(store.saved) == sorted([names[0], names[2]])
@@ -0,0 +1,82 @@
+import zlib
+from io import BytesIO
+
+import pdfplumber
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import PDFStream
+from pdfminer.psparser import LIT
+
+from engine.bundle import _PdfMerger, iter_merged_pdf
+from engine.perf import Trace
+
+
+def _outline_titles(data):
+    doc = PDFDocument(PDFParser(BytesIO(data)))
+    return [title for _, title, *_ in doc.get_outlines()]
+
+
+def test_failed_report_leaves_a_named_page(lab_pdf, tmp_path):
+    good = tmp_path / "ana.pdf"
+    good.write_bytes(lab_pdf("small", 0))
+    broken = tmp_path / "roto.pdf"
+    broken.write_bytes(b"%PDF-1.7\nesto no es un pdf")
+    items = [("ana", {}, str(good)), ("roto", {}, str(broken)), ("ana_2", {}, str(good))]
+
+    with Trace("bundle") as tr:
+        data = b"".join(iter_merged_pdf(items))
+
+    assert tr.counts["bundle_errors"] == 1
+    with pdfplumber.open(BytesIO(lab_pdf("small", 0))) as pdf:
+        per_report = len(pdf.pages)
+    with pdfplumber.open(BytesIO(data)) as pdf:
+        assert len(pdf.pages) == 2 * per_report + 1
+        text = pdf.pages[per_report].extract_text()
+    assert "No se pudo incluir el reporte" in text
+    assert "roto" in text
+    assert _outline_titles(data) == ["ana", "roto (error)", "ana_2"]
+
+
+def test_decoded_stream_drops_its_filters():
+    merger = _PdfMerger()
+    flate = PDFStream({"Filter": LIT("FlateDecode"), "DecodeParms": {"Predictor": 1}}, zlib.compress(b"BT ET"))
+    flate.get_data()
+    out = merger._ser(flate, ref=lambda objid: objid)
+    assert b"/DecodeParms" not in out
+    assert out.count(b"/Filter /FlateDecode") == 1
+    body = out.split(b"\nstream\n", 1)[1].rsplit(b"\nendstream", 1)[0]
+    assert zlib.decompress(body) == b"BT ET"
+
+    # la capa Flate ya se aplicó; el JPEG queda como está, con su filtro
+    jpeg = b"\xff\xd8 datos \xff\xd9"
+    image = PDFStream({"Filter": [LIT("FlateDecode"), LIT("DCTDecode")]}, zlib.compress(jpeg))
+    image.get_data()
+    out = merger._ser(image, ref=lambda objid: objid)
+    assert b"/Filter [/DCTDecode]" in out
+    assert out.split(b"\nstream\n", 1)[1].rsplit(b"\nendstream", 1)[0] == jpeg
+
+
+class _DecodingDocument(PDFDocument):
+    # como si algo ya hubiera leído los streams (get_data) antes de copiarlos
+    def getobj(self, objid):
+        obj = super().getobj(objid)
+        if isinstance(obj, PDFStream) and obj.rawdata is not None:
+            obj.get_data()
+        return obj
+
+
+def test_merged_pdf_with_decoded_streams_reads_back(lab_pdf, tmp_path, monkeypatch):
+    import pdfminer.pdfdocument
+
+    report = tmp_path / "ana.pdf"
+    report.write_bytes(lab_pdf("small", 1))
+    with pdfplumber.open(str(report)) as pdf:
+        expected = [p.extract_text() for p in pdf.pages]
+
+    monkeypatch.setattr(pdfminer.pdfdocument, "PDFDocument", _DecodingDocument)
+    merged = b"".join(iter_merged_pdf([("ana", {}, str(report))]))
+    monkeypatch.undo()
+
+    assert b"/DecodeParms" not in merged
+    with pdfplumber.open(BytesIO(merged)) as pdf:
+        assert [p.extract_text() for p in pdf.pages] == expected
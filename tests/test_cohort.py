@@ -0,0 +1,53 @@
+import random
+
+import pandas as pd
+import pytest
+
+from engine.cohort import obs_to_long, score_cohort
+from engine.parse_pdf import Obs
+from engine.scores import build_metrics
+
+# nombres como salen de los PDF: cada uno cae en un canónico de las reglas (Ferritina en ninguno)
+NAMES = [
+    "Colesterol L D L", "Colesterol H D L", "Colesterol total", "Triglicéridos", "Hemoglobina glicosilada",
+    "Glucosa", "Creatinina", "Filtrado glomerular", "Proteína C reactiva", "Eritrosedimentación",
+    "Leucocitos", "TSH", "Ferritina",
+]
+
+
+def random_obs(rng):
+    obs = {}
+    for name in rng.sample(NAMES, rng.randint(1, len(NAMES))):
+        low = None if rng.random() < 0.4 else float(rng.randint(0, 100))
+        high = None if rng.random() < 0.4 else (low or 0) + rng.randint(0, 150)
+        value = round(rng.uniform(0, 300), rng.choice([0, 1, 2]))
+        if rng.random() < 0.2:  # justo en el borde del rango
+            value = rng.choice([v for v in (low, high) if v is not None] or [value])
+        if rng.random() < 0.1:
+            value = None
+        obs[name] = Obs(name, value, rng.choice(["mg/dL", "mg/dl", "%", "", "mmol/L"]), "", low, high)
+    return obs
+
+
+def random_patient(rng):
+    return {"age": rng.choice([None, rng.randint(18, 90)]), "sex": rng.choice(["M", "F", "Masculino", "Mujer", None])}
+
+
+def _num(v):
+    return None if v is None or pd.isna(v) else float(v)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_cohort_matches_build_metrics(seed):
+    rng = random.Random(seed)
+    reports = [(pid, random_obs(rng)) for pid in range(200)]
+    patients = {pid: random_patient(rng) for pid, _ in reports}
+
+    scored = score_cohort(obs_to_long(reports), pd.DataFrame.from_dict(patients, orient="index"))
+
+    for pid, obs in reports:
+        m = build_metrics(obs, patients[pid])
+        row = scored.loc[pid]
+        assert int(row["red_flags"]) == m["red_flags"], pid
+        for index in ("inflammation", "global_health", "metabolic_age"):
+            assert _num(row[index]) == _num(m["indices"][index]), (pid, index)
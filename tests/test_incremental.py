@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from engine import report_html
+from engine.incremental import IncrementalReport
+from engine.report_html import render_sections
+from engine.scores import build_metrics
+from tests.test_cohort import random_obs, random_patient
+
+
+def _random_edit(rng, report):
+    if rng.random() < 0.15:
+        return report.edit_patient(**rng.choice([
+            {"age": rng.choice([None, rng.randint(18, 90)])},
+            {"sex": rng.choice(["M", "F", "Hombre", None])},
+        ]))
+    name = rng.choice(list(report.obs))
+    o = report.obs[name]
+    field = rng.choice(["value", "value", "value", "unit", "ref_low", "ref_high"])
+    if field == "unit":
+        return report.edit(name, unit=rng.choice(["mg/dL", "%", "", "mmol/L"]))
+    if field == "value" and rng.random() < 0.3:  # justo en el borde del rango
+        bounds = [v for v in (o.ref_low, o.ref_high) if v is not None]
+        return report.edit(name, value=rng.choice(bounds) if bounds else None)
+    value = None if rng.random() < 0.1 else round(rng.uniform(0, 300), 1)
+    return report.edit(name, **{field: value})
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_edits_match_full_rebuild(seed, monkeypatch):
+    monkeypatch.setattr(report_html, "_now", lambda: "2024-05-02 10:00")  # el encabezado lleva la hora
+    rng = random.Random(seed)
+    for _ in range(20):
+        report = IncrementalReport(random_obs(rng), random_patient(rng))
+        for _ in range(15):
+            _random_edit(rng, report)
+            fresh = build_metrics(report.obs, report.patient, report.rules, report.population)
+            assert report.metrics == fresh
+            assert report.sections == render_sections(fresh)
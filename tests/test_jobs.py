@@ -0,0 +1,94 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from engine import jobs as jobs_mod
+from engine.jobs import Job, JobQueue
+
+
+def _finished(q, ids, n, size):
+    with q._lock:
+        for _ in range(n):
+            job = Job(id=f"j{next(ids)}", want_pdf=True, status="done")
+            job.result = {"metrics": {}, "html": "x" * size, "pdf": b"%PDF" + b"x" * size}
+            job.size = 2 * size + 4
+            q._jobs[job.id] = job
+            q._kept_bytes += job.size
+            q._evict(keep=job.id)
+
+
+def test_finished_results_capped_in_bytes():
+    q = JobQueue(workers=1, max_queued=2, keep_finished=100, keep_bytes=10_000)
+    ids = itertools.count()
+    try:
+        _finished(q, ids, 20, 1000)  # ~2 KB por trabajo
+        assert q.stats()["kept_bytes"] <= 10_000
+        assert len(q._jobs) == 4
+        assert list(q._jobs)[-1] == "j19"  # se van los más viejos
+        _finished(q, ids, 1, 50_000)  # uno solo más grande que el tope: se guarda igual
+        assert list(q._jobs) == ["j20"]
+    finally:
+        q.shutdown()
+
+
+def test_finished_count_cap():
+    q = JobQueue(workers=1, max_queued=2, keep_finished=3)
+    ids = itertools.count()
+    try:
+        _finished(q, ids, 10, 10)
+        assert list(q._jobs) == ["j7", "j8", "j9"]
+        assert q.stats()["kept_bytes"] == 3 * 24
+    finally:
+        q.shutdown()
+
+
+def test_job_finishing_out_of_order_is_kept(monkeypatch):
+    def fake_report(data, want_pdf=False, pdf_mode=None):
+        time.sleep(float(data))
+        return {"metrics": {}, "html": data.decode(), "pdf": None, "perf": {}}
+
+    monkeypatch.setattr(jobs_mod, "run_report", fake_report)
+    q = JobQueue(workers=2, max_queued=4, keep_finished=1)
+    q._pool.shutdown()
+    q._pool = ThreadPoolExecutor(max_workers=2)  # el reemplazo de run_report no viaja a otro proceso
+    try:
+        slow = q.submit(b"0.3")
+        fast = q.submit(b"0.05")  # enviado después, termina antes
+        assert q.wait(fast.id, 5) is fast and fast.status == "done"
+        slow.done.wait(5)
+        assert q.get(slow.id) is slow and slow.status == "done"  # el último en terminar no se descarta
+        assert list(q._jobs) == [slow.id]
+    finally:
+        q.shutdown()
+
+
+def test_rejected_submit_is_not_registered():
+    q = JobQueue(workers=1, max_queued=1)
+    q._q.put(None)
+    q._threads[0].join(5)  # sin despachador: la cola ya no se vacía
+    try:
+        kept = q.submit(b"x")
+        with pytest.raises(jobs_mod.QueueFull):
+            q.submit(b"y")
+        assert list(q._jobs) == [kept.id]
+    finally:
+        q.shutdown()
+
+
+def test_shutdown_with_full_queue_does_not_block(lab_pdf):
+    q = JobQueue(workers=1, max_queued=1)
+    running = q.submit(lab_pdf("large", 0))
+    deadline = time.time() + 30
+    while running.status == "queued" and time.time() < deadline:
+        time.sleep(0.01)
+    assert running.status == "running"
+    waiting = q.submit(lab_pdf("small", 0))  # la cola (1) queda llena
+
+    t = threading.Thread(target=q.shutdown)
+    t.start()
+    t.join(5)
+    assert not t.is_alive()
+    assert waiting.done.is_set() and waiting.status == "error"
@@ -0,0 +1,79 @@
+import os
+import pickle
+import tempfile
+from concurrent.futures import Future
+from io import BytesIO
+
+from engine.ocr import OcrCache, PageOcr, PdfSource, recognize_page
+
+
+class _Page:
+    width, height = 612, 792
+    images = [{"stream": None}]
+
+
+class _CapturePool:
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args):
+        self.calls.append((fn, args))
+        fut = Future()
+        fut.set_result("texto")
+        return fut
+
+
+def test_pdf_source_shared_copies_once_and_cleans_up(lab_pdf):
+    data = lab_pdf("medium", 0)
+    f = BytesIO(data)
+    f.seek(100)
+    src = PdfSource(f)
+    path = src.shared()
+    assert src.shared() == path
+    with open(path, "rb") as g:
+        assert g.read() == data
+    assert f.tell() == 100  # pdfplumber sigue leyendo el mismo archivo
+    src.close()
+    assert not os.path.exists(path)
+
+
+def test_pdf_source_local_restores_position(lab_pdf):
+    with tempfile.SpooledTemporaryFile(max_size=1024) as f:
+        f.write(lab_pdf("small", 0))
+        f.seek(42)
+        src = PdfSource(f)
+        with src.local() as local:
+            assert local is f and f.tell() == 0
+            f.read(500)
+        assert f.tell() == 42
+        src.close()
+
+
+def test_pdf_source_path_is_passed_through(tmp_path, lab_pdf):
+    path = str(tmp_path / "r.pdf")
+    with open(path, "wb") as f:
+        f.write(lab_pdf("small", 0))
+    src = PdfSource(path)
+    assert src.shared() == path
+    with src.local() as local:
+        assert local == path
+    src.close()
+    assert os.path.exists(path)
+
+
+def test_ocr_workers_get_a_path_not_the_pdf(lab_pdf):
+    ocr = PageOcr(workers=2, cache=OcrCache(disk_dir=None))
+    pool = _CapturePool()
+    ocr._executor = lambda: pool
+    src = PdfSource(BytesIO(lab_pdf("large", 0)))
+    try:
+        for i in range(3):
+            page = _Page()
+            page.width += i  # otro hash: no sale del cache
+            assert ocr.submit(src, i, page).result() == "texto"
+        assert [fn for fn, _ in pool.calls] == [recognize_page] * 3
+        paths = {args[0] for _, args in pool.calls}
+        assert paths == {src.shared()}
+        assert max(len(pickle.dumps(args)) for _, args in pool.calls) < 1024
+    finally:
+        src.close()
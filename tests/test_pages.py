@@ -0,0 +1,57 @@
+import io
+import tempfile
+
+from engine.cache import parse_pdf_bytes
+from engine.pages import triage_pages
+from engine.parse_pdf import extract_streaming
+
+
+class _ReadLog:
+    """Archivo de solo lectura que registra el tamaño de cada lectura."""
+
+    def __init__(self, data):
+        self._f = io.BytesIO(data)
+        self.reads = []
+
+    def read(self, n=-1):
+        b = self._f.read(n)
+        self.reads.append(len(b))
+        return b
+
+    def readinto(self, buf):
+        n = self._f.readinto(buf)
+        self.reads.append(n)
+        return n
+
+    def seek(self, *args):
+        return self._f.seek(*args)
+
+    def tell(self):
+        return self._f.tell()
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+
+def test_triage_from_open_file_matches_path(tmp_path, lab_pdf):
+    data = lab_pdf("bundle", 0)
+    path = tmp_path / "bundle.pdf"
+    path.write_bytes(data)
+    with tempfile.SpooledTemporaryFile(max_size=1024) as f:
+        f.write(data)
+        f.seek(0)
+        keep = triage_pages(f)
+    assert keep == triage_pages(str(path))
+    assert keep is not None and 0 < sum(keep) < len(keep)
+
+
+def test_upload_is_never_read_whole(lab_pdf):
+    data = lab_pdf("bundle", 1)
+    f = _ReadLog(data)
+    patient, obs = extract_streaming(f)
+    assert max(f.reads) < len(data) // 4
+    expected = parse_pdf_bytes(data)
+    assert (patient, obs) == (expected.patient, expected.obs)
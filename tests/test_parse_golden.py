@@ -0,0 +1,46 @@
+"""
+El parser de líneas (engine.parse_pdf.LINE_FORMATS / parse_line) contra la salida del
+parser original sobre el corpus del benchmark. Regenerar con
+    python -m tests.golden.make_parse_golden
+"""
+import json
+import os
+from io import BytesIO
+
+import pytest
+
+from engine.parse_pdf import extract_analytes, read_pdf_text
+
+GOLDEN = os.path.join(os.path.dirname(__file__), "golden", "parse_corpus.json")
+
+with open(GOLDEN, encoding="utf-8") as _f:
+    _golden = json.load(_f)
+
+
+def _expected(name):
+    rows = dict(_golden["files"][name])
+    for key, change in _golden["changes"].get(name, {}).items():
+        if change["expected"] is None:
+            rows.pop(key, None)
+        else:
+            rows[key] = change["expected"]
+    return rows
+
+
+@pytest.mark.parametrize("name", sorted(_golden["files"]))
+def test_extract_analytes_matches_golden(name, lab_pdf):
+    profile, seed = name.rsplit("_", 1)
+    text = read_pdf_text(BytesIO(lab_pdf(profile, int(seed))))
+    got = {k: [o.value, o.unit, o.ref_text, o.ref_low, o.ref_high] for k, o in extract_analytes(text).items()}
+    expected = _expected(name)
+    assert sorted(got) == sorted(expected)
+    diffs = {k: (expected[k], got[k]) for k in expected if got[k] != expected[k]}
+    assert not diffs
+
+
+def test_known_changes_are_attributed():
+    # toda diferencia con el parser original tiene un request y un motivo
+    for name, changes in _golden["changes"].items():
+        for key, change in changes.items():
+            assert change["change"] and change["why"], (name, key)
+            assert key in _golden["files"][name] or change["expected"] is not None
@@ -0,0 +1,46 @@
+import threading
+import tracemalloc
+
+from engine.perf import Trace, stage
+
+
+def test_single_trace_measures_stage_peak():
+    assert not tracemalloc.is_tracing()
+    with Trace("t", trace_memory=True) as tr:
+        with stage("alloc"):
+            block = bytearray(2 * 1024 * 1024)
+            del block
+    assert not tracemalloc.is_tracing()
+    assert tr.stages["alloc"]["peak_kb"] >= 2048
+    assert tr.as_dict()["memory_shared"] is False
+
+
+def test_overlapping_traces_share_tracemalloc():
+    a_in, b_in, a_out = threading.Event(), threading.Event(), threading.Event()
+    seen = {}
+
+    def other():
+        a_in.wait(5)
+        with Trace("b", trace_memory=True) as tr:
+            b_in.set()
+            a_out.wait(5)
+            seen["tracing"] = tracemalloc.is_tracing()  # la primera ya cerró: sigue encendido
+            with stage("alloc"):
+                bytearray(1024)
+        seen["trace"] = tr
+
+    t = threading.Thread(target=other)
+    t.start()
+    with Trace("a", trace_memory=True) as a:
+        a_in.set()
+        b_in.wait(5)
+        with stage("alloc"):  # con otra Trace midiendo no se reinicia el pico
+            bytearray(1024)
+    a_out.set()
+    t.join(5)
+
+    assert seen["tracing"] is True
+    assert not tracemalloc.is_tracing()
+    assert a.memory_shared and a.stages["alloc"]["peak_kb"] is None
+    b = seen["trace"]
+    assert not b.memory_shared and b.stages["alloc"]["peak_kb"] is not None  # ya midió sola
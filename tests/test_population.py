@@ -0,0 +1,95 @@
+import json
+import os
+
+import pytest
+
+from engine import population as population_mod
+from engine.population import Population, current_population
+
+
+def _reference_data():
+    pop = Population()
+    for i in range(200):
+        pop.add("GLUCOSA", "mg/dL", "M", 45, 70 + i * 0.2)
+    return pop.to_dict()
+
+
+@pytest.fixture
+def population_file(tmp_path, monkeypatch):
+    """Referencia propia para current_population(), revisada en cada llamada."""
+    path = tmp_path / "population.json"
+    base = _reference_data()
+    path.write_text(json.dumps(base), encoding="utf-8")
+    monkeypatch.setattr(population_mod, "POPULATION_PATH", str(path))
+    monkeypatch.setattr(population_mod, "POPULATION_CHECK_SECONDS", 0)
+    monkeypatch.setattr(population_mod, "_current", None)
+    monkeypatch.setattr(population_mod, "_stamp", None)
+
+    def write(mutate):
+        data = json.loads(json.dumps(base))
+        data = mutate(data) or data
+        path.write_text(json.dumps(data), encoding="utf-8")
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))  # otro stamp aunque el tamaño coincida
+
+    return write
+
+
+def _group(data):
+    return next(iter(data["groups"].values()))
+
+
+def _set_group(key, value):
+    def mutate(data):
+        _group(data)[key] = value
+    return mutate
+
+
+BAD = [
+    ("raíz que no es objeto", lambda data: [data]),
+    ("groups que no es objeto", lambda data: data.update(groups=["GLUCOSA"])),
+    ("grupo que no es objeto", lambda data: data["groups"].update({k: 5 for k in data["groups"]})),
+    ("compression no entero", lambda data: data.update(compression=[100])),
+    ("age_edges que no es lista", lambda data: data.update(age_edges=18)),
+    ("campo faltante", lambda data: _group(data).pop("mean")),
+    ("n en null", _set_group("n", None)),
+    ("centroides que no son texto", _set_group("c", 12)),
+    ("base64 roto", _set_group("c", "no es base64!")),
+    ("centroides incompletos", _set_group("c", "AAAA")),
+]
+
+
+@pytest.mark.parametrize("mutate", [m for _, m in BAD], ids=[n for n, _ in BAD])
+def test_malformed_reload_keeps_last_good_reference(population_file, mutate):
+    good = current_population()
+    assert good is not None
+    before = good.score("GLUCOSA", "mg/dL", "M", 45, 90)
+    population_file(mutate)
+
+    assert current_population() is good
+    assert current_population().score("GLUCOSA", "mg/dL", "M", 45, 90) == before
+
+
+@pytest.mark.parametrize("mutate", [m for _, m in BAD], ids=[n for n, _ in BAD])
+def test_malformed_file_raises_value_error(mutate):
+    data = _reference_data()
+    data = mutate(data) or data
+    with pytest.raises(ValueError):
+        Population.from_dict(data)
+
+
+def test_round_trip_and_valid_reload(population_file):
+    first = current_population()
+    data = _reference_data()
+    assert Population.from_dict(data).to_dict() == data
+
+    def more(data):
+        pop = Population.from_dict(data)
+        for i in range(200):
+            pop.add("GLUCOSA", "mg/dL", "M", 45, 110 + i * 0.2)
+        return pop.to_dict()
+
+    population_file(more)
+    second = current_population()
+    assert second is not first
+    assert second.score("GLUCOSA", "mg/dL", "M", 45, 90)[0] < first.score("GLUCOSA", "mg/dL", "M", 45, 90)[0]
@@ -0,0 +1,203 @@
+"""
+AsyncReportGenerator contra un servidor stub local (base_url): streaming SSE,
+429 con Retry-After, corte a mitad del stream, concurrencia y cache.
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+
+from engine import report_llm
+from engine.report_llm import AsyncReportGenerator, iter_report_tokens
+
+TOKENS = ["Reporte ", "de ", "prueba ", "🟢"]
+METRICS = {"patient": {"name": "PEREZ, JUAN", "age": 50, "sex": "Masculino"}, "urgency": "U0"}
+
+
+class StubServer:
+    """
+    /v1/chat/completions con respuestas programadas (una por request, en orden;
+    cuando se acaban, "ok"):
+        "ok"       stream SSE con TOKENS (tarda `delay` segundos)
+        "429"      rate limit con Retry-After: `retry_after`
+        "cut"      un token y se corta la conexión a mitad del stream
+    """
+
+    def __init__(self, delay=0.0, retry_after="0"):
+        self.script = []
+        self.requests = []
+        self.delay = delay
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        self._srv = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._srv.daemon_threads = True
+        threading.Thread(target=self._srv.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._srv.server_port}/v1"
+
+    def close(self):
+        self._srv.shutdown()
+        self._srv.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.requests.append(body)
+                    action = stub.script.pop(0) if stub.script else "ok"
+                    stub.in_flight += 1
+                    stub.peak = max(stub.peak, stub.in_flight)
+                try:
+                    getattr(self, f"_{action}")(body)
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def _429(self, body):
+                payload = json.dumps({"error": {"message": "rate limited", "type": "requests"}}).encode()
+                self.send_response(429)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Retry-After", stub.retry_after)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def _event(self, body, text):
+                chunk = {
+                    "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+                }
+                self._chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+
+            def _start_stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+            def _ok(self, body):
+                self._start_stream()
+                for t in TOKENS:
+                    time.sleep(stub.delay / len(TOKENS))
+                    self._event(body, t)
+                self._chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _cut(self, body):
+                self._start_stream()
+                self._event(body, TOKENS[0])
+                self.wfile.write(b"ff\r\nincompleto")  # chunk a medias y se cierra
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+@pytest.fixture
+def stub():
+    s = StubServer()
+    yield s
+    s.close()
+
+
+def _gen(stub, **kw):
+    kw.setdefault("backoff_base", 0.01)
+    return AsyncReportGenerator("test-key", base_url=stub.base_url, **kw)
+
+
+async def _collect(gen, metrics):
+    return [t async for t in gen.stream(metrics)]
+
+
+def test_retries_429_then_succeeds(stub):
+    stub.script = ["429", "429"]
+    stub.retry_after = "0.2"
+    t0 = time.perf_counter()
+    text = asyncio.run(_gen(stub).generate(METRICS))
+    assert text == "".join(TOKENS)
+    assert len(stub.requests) == 3
+    # Retry-After manda sobre el backoff (0.01 s): dos esperas de >= 0.1 s (jitter 0.5-1.0)
+    assert time.perf_counter() - t0 >= 0.2
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.script = ["429"] * 5
+    with pytest.raises(report_llm.openai.RateLimitError):
+        asyncio.run(_gen(stub, max_retries=2).generate(METRICS))
+    assert len(stub.requests) == 3
+
+
+def test_no_retry_after_first_token(stub):
+    stub.script = ["cut"]
+    gen = _gen(stub)
+    got = []
+
+    async def run():
+        async for t in gen.stream(METRICS):
+            got.append(t)
+
+    with pytest.raises(report_llm.openai.APIConnectionError):
+        asyncio.run(run())
+    assert got == TOKENS[:1]
+    assert len(stub.requests) == 1
+    assert gen.cached(METRICS) is None  # una respuesta cortada no queda en cache
+
+
+def test_max_concurrency_cap(stub):
+    stub.delay = 0.2
+    metrics = [dict(METRICS, urgency=f"U{i}") for i in range(6)]
+    out = asyncio.run(_gen(stub, max_concurrency=2).generate_many(metrics))
+    assert out == ["".join(TOKENS)] * 6
+    assert len(stub.requests) == 6
+    assert stub.peak == 2
+
+
+def test_cache_keyed_on_prompt_version_and_model(stub, monkeypatch):
+    gen = _gen(stub)
+
+    async def run():
+        assert await gen.generate(METRICS) == "".join(TOKENS)
+        assert await gen.generate(dict(METRICS)) == "".join(TOKENS)  # mismo JSON canónico
+        assert len(stub.requests) == 1
+        gen.model = "otro-modelo"
+        await gen.generate(METRICS)
+        assert len(stub.requests) == 2
+        assert stub.requests[-1]["model"] == "otro-modelo"
+        monkeypatch.setattr(report_llm, "PROMPT_VERSION", report_llm.PROMPT_VERSION + "-test")
+        await gen.generate(METRICS)
+        assert len(stub.requests) == 3
+        await gen.aclose()
+
+    asyncio.run(run())
+
+
+def test_stream_equals_generate(stub):
+    tokens = asyncio.run(_collect(_gen(stub), METRICS))
+    assert tokens == TOKENS
+    assert asyncio.run(_gen(stub).generate(METRICS)) == "".join(tokens)
+    # versión sincrónica (st.write_stream) sobre el loop de fondo
+    assert list(iter_report_tokens(_gen(stub), METRICS)) == TOKENS
+    assert len(stub.requests) == 3
+    assert stub.requests[0]["stream"] is True
+    assert stub.requests[0]["messages"][1]["content"] == report_llm.build_user_prompt(METRICS)
@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+
+from engine import rules as rules_mod
+from engine.rules import RuleError, compile_rules, current_rules, load_rules
+from engine.scores import build_metrics
+
+DEFAULT = rules_mod.RULES_PATH
+
+
+@pytest.fixture
+def rules_file(tmp_path, monkeypatch):
+    """Archivo de reglas propio para current_rules(), revisado en cada llamada."""
+    path = tmp_path / "rules.json"
+    with open(DEFAULT, encoding="utf-8") as f:
+        base = json.load(f)
+    path.write_text(json.dumps(base), encoding="utf-8")
+    monkeypatch.setattr(rules_mod, "RULES_PATH", str(path))
+    monkeypatch.setattr(rules_mod, "RULES_CHECK_SECONDS", 0)
+    monkeypatch.setattr(rules_mod, "_current", None)
+    monkeypatch.setattr(rules_mod, "_stamp", None)
+
+    def write(mutate):
+        data = json.loads(json.dumps(base))
+        mutate(data)
+        path.write_text(json.dumps(data), encoding="utf-8")
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))  # otro stamp aunque el tamaño coincida
+
+    return write
+
+
+def _set(*keys, value):
+    def mutate(data):
+        d = data
+        for k in keys[:-1]:
+            d = d.setdefault(k, {})
+        d[keys[-1]] = value
+    return mutate
+
+
+BAD = [
+    ("urgency no entero", _set("urgency", "red_U3", value="x")),
+    ("rango que no es objeto", _set("ranges", "GLUCOSA", value=[5])),
+    ("sección que no es objeto", _set("indices", "inflammation", value=[1, 2])),
+    ("ranges que no es objeto", _set("ranges", value=["GLUCOSA"])),
+    ("unidades que no son lista", _set("ranges", "GLUCOSA", value=[{"units": "mg/dL", "high": 100}])),
+    ("número en null", _set("indices", "global_health", "base", value=None)),
+    ("escalera con texto", _set("indices", "metabolic_age", "ladders", value=[{"analyte": "LDL", "cuts": ["a"], "points": [1, 2]}])),
+    ("término que no es objeto", _set("indices", "inflammation", "terms", value=["PCR"])),
+]
+
+
+@pytest.mark.parametrize("mutate", [m for _, m in BAD], ids=[n for n, _ in BAD])
+def test_malformed_reload_keeps_last_good_rules(rules_file, mutate):
+    good = current_rules()
+    before = build_metrics({}, {"age": 50, "sex": "M"})
+    rules_file(mutate)
+    assert current_rules() is good
+    assert build_metrics({}, {"age": 50, "sex": "M"}) == before
+    with pytest.raises(RuleError):
+        load_rules(rules_mod.RULES_PATH)
+
+
+def test_valid_reload_replaces_rules(rules_file):
+    good = current_rules()
+    rules_file(_set("urgency", "red_U3", value=5))
+    assert current_rules() is not good
+    assert current_rules().urgency[0] == 5
+
+
+def test_compile_rules_rejects_wrong_types():
+    with pytest.raises(RuleError, match="urgency.red_U2"):
+        compile_rules({"urgency": {"red_U2": 1.5}})
+    with pytest.raises(RuleError, match=r"ranges.LDL\[0\]"):
+        compile_rules({"ranges": {"LDL": [None]}})
+    assert compile_rules({"urgency": {"red_U3": 4.0}}).urgency == (4, 1, 1)
@@ -0,0 +1,79 @@
+import io
+import os
+import time
+
+import pytest
+
+from engine.cache import ParseCache, pdf_digest
+from engine.sessions import SessionReports, UploadError, UploadManager
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    m = UploadManager(upload_dir=str(tmp_path), session_max_mb=1, spool_mb=0.1, ttl=1000)
+    yield m
+    m.close()
+
+
+def _pdf(size, fill=b"x"):
+    return io.BytesIO(b"%PDF" + fill * size)
+
+
+def test_put_hashes_dedupes_and_parses_from_handle(uploads, lab_pdf):
+    data = lab_pdf("small", 0)
+    h = uploads.put("s1", io.BytesIO(data), "a.pdf")
+    assert h.digest == pdf_digest(data) and h.size == len(data)
+    assert uploads.put("s1", io.BytesIO(data), "a.pdf") == h
+    assert uploads.usage()["uploads"] == 1
+    with uploads.open(h) as f:
+        parsed = ParseCache(max_entries=4).parse_file(f, h.digest)
+    assert parsed == ParseCache(max_entries=4).parse(data)
+
+
+@pytest.mark.parametrize("data, kind, size", [
+    (b"hola", "pdf", None),
+    (b"%PDF" + b"x" * (2 * 1024 * 1024), "pdf", None),
+    (b"%PDF", "pdf", 5 * 1024 * 1024),  # tamaño declarado: se rechaza sin copiar
+    (b"", "pdf", None),
+    (b"%PDF-1.4", "zip", None),
+])
+def test_rejected_uploads(uploads, data, kind, size):
+    with pytest.raises(UploadError):
+        uploads.put("s1", io.BytesIO(data), "x", kind, size=size)
+    assert uploads.usage()["uploads"] == 0
+
+
+def test_session_limit_evicts_oldest(uploads):
+    handles = [uploads.put("s1", _pdf(400 * 1024, bytes([65 + i])), f"{i}.pdf") for i in range(4)]
+    assert [uploads.has(h) for h in handles] == [False, False, True, True]
+    with pytest.raises(UploadError):
+        with uploads.open(handles[0]):
+            pass
+
+
+def test_sweep_releases_idle_sessions_and_workdirs(uploads):
+    h = uploads.put("s1", _pdf(1000), "a.pdf")
+    first = uploads.workdir("s1", "batch")
+    second = uploads.workdir("s1", "batch")
+    assert not os.path.exists(first) and os.path.isdir(second)
+    assert uploads.sweep(time.monotonic() + 2000) == 1
+    assert not uploads.has(h) and not os.path.exists(second)
+    assert uploads.usage()["sessions"] == 0
+
+
+def test_large_uploads_spill_to_disk(uploads):
+    for i in range(50):
+        uploads.put(f"s{i}", _pdf(200 * 1024, os.urandom(1)), "a.pdf")
+    usage = uploads.usage()
+    assert usage["sessions"] == 50 and usage["memory_mb"] == 0 and usage["disk_mb"] > 9
+
+
+def test_session_reports_lru():
+    r = SessionReports(max_entries=2)
+    r.put("a", "k", 1)
+    r.put("b", "k", 2)
+    r.put("c", "k", 3)
+    assert r.get("a", "k") is None
+    assert r.get("c", "k") == 3 and r.get("c", "otro") is None
+    r.put("c", "otro", 4)  # un reporte por sesión
+    assert r.get("c", "k") is None and len(r) == 2
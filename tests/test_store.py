@@ -0,0 +1,91 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+from engine.store import ResultStore, patient_key
+
+
+def _metrics(name, sex, ldl):
+    return {
+        "patient": {"name": name, "age": 50, "sex": sex},
+        "urgency": "U0",
+        "red_flags": 0,
+        "indices": {"global_health": 80, "inflammation": 10, "metabolic_age": 50},
+        "analyte_map": {"LDL": "Colesterol L D L"},
+        "analytes": [{"name": "Colesterol L D L", "value": ldl, "unit": "mg/dl", "ref": "< 130", "flag": "ok"}],
+    }
+
+
+def test_patient_key_normalizes_sex():
+    assert patient_key("PEREZ, JUAN", "Masculino") == patient_key("Perez Juan", "Hombre") == "perezjuan|m"
+    assert patient_key("GOMEZ, ANA", "Mujer") == patient_key("GOMEZ, ANA", "F") == "gomezana|f"
+    assert patient_key("GOMEZ, ANA", None) == "gomezana|"
+    assert patient_key("", "M") is None
+
+
+def test_same_patient_across_sex_spellings():
+    store = ResultStore(":memory:")
+    store.save_report(_metrics("PEREZ, JUAN", "Masculino", 150), "2024-01-10")
+    store.save_report(_metrics("PEREZ, JUAN", "Hombre", 120), "2024-03-10")
+    assert len(store.find_patients("perez")) == 1
+    assert [r["value"] for r in store.history("PEREZ, JUAN", "LDL")] == [150, 120]
+
+
+def test_save_requires_sample_date():
+    store = ResultStore(":memory:")
+    with pytest.raises(ValueError):
+        store.save_report(_metrics("PEREZ, JUAN", "M", 150), None)
+
+
+@pytest.mark.parametrize("bad", ["2024-5-2", "next tuesday", "2024-02-30", 20240502])
+def test_save_rejects_non_iso_dates(bad):
+    store = ResultStore(":memory:")
+    with pytest.raises(ValueError):
+        store.save_report(_metrics("PEREZ, JUAN", "M", 150), bad)
+    with pytest.raises(ValueError):
+        list(store.iter_reports(since=bad))
+
+
+def test_iter_reports_range_with_dates():
+    store = ResultStore(":memory:")
+    store.save_report(_metrics("PEREZ, JUAN", "M", 150), date(2024, 5, 2))
+    store.save_report(_metrics("GOMEZ, ANA", "F", 120), "2024-06-01")
+    assert [r["taken_at"] for r in store.iter_reports("2024-05-01", date(2024, 5, 31))] == ["2024-05-02"]
+
+
+def test_history_ordered_by_sample_date_not_save_order():
+    store = ResultStore(":memory:")
+    store.save_report(_metrics("PEREZ, JUAN", "M", 120), "2024-03-10")
+    store.save_report(_metrics("PEREZ, JUAN", "M", 150), "2024-01-10")  # se carga después una toma anterior
+    assert [r["taken_at"] for r in store.history("PEREZ, JUAN", "LDL")] == ["2024-01-10", "2024-03-10"]
+    (d,) = store.deltas("PEREZ, JUAN")
+    assert (d["value"], d["previous"], d["delta"]) == (120, 150, -30)
+
+
+def test_old_patient_keys_are_merged_on_open(tmp_path):
+    path = str(tmp_path / "h.db")
+    store = ResultStore(path)
+    store.save_report(_metrics("PEREZ, JUAN", "Masculino", 150), "2024-01-10")
+    store.close()
+    # base de la versión anterior: otro paciente con la clave 'h' de 'Hombre'
+    db = sqlite3.connect(path)
+    with db:
+        db.execute("PRAGMA user_version = 0")
+        db.execute("INSERT INTO patients(key, name, sex) VALUES ('perezjuan|h', 'PEREZ, JUAN', 'Hombre')")
+        pid = db.execute("SELECT id FROM patients WHERE key = 'perezjuan|h'").fetchone()[0]
+        db.execute(
+            "INSERT INTO reports(patient_id, report_key, taken_at, created, metrics) VALUES (?, 'old', '2024-03-10', 0, '{}')",
+            (pid,),
+        )
+        rid = db.execute("SELECT id FROM reports WHERE report_key = 'old'").fetchone()[0]
+        db.execute(
+            "INSERT INTO observations(report_id, patient_id, taken_at, analyte, name, value)"
+            " VALUES (?, ?, '2024-03-10', 'LDL', 'Colesterol L D L', 120)",
+            (rid, pid),
+        )
+    db.close()
+
+    store = ResultStore(path)
+    assert len(store.find_patients("perez")) == 1
+    assert [r["value"] for r in store.history("PEREZ, JUAN", "LDL")] == [150, 120]